@@ -1,6 +1,8 @@
+import multiprocessing
 from src import Main
 from src.schema import NycuOsccSchema, VghtcOsccSchema
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # for the process pool of the frozen app
     Main().main(schema=NycuOsccSchema)
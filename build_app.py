@@ -95,11 +95,13 @@ class BuildApp:
         class_name = self.SCHEMA_ARG_TO_CLASS_NAME[self.schema_arg]
         with open(self.entrypoint_py, 'w') as f:
             f.write(f'''\
+import multiprocessing
 from src import Main
 from src.schema import {class_name}
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # for the process pool of the frozen app
     Main().main(schema={class_name})
 ''')
 
@@ -1,10 +1,6 @@
 import sys
 from typing import Type
-from PyQt5.QtWidgets import QApplication
-from .view import View
-from .model import Model
 from .schema import Schema
-from .controller import Controller
 
 
 VERSION = 'v1.7.4-beta.1'
@@ -15,6 +11,7 @@ class Main:
     schema: Type[Schema]
 
     def main(self, schema: Type[Schema]):
+        from PyQt5.QtWidgets import QApplication  # imported here so the headless src.cli never loads PyQt5
         self.schema = schema
         app = QApplication(sys.argv)
         self.print_starting_message()
@@ -39,6 +36,9 @@ Yu-Cheng Lin, DDS, MS, PhD (ylin@nycu.edu.tw)'''
             print(e, flush=True)
 
     def run_app(self):
+        from .view import View
+        from .model import Model
+        from .controller import Controller
         m = Model(schema=self.schema)
         v = View(model=m)
         Controller(model=m, view=v)
@@ -0,0 +1,98 @@
+"""
+Writing the files of a cBioPortal study through one buffered UTF-8 handle per file,
+    and swapping in the whole study directory only after it's completely written.
+"""
+import os
+import glob
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+
+BUFFER_SIZE = 2 ** 20
+
+
+@contextmanager
+def open_for_writing(path: str, atomic: bool = False) -> Iterator[TextIO]:
+    """
+    atomic: written to a temp file next to the path, which replaces the path only if all writes succeed,
+        so a failure never leaves a half-written file behind
+    """
+    target = f'{path}.tmp' if atomic else path
+    try:
+        with open(target, 'w', encoding='utf-8', buffering=BUFFER_SIZE) as fh:
+            yield fh
+        if atomic:
+            os.replace(target, path)
+    except BaseException:
+        if atomic and os.path.exists(target):
+            os.remove(target)
+        raise
+
+
+@contextmanager
+def staging_directory(outdir: str, seed: bool = False) -> Iterator[str]:
+    """
+    Yields a hidden staging directory next to the outdir, which is swapped in for the outdir only if the block succeeds,
+        otherwise it's removed, and the previous outdir is never touched
+    seed: the staging directory starts with hard links to the files of the outdir, e.g. for an incremental export,
+        so writers must remove these files before writing them, to leave the previous outdir intact
+    """
+    outdir = os.path.normpath(outdir)
+    parent, name = os.path.split(outdir)
+    parent = parent or '.'
+    os.makedirs(parent, exist_ok=True)
+    recover(outdir=outdir)
+
+    staging_dir = tempfile.mkdtemp(prefix=f'.{name}.staging-', dir=parent)
+    try:
+        if seed and os.path.isdir(outdir):
+            link_tree(src=outdir, dst=staging_dir)
+        yield staging_dir
+        swap(staging_dir=staging_dir, outdir=outdir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+
+def recover(outdir: str):
+    """
+    Removes the staging directories left by a crash,
+        and puts back the previous outdir if the crash was in the middle of a swap
+    """
+    parent, name = os.path.split(outdir)
+    for path in sorted(glob.glob(os.path.join(parent or '.', f'.{name}.staging-*'))):
+        if path.endswith('-previous') and not os.path.exists(outdir):
+            os.rename(path, outdir)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def link_tree(src: str, dst: str):
+    for dirpath, _, filenames in os.walk(src):
+        target_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target_dir, exist_ok=True)
+        for f in filenames:
+            try:
+                os.link(os.path.join(dirpath, f), os.path.join(target_dir, f))
+            except OSError:  # e.g. the file system doesn't support hard links
+                shutil.copy2(os.path.join(dirpath, f), os.path.join(target_dir, f))
+
+
+def swap(staging_dir: str, outdir: str):
+    """
+    Two renames in the same parent directory, and the previous outdir is renamed back if the second one fails
+    """
+    if not os.path.exists(outdir):
+        os.rename(staging_dir, outdir)
+        return
+
+    previous = f'{staging_dir}-previous'
+    os.rename(outdir, previous)
+    try:
+        os.rename(staging_dir, outdir)
+    except BaseException:
+        os.rename(previous, outdir)
+        raise
+    shutil.rmtree(previous, ignore_errors=True)
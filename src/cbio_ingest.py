@@ -6,11 +6,14 @@ Most of the classes dynamically depend on the `self.schema` object, which contai
 import json
 import os.path
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from .schema import BaseModel
 from .cbio_constant import STUDY_IDENTIFIER_KEY, SAMPLE_ID
-from .cbio_write_clinical_data import WriteClinicalData
+from .cbio_write_clinical_data import WriteClinicalData, WritePatientData, WriteSampleData
 from .cbio_write_mutation_data import WriteMutationData
+from .cbio_manifest import ExportManifest, get_digest
+from .maf_cache import MafCache, Fingerprint, get_fingerprint
+from .progress import Progress
 from .cbio_preprocess_normalize import PreprocessNormalize
 
 
@@ -21,9 +24,15 @@ class cBioIngest(BaseModel):
     study_info_dict: Dict[str, str]
     tags_dict: Optional[Dict[str, str]]
     outdir: str
+    maf_workers: int
+    maf_cache: Optional[MafCache]
+    incremental: bool
+    progress: Progress
 
+    manifest: ExportManifest
     patient_df: pd.DataFrame
     sample_df: pd.DataFrame
+    maf_fingerprints: Optional[List[Fingerprint]]
 
     def main(
             self,
@@ -31,51 +40,145 @@ class cBioIngest(BaseModel):
             maf_dir: str,
             study_info_dict: Dict[str, str],
             tags_dict: Optional[Dict[str, str]],
-            outdir: str):
+            outdir: str,
+            maf_workers: int = 1,
+            maf_cache: Optional[MafCache] = None,
+            incremental: bool = False,
+            progress: Optional[Progress] = None):
+        """
+        incremental: only rewrite the outputs whose inputs changed since the last export to the outdir
+        progress: reports each stage, and aborts the export with Cancelled once cancelled
+        """
 
         self.clinical_data_df = clinical_data_df
         self.maf_dir = maf_dir
         self.study_info_dict = study_info_dict
         self.tags_dict = tags_dict
         self.outdir = outdir
+        self.maf_workers = maf_workers
+        self.maf_cache = maf_cache
+        self.incremental = incremental
+        self.progress = Progress() if progress is None else progress
+        self.maf_fingerprints = None
 
+        self.set_manifest()
         self.write_study_info()
         self.preprocess_normalize()
         self.write_clinical_data()
         self.write_mutation_data()
         self.create_case_lists()
 
+    def set_manifest(self):
+        self.manifest = ExportManifest(outdir=self.outdir)
+        if not self.incremental:
+            self.manifest.clear()  # a full export doesn't track its inputs
+
+    def run_step(
+            self,
+            step: str,
+            inputs: Callable[[], List[Any]],
+            files: List[str],
+            write: Callable[[], None]):
+        """
+        inputs: called only in the incremental mode, e.g. fingerprinting MAFs is not free
+        """
+        self.progress.check()
+        if not self.incremental:
+            write()
+            return
+
+        digest = get_digest(*inputs())
+        if self.manifest.is_up_to_date(step=step, digest=digest):
+            print(f'Skipping unchanged {step}', flush=True)
+            return
+        self.manifest.invalidate(step=step, files=files)
+        write()
+        self.manifest.update(step=step, digest=digest, files=files)
+
     def write_study_info(self):
-        WriteStudyInfo().main(
-            study_info_dict=self.study_info_dict,
-            tags_dict=self.tags_dict,
-            outdir=self.outdir)
+        self.run_step(
+            step='study_info',
+            inputs=lambda: [self.study_info_dict, self.tags_dict],
+            files=[WriteStudyInfo.META_STUDY_TXT_FILENAME, WriteStudyInfo.TAGS_JSON_FILENAME],
+            write=lambda: WriteStudyInfo().main(
+                study_info_dict=self.study_info_dict,
+                tags_dict=self.tags_dict,
+                outdir=self.outdir))
 
     def preprocess_normalize(self):
         self.patient_df, self.sample_df = PreprocessNormalize(self.schema).main(
             clinical_data_df=self.clinical_data_df,
-            study_id=self.study_info_dict[STUDY_IDENTIFIER_KEY]
+            study_id=self.study_info_dict[STUDY_IDENTIFIER_KEY],
+            progress=self.progress
         )
 
     def write_clinical_data(self):
-        WriteClinicalData(self.schema).main(
-            study_info_dict=self.study_info_dict,
-            patient_df=self.patient_df,
-            sample_df=self.sample_df,
-            outdir=self.outdir)
+        self.run_step(
+            step='clinical_data',
+            inputs=lambda: [
+                self.schema.__name__,
+                self.study_info_dict[STUDY_IDENTIFIER_KEY],
+                self.patient_df,
+                self.sample_df,
+            ],
+            files=[
+                WritePatientData.META_FNAME,
+                WritePatientData.DATA_FNAME,
+                WriteSampleData.META_FNAME,
+                WriteSampleData.DATA_FNAME,
+            ],
+            write=lambda: WriteClinicalData(self.schema).main(
+                study_info_dict=self.study_info_dict,
+                patient_df=self.patient_df,
+                sample_df=self.sample_df,
+                outdir=self.outdir,
+                progress=self.progress))
 
     def write_mutation_data(self):
-        WriteMutationData().main(
-            maf_dir=self.maf_dir,
-            study_info_dict=self.study_info_dict,
-            sample_df=self.sample_df,
-            outdir=self.outdir)
+        self.run_step(
+            step='mutation_data',
+            inputs=lambda: [
+                self.study_info_dict[STUDY_IDENTIFIER_KEY],
+                self.study_info_dict['description'],
+                self.sample_df[SAMPLE_ID].tolist(),  # the file name of a MAF is its sample ID
+                self.get_maf_fingerprints(),
+            ],
+            files=[WriteMutationData.META_FNAME, WriteMutationData.DATA_FNAME],
+            write=lambda: WriteMutationData().main(
+                maf_dir=self.maf_dir,
+                study_info_dict=self.study_info_dict,
+                sample_df=self.sample_df,
+                outdir=self.outdir,
+                workers=self.maf_workers,
+                cache=self.maf_cache,
+                fingerprints=self.maf_fingerprints,  # reused by the MAF cache
+                progress=self.progress))
+
+    def get_maf_fingerprints(self) -> List[Fingerprint]:
+        """
+        Kept for writing the mutation data, so each MAF is hashed only once per export
+        """
+        sample_ids = self.sample_df[SAMPLE_ID].tolist()
+        self.progress.start(stage='Checking MAFs for changes', total=len(sample_ids))
+        self.maf_fingerprints = []
+        for i, id_ in enumerate(sample_ids):
+            self.maf_fingerprints.append(get_fingerprint(maf=f'{self.maf_dir}/{id_}.maf'))
+            self.progress.update(done=i + 1)
+        return self.maf_fingerprints
 
     def create_case_lists(self):
-        CreateCaseLists().main(
-            study_info_dict=self.study_info_dict,
-            sample_df=self.sample_df,
-            outdir=self.outdir)
+        self.run_step(
+            step='case_lists',
+            inputs=lambda: [self.study_info_dict[STUDY_IDENTIFIER_KEY], self.sample_df[SAMPLE_ID].tolist()],
+            files=[
+                f'{CreateCaseLists.CASE_DIRNAME}/{CreateCaseLists.ALL_TXT}',
+                f'{CreateCaseLists.CASE_DIRNAME}/{CreateCaseLists.SEQUENCED_TXT}',
+            ],
+            write=lambda: CreateCaseLists().main(
+                study_info_dict=self.study_info_dict,
+                sample_df=self.sample_df,
+                outdir=self.outdir,
+                progress=self.progress))
 
 
 class WriteStudyInfo:
@@ -123,6 +226,7 @@ class CreateCaseLists:
     study_info_dict: Dict[str, str]
     sample_df: pd.DataFrame
     outdir: str
+    progress: Progress
 
     case_dir: str
     sample_ids: List[str]
@@ -131,16 +235,21 @@ class CreateCaseLists:
             self,
             study_info_dict: Dict[str, str],
             sample_df: pd.DataFrame,
-            outdir: str):
+            outdir: str,
+            progress: Optional[Progress] = None):
 
         self.study_info_dict = study_info_dict
         self.sample_df = sample_df
         self.outdir = outdir
+        self.progress = Progress() if progress is None else progress
 
+        self.progress.start(stage='Writing case lists', total=2)
         self.make_case_dir()
         self.set_sample_ids()
         self.write_all_txt()
+        self.progress.update(done=1)
         self.write_sequenced_txt()
+        self.progress.update(done=2)
 
     def make_case_dir(self):
         self.case_dir = f'{self.outdir}/{self.CASE_DIRNAME}'
@@ -0,0 +1,86 @@
+"""
+Manifest of an exported study, which records the inputs behind each group of output files,
+    so that an incremental export only rewrites the outputs whose inputs changed.
+"""
+import os
+import json
+import hashlib
+import pandas as pd
+from typing import Any, Dict, List
+
+
+class ExportManifest:
+    """
+    Each step, e.g. 'mutation_data', records the digest of its inputs and the files it wrote
+    A step is up to date if the digest is the same and all of its files still exist
+    """
+
+    FILENAME = '.clinui_manifest.json'  # hidden, so it's not picked up as a study file by cBioPortal
+    VERSION = 1  # bump when any output format changes, to invalidate all steps
+
+    outdir: str
+    steps: Dict[str, Dict[str, Any]]
+
+    def __init__(self, outdir: str):
+        self.outdir = outdir
+        self.steps = {}
+
+        path = f'{self.outdir}/{self.FILENAME}'
+        try:
+            with open(path, encoding='utf-8') as fh:
+                manifest = json.load(fh)
+            if manifest.get('version') == self.VERSION:
+                self.steps = manifest['steps']
+        except (FileNotFoundError, ValueError, KeyError):  # no manifest or a broken one, i.e. nothing is up to date
+            pass
+
+    def is_up_to_date(self, step: str, digest: str) -> bool:
+        entry = self.steps.get(step)
+        if entry is None or entry['digest'] != digest:
+            return False
+        return all(os.path.exists(f'{self.outdir}/{f}') for f in entry['files'])
+
+    def invalidate(self, step: str, files: List[str]):
+        """
+        Called before a step rewrites its files, so that a failed step is never up to date
+        Files of the previous export are removed, e.g. the patient data file which is no longer written
+        """
+        self.steps.pop(step, None)
+        self.save()
+        for f in files:
+            path = f'{self.outdir}/{f}'
+            if os.path.exists(path):
+                os.remove(path)
+
+    def update(self, step: str, digest: str, files: List[str]):
+        self.steps[step] = {
+            'digest': digest,
+            'files': [f for f in files if os.path.exists(f'{self.outdir}/{f}')],
+        }
+        self.save()
+
+    def clear(self):
+        self.steps = {}
+        path = f'{self.outdir}/{self.FILENAME}'
+        if os.path.exists(path):
+            os.remove(path)
+
+    def save(self):
+        path = f'{self.outdir}/{self.FILENAME}'
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'version': self.VERSION, 'steps': self.steps}, fh, indent=4)
+        os.replace(f'{path}.tmp', path)
+
+
+def get_digest(*inputs: Any) -> str:
+    """
+    Dataframes are hashed row by row, and other inputs must be JSON serializable
+    """
+    sha256 = hashlib.sha256()
+    for input_ in inputs:
+        if isinstance(input_, pd.DataFrame):
+            sha256.update(repr(input_.columns.to_list()).encode('utf-8'))
+            sha256.update(pd.util.hash_pandas_object(input_, index=False).to_numpy().tobytes())
+        else:
+            sha256.update(json.dumps(input_, sort_keys=True, default=str).encode('utf-8'))
+    return sha256.hexdigest()
@@ -1,25 +1,37 @@
 import numpy as np
 import pandas as pd
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 from .schema import BaseModel
+from .schema_compiled import compile_schema
+from .dates import parse_date
 from .cbio_constant import SAMPLE_ID, STUDY_ID, PATIENT_ID
+from .progress import Progress
 
 
 class PreprocessNormalize(BaseModel):
 
     df: pd.DataFrame
     study_id: str
+    progress: Progress
 
     patient_df: pd.DataFrame
     sample_df: pd.DataFrame
 
-    def main(self, clinical_data_df: pd.DataFrame, study_id: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def main(
+            self,
+            clinical_data_df: pd.DataFrame,
+            study_id: str,
+            progress: Optional[Progress] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
 
         self.df = clinical_data_df
         self.study_id = study_id
+        self.progress = Progress() if progress is None else progress
 
+        self.progress.start(stage='Normalizing clinical data', total=2)
         self.drop_identifiable_information()
+        self.progress.update(done=1)
         self.normalize_patient_sample_data()
+        self.progress.update(done=2)
 
         return self.patient_df, self.sample_df
 
@@ -37,12 +49,12 @@ def delta_t(
         end: Union[pd.Timestamp, str, type(np.nan)]) -> pd.Timedelta:
 
     if type(start) is str:
-        start = pd.to_datetime(start)
+        start = parse_date(start)
     elif pd.isna(start):
         start = pd.NaT
 
     if type(end) is str:
-        end = pd.to_datetime(end)
+        end = parse_date(end)
     elif pd.isna(end):
         end = pd.NaT
 
@@ -83,7 +95,8 @@ class NormalizePatientSampleData(BaseModel):
         self.patient_df = df
 
     def extract_sample_data(self):
+        compiled = compile_schema(self.schema)
         columns = [
-            c for c in self.df.columns if c not in self.schema.CBIO_PATIENT_LEVEL_COLUMNS
+            c for c in self.df.columns if not compiled.get(c).patient_level
         ]
         self.sample_df = self.df[columns].copy()
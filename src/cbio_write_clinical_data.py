@@ -1,7 +1,11 @@
+import os
 import pandas as pd
-from typing import Dict, List
+from typing import Dict, List, Optional
 from .schema import BaseModel
+from .schema_compiled import compile_schema
 from .cbio_constant import STUDY_IDENTIFIER_KEY, PATIENT_ID
+from .cbio_file import open_for_writing
+from .progress import Progress
 
 
 class WriteClinicalData(BaseModel):
@@ -10,22 +14,28 @@ class WriteClinicalData(BaseModel):
     patient_df: pd.DataFrame
     sample_df: pd.DataFrame
     outdir: str
+    progress: Progress
 
     def main(
             self,
             study_info_dict: Dict[str, str],
             patient_df: pd.DataFrame,
             sample_df: pd.DataFrame,
-            outdir: str):
+            outdir: str,
+            progress: Optional[Progress] = None):
 
         self.study_info_dict = study_info_dict
         self.patient_df = patient_df
         self.sample_df = sample_df
         self.outdir = outdir
+        self.progress = Progress() if progress is None else progress
 
+        self.progress.start(stage='Writing clinical data', total=2)
         self.remove_empty_columns_from_patient_df()
         self.write_patient_data()
+        self.progress.update(done=1, bytes_written=self.get_bytes_written())
         self.write_sample_data()
+        self.progress.update(done=2, bytes_written=self.get_bytes_written())
 
     def remove_empty_columns_from_patient_df(self):
         self.patient_df = RemoveEmptyColumns(self.schema).main(self.patient_df)
@@ -49,6 +59,10 @@ class WriteClinicalData(BaseModel):
             study_info_dict=self.study_info_dict,
             outdir=self.outdir)
 
+    def get_bytes_written(self) -> int:
+        files = [WritePatientData.DATA_FNAME, WriteSampleData.DATA_FNAME]
+        return sum(os.path.getsize(f'{self.outdir}/{f}') for f in files if os.path.exists(f'{self.outdir}/{f}'))
+
 
 class RemoveEmptyColumns(BaseModel):
 
@@ -66,31 +80,26 @@ class RemoveEmptyColumns(BaseModel):
 class BaseWriter(BaseModel):
 
     DATA_FNAME: str
+    ATOMIC = True
 
     df: pd.DataFrame
     study_info_dict: Dict[str, str]
     outdir: str
 
-    def write_data_file_1st_2nd_lines(self):
-        line = '#' + '\t'.join(self.df.columns) + '\n'
-        with open(f'{self.outdir}/{self.DATA_FNAME}', 'w', encoding='UTF-8') as fh:
-            for _ in range(2):
-                fh.write(line)
-
-    def write_data_file_3rd_line(self):
-        datatypes = GetDataTypes(self.schema).main(
-            columns=self.df.columns.to_list()
-        )
-
-        line = '#' + '\t'.join(datatypes) + '\n'
-        with open(f'{self.outdir}/{self.DATA_FNAME}', 'a') as fh:
-            fh.write(line)
+    def write_data_file(self):
+        """
+        The 4 header lines and the table are written in one pass through one handle
+        The header lines have the original column names, and the table has the formatted ones
+        """
+        columns = self.df.columns.to_list()
+        datatypes = GetDataTypes(self.schema).main(columns=columns)
+        df = FillInMissingBooleanValues(self.schema).main(self.df)
+        df = FormatClinicalData(self.schema).main(df)
 
-    def write_data_file_4th_line(self):
-        items = ['1' for _ in self.df.columns]
-        line = '#' + '\t'.join(items) + '\n'
-        with open(f'{self.outdir}/{self.DATA_FNAME}', 'a') as fh:
-            fh.write(line)
+        with open_for_writing(f'{self.outdir}/{self.DATA_FNAME}', atomic=self.ATOMIC) as fh:
+            for items in [columns, columns, datatypes, ['1' for _ in columns]]:
+                fh.write('#' + '\t'.join(items) + '\n')
+            df.to_csv(fh, sep='\t', index=False, lineterminator='\n')
 
 
 class WritePatientData(BaseWriter):
@@ -109,9 +118,6 @@ class WritePatientData(BaseWriter):
         self.outdir = outdir
 
         self.write_meta_file()
-        self.write_data_file_1st_2nd_lines()
-        self.write_data_file_3rd_line()
-        self.write_data_file_4th_line()
         self.write_data_file()
 
     def write_meta_file(self):
@@ -124,11 +130,6 @@ data_filename: {self.DATA_FNAME}'''
         with open(f'{self.outdir}/{self.META_FNAME}', 'w') as fh:
             fh.write(text)
 
-    def write_data_file(self):
-        self.df = FillInMissingBooleanValues(self.schema).main(self.df)
-        self.df = FormatClinicalData(self.schema).main(self.df)
-        self.df.to_csv(f'{self.outdir}/{self.DATA_FNAME}', mode='a', sep='\t', index=False)
-
 
 class WriteSampleData(BaseWriter):
 
@@ -146,9 +147,6 @@ class WriteSampleData(BaseWriter):
         self.outdir = outdir
 
         self.write_meta_file()
-        self.write_data_file_1st_2nd_lines()
-        self.write_data_file_3rd_line()
-        self.write_data_file_4th_line()
         self.write_data_file()
 
     def write_meta_file(self):
@@ -161,11 +159,6 @@ data_filename: {self.DATA_FNAME}'''
         with open(f'{self.outdir}/{self.META_FNAME}', 'w') as fh:
             fh.write(text)
 
-    def write_data_file(self):
-        self.df = FillInMissingBooleanValues(self.schema).main(self.df)
-        self.df = FormatClinicalData(self.schema).main(self.df)
-        self.df.to_csv(f'{self.outdir}/{self.DATA_FNAME}', mode='a', sep='\t', index=False)
-
 
 class FillInMissingBooleanValues(BaseModel):
 
@@ -199,18 +192,8 @@ class GetDataTypes(BaseModel):
     def main(self, columns: List[str]) -> List[str]:
         self.columns = columns
 
-        self.datatypes = []
-        for c in self.columns:
-            ty = self.schema.COLUMN_ATTRIBUTES.get(c, {}).get('type', 'str')  # default is 'str'
-
-            if ty == 'bool':
-                dtype = 'BOOLEAN'
-            elif ty == 'int' or ty == 'float':
-                dtype = 'NUMBER'
-            else:
-                dtype = 'STRING'  # default
-
-            self.datatypes.append(dtype)
+        compiled = compile_schema(self.schema)
+        self.datatypes = [compiled.get(c).cbio_datatype for c in self.columns]
 
         return self.datatypes
 
@@ -241,8 +224,9 @@ class FormatClinicalData(BaseModel):
 
     def replace_boolean_with_str(self):
         # cBioPortal boolean values need to be written as 'TRUE' and 'FALSE'
+        compiled = compile_schema(self.schema)
         for c in self.df.columns:
-            datatype = self.schema.COLUMN_ATTRIBUTES.get(c, {}).get('type', 'str')  # default is 'str'
+            datatype = compiled.get(c).type
             # need to check datatype is bool, otherwise what can happen is:
             #   1.0 --> 'TRUE'
             #   0.0 --> 'FALSE'
@@ -1,6 +1,11 @@
 import os.path
 import pandas as pd
-from typing import Dict, List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Iterator, Optional
+from .maf_cache import MafCache, Fingerprint, get_fingerprint
+from .cbio_file import open_for_writing
+from .progress import Progress
 from .cbio_constant import STUDY_IDENTIFIER_KEY
 
 
@@ -8,31 +13,43 @@ class WriteMutationData:
 
     META_FNAME = 'meta_mutations_extended.txt'
     DATA_FNAME = 'data_mutations_extended.txt'
+    READ_AHEAD = 2  # MAFs read ahead per worker, which bounds the memory of the parallel mode
 
     maf_dir: str
     study_info_dict: Dict[str, str]
     sample_df: pd.DataFrame
     outdir: str
+    workers: int
+    cache: Optional[MafCache]
+    fingerprints: Optional[List[Fingerprint]]
+    progress: Progress
 
     mafs: List[str]
-    df: pd.DataFrame
 
     def main(
             self,
             maf_dir: str,
             study_info_dict: Dict[str, str],
             sample_df: pd.DataFrame,
-            outdir: str):
-
+            outdir: str,
+            workers: int = 1,
+            cache: Optional[MafCache] = None,
+            fingerprints: Optional[List[Fingerprint]] = None,
+            progress: Optional[Progress] = None):
+        """
+        fingerprints: of the MAFs in the order of the samples, if already computed, so the MAFs aren't hashed again
+        """
         self.maf_dir = maf_dir
         self.study_info_dict = study_info_dict
         self.sample_df = sample_df
         self.outdir = outdir
+        self.workers = workers
+        self.cache = cache
+        self.fingerprints = fingerprints
+        self.progress = Progress() if progress is None else progress
 
         self.write_meta_file()
         self.set_mafs()
-        self.read_first_maf()
-        self.read_the_rest_mafs()
         self.write_data_file()
 
     def write_meta_file(self):
@@ -53,16 +70,51 @@ data_filename: {self.DATA_FNAME}'''
         sample_id_column = self.sample_df.columns[2]  # First 3 columns: 'Study ID', 'Patient ID', 'Sample ID'
         self.mafs = [f'{self.maf_dir}/{id_}.maf' for id_ in self.sample_df[sample_id_column]]
 
-    def read_first_maf(self):
-        self.df = ReadAndProcessMaf().main(maf=self.mafs[0])
-
-    def read_the_rest_mafs(self):
-        for maf in self.mafs[1:]:
-            df = ReadAndProcessMaf().main(maf=maf)
-            self.df = pd.concat([self.df, df], ignore_index=True)
-
     def write_data_file(self):
-        self.df.to_csv(f'{self.outdir}/{self.DATA_FNAME}', sep='\t', index=False)
+        """
+        Each MAF is appended to the data file right after it's read, so only one MAF is in memory at a time
+        The columns of the first MAF are the header, and the columns of the rest MAFs are put in the same order
+        """
+        self.progress.start(stage='Writing mutation data', total=len(self.mafs))
+        columns = None
+        with open_for_writing(f'{self.outdir}/{self.DATA_FNAME}', atomic=True) as fh:
+            for i, df in enumerate(self.read_mafs()):
+                header = columns is None
+                if header:
+                    columns = df.columns.to_list()
+                df[columns].to_csv(fh, sep='\t', index=False, header=header, lineterminator='\n')
+                self.progress.update(done=i + 1, bytes_written=fh.tell())  # raises if cancelled
+
+    def read_mafs(self) -> Iterator[pd.DataFrame]:
+        """
+        Yields in the order of the samples, so that the parallel mode writes exactly the same file
+        """
+        fingerprints = [None] * len(self.mafs) if self.fingerprints is None else self.fingerprints
+        if self.workers <= 1:
+            for maf, fingerprint in zip(self.mafs, fingerprints):
+                yield ReadAndProcessMaf().main(maf=maf, cache=self.cache, fingerprint=fingerprint)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            try:
+                for maf, fingerprint in zip(self.mafs, fingerprints):
+                    pending.append(executor.submit(read_and_process_maf, maf, self.cache, fingerprint))
+                    if len(pending) >= self.workers * self.READ_AHEAD:
+                        yield pending.popleft().result()
+                while len(pending) > 0:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:  # e.g. an error, don't wait for the rest MAFs
+                    future.cancel()
+
+
+def read_and_process_maf(
+        maf: str, cache: Optional[MafCache], fingerprint: Optional[Fingerprint]) -> pd.DataFrame:
+    """
+    Runs in the worker process, so it must be a picklable module-level function
+    """
+    return ReadAndProcessMaf().main(maf=maf, cache=cache, fingerprint=fingerprint)
 
 
 class ReadAndProcessMaf:
@@ -120,15 +172,39 @@ class ReadAndProcessMaf:
     ]
 
     maf: str
+    cache: Optional[MafCache]
+    fingerprint: Optional[Fingerprint]
     df: pd.DataFrame
 
-    def main(self, maf: str) -> pd.DataFrame:
+    def main(
+            self,
+            maf: str,
+            cache: Optional[MafCache] = None,
+            fingerprint: Optional[Fingerprint] = None) -> pd.DataFrame:
+
         self.maf = maf
+        self.cache = cache
+        self.fingerprint = fingerprint
+
+        if self.cache is not None:
+            if self.fingerprint is None:
+                self.fingerprint = get_fingerprint(maf=self.maf)
+            df = self.cache.get(maf=self.maf, key=self.get_cache_key(), fingerprint=self.fingerprint)
+            if df is not None:
+                print(f'Reading cached {self.maf}', flush=True)
+                return df
+
         print(f'Processing {self.maf}', flush=True)
         self.read_maf()
         self.set_tumor_sample_id()
+
+        if self.cache is not None:
+            self.cache.put(maf=self.maf, key=self.get_cache_key(), fingerprint=self.fingerprint, df=self.df)
         return self.df
 
+    def get_cache_key(self) -> str:
+        return repr(self.COLUMNS)
+
     def read_maf(self):
         self.df = pd.read_csv(self.maf, sep='\t', skiprows=1, usecols=self.COLUMNS)
 
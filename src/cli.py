@@ -0,0 +1,262 @@
+"""
+Headless import -> reprocess -> export pipeline, e.g. for cron jobs, which never imports PyQt5.
+
+    python -m src.cli -i clinical_data.csv --maf-dir mafs --study-info study_info.yaml -o hnsc_nycu_2024
+"""
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .model import Model
+from .schema import NycuOsccSchema, VghtcOsccSchema
+from .progress import Progress, Report
+
+
+PROG = 'python -m src.cli'
+DESCRIPTION = 'Import clinical data tables, reprocess them and export a cBioPortal study, without the GUI'
+SCHEMAS = {
+    'nycu': NycuOsccSchema,
+    'vghtc': VghtcOsccSchema,
+}
+REQUIRED = [
+    {
+        'keys': ['-i', '--clinical-data-table'],
+        'properties': {
+            'type': str,
+            'required': True,
+            'action': 'append',
+            'help': 'path to a clinical data table (CSV or XLSX format), repeat for multiple tables',
+        }
+    },
+    {
+        'keys': ['--maf-dir'],
+        'properties': {
+            'type': str,
+            'required': True,
+            'help': 'path to the directory containing MAF files',
+        }
+    },
+    {
+        'keys': ['--study-info'],
+        'properties': {
+            'type': str,
+            'required': True,
+            'help': '''path to the study info file (JSON or YAML format), e.g.
+    cancer_study_identifier: hnsc_nycu_2024
+    type_of_cancer: hnsc
+    name: Head and Neck Squamous Cell Carcinomas (NYCU, 2024)
+    description: Whole exome sequencing of OSCC tumor/normal pairs
+    groups: PUBLIC
+    reference_genome: hg38
+    tags:  # optional, written to tags.json
+      source_data: ...''',
+        }
+    },
+    {
+        'keys': ['-o', '--outdir'],
+        'properties': {
+            'type': str,
+            'required': True,
+            'help': 'path to the output study directory',
+        }
+    },
+]
+OPTIONAL = [
+    {
+        'keys': ['-s', '--schema'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'choices': list(SCHEMAS.keys()),
+            'default': 'nycu',
+            'help': 'schema of the clinical data tables (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--sequencing-table'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'action': 'append',
+            'default': [],
+            'help': 'path to a sequencing table imported after the clinical data tables, repeat for multiple tables',
+        }
+    },
+    {
+        'keys': ['--reprocess-workers'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': Model.REPROCESS_WORKERS,
+            'help': 'number of processes to reprocess the table (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--maf-workers'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': Model.MAF_READ_WORKERS,
+            'help': 'number of processes to read MAF files (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--maf-cache-dir'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': Model.MAF_CACHE_DIR,
+            'help': 'directory of the cache of processed MAF files (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--no-maf-cache'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'do not cache processed MAF files',
+        }
+    },
+    {
+        'keys': ['--incremental'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'only rewrite the files whose inputs changed since the last export to the outdir',
+        }
+    },
+    {
+        'keys': ['--timing'],
+        'properties': {
+            'action': 'store_true',
+            'help': 'print the time spent in each step and export stage',
+        }
+    },
+    {
+        'keys': ['-h', '--help'],
+        'properties': {
+            'action': 'help',
+            'help': 'show this help message',
+        }
+    },
+]
+
+
+class EntryPoint:
+
+    parser: argparse.ArgumentParser
+    args: argparse.Namespace
+
+    timings: List[Tuple[str, float]]
+
+    def main(self, argv: Optional[List[str]] = None):
+        self.set_parser()
+        self.add_required_arguments()
+        self.add_optional_arguments()
+        self.args = self.parser.parse_args(argv)
+        self.timings = []
+        self.run()
+        if self.args.timing:
+            self.print_timings()
+
+    def set_parser(self):
+        self.parser = argparse.ArgumentParser(
+            prog=PROG,
+            description=DESCRIPTION,
+            add_help=False,
+            formatter_class=argparse.RawTextHelpFormatter)
+
+    def add_required_arguments(self):
+        group = self.parser.add_argument_group('required arguments')
+        for item in REQUIRED:
+            group.add_argument(*item['keys'], **item['properties'])
+
+    def add_optional_arguments(self):
+        group = self.parser.add_argument_group('optional arguments')
+        for item in OPTIONAL:
+            group.add_argument(*item['keys'], **item['properties'])
+
+    def run(self):
+        study_info_dict, tags_dict = read_study_info(file=self.args.study_info)
+
+        model = Model(SCHEMAS[self.args.schema])
+        model.REPROCESS_WORKERS = self.args.reprocess_workers
+        model.MAF_READ_WORKERS = self.args.maf_workers
+        model.MAF_CACHE_DIR = None if self.args.no_maf_cache else self.args.maf_cache_dir
+
+        for file in self.args.clinical_data_table:
+            self.timed(f'Import {file}', lambda: model.import_clinical_data_table(file=file))
+        for file in self.args.sequencing_table:
+            self.timed(f'Import {file}', lambda: model.import_sequencing_table(file=file))
+        self.timed('Reprocess table', lambda: model.reprocess_table())
+
+        stages = StageTimer()
+        self.timed('Export cBioPortal study', lambda: model.export_cbioportal_study(
+            maf_dir=self.args.maf_dir,
+            study_info_dict=study_info_dict,
+            tags_dict=tags_dict,
+            outdir=self.args.outdir,
+            incremental=self.args.incremental,
+            progress=Progress(callback=stages)))
+        self.timings += [(f'    {stage}', seconds) for stage, seconds in stages.get_timings()]
+
+    def timed(self, label: str, func: Callable[[], Any]):
+        start = time.perf_counter()
+        func()
+        self.timings.append((label, time.perf_counter() - start))
+
+    def print_timings(self):
+        width = max(len(label) for label, _ in self.timings)
+        for label, seconds in self.timings:
+            print(f'{label:<{width}}  {seconds:8.2f} s', flush=True)
+
+
+class StageTimer:
+    """
+    Progress callback which times the export stages
+    """
+
+    starts: Dict[str, float]
+    ends: Dict[str, float]
+
+    def __init__(self):
+        self.starts = {}
+        self.ends = {}
+
+    def __call__(self, report: Report):
+        now = time.perf_counter()
+        self.starts.setdefault(report.stage, now)
+        self.ends[report.stage] = now
+
+    def get_timings(self) -> List[Tuple[str, float]]:
+        return [(stage, self.ends[stage] - start) for stage, start in self.starts.items()]
+
+
+def read_study_info(file: str) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+    """
+    The optional 'tags' mapping is separated from the study info
+    """
+    with open(file, encoding='utf-8') as fh:
+        if file.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml  # optional, only needed for YAML files
+            except ImportError:
+                raise ImportError('PyYAML is required to read a YAML study info file, or use a JSON file instead')
+            study_info = yaml.safe_load(fh)
+        else:
+            study_info = json.load(fh)
+
+    if not isinstance(study_info, dict):
+        raise ValueError(f'Study info file "{file}" must be a mapping of keys to values')
+
+    tags = study_info.pop('tags', None)
+    study_info_dict = {str(k): str(v) for k, v in study_info.items()}
+    tags_dict = None if tags is None else {str(k): str(v) for k, v in tags.items()}
+    return study_info_dict, tags_dict
+
+
+if __name__ == '__main__':
+    try:
+        EntryPoint().main()
+    except Exception as e:  # a short message and a non-zero exit code for cron
+        print(f'ERROR: {e!r}', file=sys.stderr, flush=True)
+        sys.exit(1)
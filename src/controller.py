@@ -1,5 +1,4 @@
-import shutil
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Optional
 from .view import View
 from .model import Model
 from .cbio_constant import STUDY_IDENTIFIER_KEY
@@ -29,11 +28,15 @@ class Controller:
         self.action_edit_cell = ActionEditCell(self)
         self.action_export_cbioportal_study = ActionExportCbioportalStudy(self)
         self.action_find = ActionFind(self)
+        self.action_find_all = ActionFindAll(self)
+        self.action_filter = ActionFilter(self)
         self.action_reprocess_table = ActionReprocessTable(self)
+        self.action_reprocess_changed_rows = ActionReprocessChangedRows(self)
         self.action_undo = ActionUndo(self)
         self.action_redo = ActionRedo(self)
         self.action_control_s = ActionControlS(self)
         self.action_control_f = ActionFind(self)
+        self.action_control_shift_f = ActionFindAll(self)
         self.action_control_z = ActionUndo(self)
         self.action_control_y = ActionRedo(self)
 
@@ -74,6 +77,13 @@ class Action:
     def action(self):
         raise NotImplementedError('Action method must be implemented')
 
+    def commit(self, commit: Callable[[], None]):
+        """
+        Called on the GUI thread with the commit returned by a Model.prepare_* method run as a job
+        """
+        commit()
+        self.view.refresh_title()
+
 
 class ActionImportClinicalDataTable(Action):
 
@@ -81,8 +91,11 @@ class ActionImportClinicalDataTable(Action):
         file = self.view.file_dialog_open_table()
         if file == '':
             return
-        self.model.import_clinical_data_table(file=file)
-        self.view.refresh_table()
+        self.view.run_job(
+            label='Importing clinical data table...',
+            work=lambda progress: self.model.prepare_import_clinical_data_table(file=file),
+            done=self.commit,
+            cancellable=False)  # the file is read in one go
 
 
 class ActionImportSequencingTable(Action):
@@ -91,8 +104,11 @@ class ActionImportSequencingTable(Action):
         file = self.view.file_dialog_open_table()
         if file == '':
             return
-        self.model.import_sequencing_table(file=file)
-        self.view.refresh_table()
+        self.view.run_job(
+            label='Importing sequencing table...',
+            work=lambda progress: self.model.prepare_import_sequencing_table(file=file),
+            done=self.commit,
+            cancellable=False)
 
 
 class ActionSaveClinicalDataTable(Action):
@@ -101,8 +117,10 @@ class ActionSaveClinicalDataTable(Action):
         file = self.view.file_dialog_save_table(filename='clinical_data_table.csv')
         if file == '':
             return
-        self.model.save_clinical_data_table(file=file)
-        self.view.refresh_table()
+        self.view.run_job(
+            label='Saving clinical data table...',
+            work=lambda progress: self.model.prepare_save_clinical_data_table(file=file, progress=progress),
+            done=self.commit)
 
 
 class ActionFind(Action):
@@ -125,6 +143,43 @@ class ActionFind(Action):
         self.view.select_cell(index=index, column=column)
 
 
+class ActionFindAll(Action):
+
+    def action(self):
+        options = self.view.dialog_find_all()
+        if options is None:
+            return
+
+        columns = None
+        if options['selected_columns']:
+            columns = self.view.get_selected_columns()
+            if len(columns) == 0:
+                self.view.message_box_error(msg='Please select a column')
+                return
+
+        cells = self.model.find_all(
+            text=options['text'],
+            regex=options['regex'],
+            case=options['case'],
+            columns=columns)
+
+        if len(cells) == 0:
+            self.view.message_box_info(msg='Couldn\'t find what you were looking for')
+            return
+
+        self.view.select_cells(cells=cells)
+
+
+class ActionFilter(Action):
+
+    def action(self):
+        query = self.view.dialog_filter()
+        if query is None:
+            return
+        self.model.set_filter(query=query)
+        self.view.refresh_table()
+
+
 class ActionSort(Action):
 
     ASCENDING: bool
@@ -135,7 +190,7 @@ class ActionSort(Action):
             self.view.message_box_error(msg='Please select a column')
         elif len(columns) == 1:
             self.model.sort_dataframe(by=columns[0], ascending=self.ASCENDING)
-            self.view.refresh_table()
+            self.view.refresh_title()
         else:
             self.view.message_box_error(msg='Please select only one column')
 
@@ -158,7 +213,7 @@ class ActionDeleteSelectedRows(Action):
             return
         if self.view.message_box_yes_no(msg='Are you sure you want to delete the selected rows?'):
             self.model.drop(rows=rows)
-            self.view.refresh_table()
+            self.view.refresh_title()
 
 
 class ActionAddNewSample(Action):
@@ -172,7 +227,7 @@ class ActionAddNewSample(Action):
                 break
             try:
                 self.model.append_sample(attributes=attributes)
-                self.view.refresh_table()
+                self.view.refresh_title()
                 success = True
             except Exception as e:
                 self.view.message_box_error(msg=repr(e))
@@ -201,7 +256,7 @@ class ActionEditSample(Action):
                 break
             try:
                 self.model.update_sample(row=row, attributes=attributes)
-                self.view.refresh_table()
+                self.view.refresh_title()
                 success = True
             except Exception as e:
                 self.view.message_box_error(msg=repr(e))
@@ -228,14 +283,15 @@ class ActionEditCell(Action):
             return
 
         self.model.update_cell(row=row, column=column, value=new_value)
-        self.view.refresh_table()
+        self.view.refresh_title()
 
 
 class ActionExportCbioportalStudy(Action):
 
     maf_dir: Optional[str]
     outdir: Optional[str]
-    project_info_dict: Optional[Dict[str, str]]
+    project_info_dict: Optional[Dict[str, Any]]
+    incremental: bool
     study_info_dict: Dict[str, str]
     tags_dict: Optional[Dict[str, str]]
 
@@ -252,6 +308,7 @@ class ActionExportCbioportalStudy(Action):
         if self.outdir is None:
             return
 
+        self.set_incremental()
         self.set_study_info_dict()
         self.set_tags_dict()
         self.export_cbioportal_study()
@@ -274,6 +331,9 @@ class ActionExportCbioportalStudy(Action):
         else:
             self.outdir = f'{d}/{study_id}'
 
+    def set_incremental(self):
+        self.incremental = self.project_info_dict.pop('incremental', False)
+
     def set_study_info_dict(self):
         self.study_info_dict = self.project_info_dict.copy()
         self.study_info_dict.pop('source_data')
@@ -286,37 +346,49 @@ class ActionExportCbioportalStudy(Action):
             self.tags_dict = {'source_data': s}
 
     def export_cbioportal_study(self):
-        try:
-            self.model.export_cbioportal_study(
+        # on failure or cancellation the previous study in the outdir is left intact
+        self.view.run_job(
+            label='Exporting cBioPortal study...',
+            work=lambda progress: self.model.export_cbioportal_study(
                 maf_dir=self.maf_dir,
                 study_info_dict=self.study_info_dict,
                 tags_dict=self.tags_dict,
-                outdir=self.outdir)
-            self.view.message_box_info(msg='Export cBioPortal study complete')
-        except Exception as e:
-            shutil.rmtree(self.outdir)
-            self.view.message_box_error(msg=repr(e))
+                outdir=self.outdir,
+                incremental=self.incremental,
+                progress=progress),
+            done=lambda _: self.view.message_box_info(msg='Export cBioPortal study complete'))
 
 
 class ActionReprocessTable(Action):
 
     def action(self):
-        self.model.reprocess_table()
-        self.view.refresh_table()
+        self.view.run_job(
+            label='Reprocessing table...',
+            work=lambda progress: self.model.prepare_reprocess_table(progress=progress),
+            done=self.commit)
+
+
+class ActionReprocessChangedRows(Action):
+
+    def action(self):
+        self.view.run_job(
+            label='Reprocessing changed rows...',
+            work=lambda progress: self.model.prepare_reprocess_table(incremental=True, progress=progress),
+            done=self.commit)
 
 
 class ActionUndo(Action):
 
     def action(self):
         self.model.undo()
-        self.view.refresh_table()
+        self.view.refresh_title()
 
 
 class ActionRedo(Action):
 
     def action(self):
         self.model.redo()
-        self.view.refresh_table()
+        self.view.refresh_title()
 
 
 class ActionControlS(Action):
@@ -325,5 +397,7 @@ class ActionControlS(Action):
         file = self.view.file_dialog_save_table(filename='clinical_data_table.csv')
         if file == '':
             return
-        self.model.save_clinical_data_table(file=file)
-        self.view.refresh_table()
+        self.view.run_job(
+            label='Saving clinical data table...',
+            work=lambda progress: self.model.prepare_save_clinical_data_table(file=file, progress=progress),
+            done=self.commit)
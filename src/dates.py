@@ -0,0 +1,40 @@
+"""
+Bounded LRU caches of parsed dates, shared by casting, date lists and date differences.
+Clinical tables repeat the same dates many times, so each distinct str is parsed only once.
+"""
+import pandas as pd
+from functools import lru_cache
+from typing import Dict
+
+
+MAX_CACHED_DATES = 65536
+
+
+@lru_cache(maxsize=MAX_CACHED_DATES)
+def parse_date(val: str) -> pd.Timestamp:
+    """
+    The same as pd.to_datetime(val), e.g. '' --> NaT
+    Invalid values raise, which are not cached
+    """
+    return pd.to_datetime(val)
+
+
+@lru_cache(maxsize=MAX_CACHED_DATES)
+def format_date(val: str) -> str:
+    """
+    '2020/3/2' --> '2020-03-02'
+    """
+    return parse_date(val).strftime('%Y-%m-%d')
+
+
+def get_cache_info() -> Dict[str, Dict[str, int]]:
+    ret = {}
+    for name, func in [('parse_date', parse_date), ('format_date', format_date)]:
+        info = func.cache_info()
+        ret[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+    return ret
+
+
+def clear_cache():
+    parse_date.cache_clear()
+    format_date.cache_clear()
@@ -0,0 +1,147 @@
+"""
+On-disk cache of processed MAF frames, so that re-exporting a study doesn't re-parse unchanged MAFs.
+"""
+import io
+import os
+import sys
+import glob
+import stat
+import hashlib
+import pandas as pd
+from typing import Optional, Tuple
+
+
+Fingerprint = Tuple[int, int, str]
+
+
+class MafCache:
+    """
+    An entry is named '{path key}-{fingerprint key}.tsv', where the fingerprint is the size, mtime and content hash,
+        so an entry is valid if and only if its name matches, and a changed MAF replaces the entry of its path
+    The first line of an entry is the SHA-256 of the rest, which catches truncated or corrupted entries
+    Entries are touched when used, and the least recently used ones are evicted beyond max_bytes
+    Entries are plain TSV read back with pandas, never unpickled, and the cache directory must be private to the user,
+        as an entry planted by someone else would end up in the exported study
+    """
+
+    VERSION = 2  # bump when the processing of MAFs or the entry format changes, to invalidate all entries
+    SUFFIX = '.tsv'
+    HASH_CHUNK_SIZE = 2 ** 20
+    DEFAULT_MAX_BYTES = 2 * 2 ** 30
+
+    cache_dir: str
+    max_bytes: int
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        make_private_dir(path=self.cache_dir)
+
+    def get(self, maf: str, key: str, fingerprint: Fingerprint) -> Optional[pd.DataFrame]:
+        """
+        The key describes how the MAF was processed, e.g. the columns read
+        The fingerprint is computed once by the caller, see get_fingerprint()
+        """
+        path = self.__get_entry_path(maf=maf, key=key, fingerprint=fingerprint)
+        try:
+            with open(path, 'rb') as fh:
+                checksum, _, data = fh.read().partition(b'\n')
+            if checksum.decode('utf-8') != hashlib.sha256(data).hexdigest():
+                raise ValueError(f'Corrupted cache entry "{path}"')
+            df = pd.read_csv(io.BytesIO(data), sep='\t')
+            os.utime(path)
+            return df
+        except FileNotFoundError:
+            return None
+        except Exception:  # e.g. a truncated entry, which is re-created
+            self.__remove(path)
+            return None
+
+    def put(self, maf: str, key: str, fingerprint: Fingerprint, df: pd.DataFrame):
+        path = self.__get_entry_path(maf=maf, key=key, fingerprint=fingerprint)
+        prefix = os.path.basename(path).split('-')[0]
+        for old in glob.glob(f'{self.cache_dir}/{prefix}-*{self.SUFFIX}'):
+            self.__remove(old)  # entries of the previous versions of the MAF
+
+        temp = f'{path}.{os.getpid()}.tmp'  # unique among the worker processes
+        data = df.to_csv(sep='\t', index=False, lineterminator='\n').encode('utf-8')
+        with open(temp, 'wb') as fh:
+            fh.write(hashlib.sha256(data).hexdigest().encode('utf-8') + b'\n' + data)
+        os.replace(temp, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(f'{self.cache_dir}/*{self.SUFFIX}'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # e.g. evicted by another worker process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.__remove(path)
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(f'{self.cache_dir}/*{self.SUFFIX}'):
+            self.__remove(path)
+
+    def __get_entry_path(self, maf: str, key: str, fingerprint: Fingerprint) -> str:
+        path_key = self.__hash(os.path.abspath(maf))
+        fingerprint_key = self.__hash(repr((self.VERSION, key) + tuple(fingerprint)))
+        return f'{self.cache_dir}/{path_key}-{fingerprint_key}{self.SUFFIX}'
+
+    def __hash(self, text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+    def __remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_fingerprint(maf: str) -> Fingerprint:
+    """
+    (size, mtime in ns, SHA-256 of the content)
+    Hashing is much faster than parsing, and catches MAFs rewritten with the same size and mtime
+    """
+    stat = os.stat(maf)
+    sha256 = hashlib.sha256()
+    with open(maf, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(MafCache.HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return stat.st_size, stat.st_mtime_ns, sha256.hexdigest()
+
+
+def get_default_cache_dir() -> str:
+    """
+    In the cache home of the current user, never in the shared temp directory
+    """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'ClinUI', 'maf-cache')
+
+
+def make_private_dir(path: str):
+    """
+    Creates the directory with mode 0o700, and refuses a directory that's a symlink or owned by someone else
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.name != 'posix':  # the user profile is already private on Windows
+        return
+
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f'Cache directory "{path}" is not owned by the current user')
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        os.chmod(path, 0o700)  # e.g. created by an older version with the default mode
@@ -1,55 +1,163 @@
 import os
+import numpy as np
 import pandas as pd
-from typing import List, Optional, Dict, Any, Union, Tuple, Type
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple, Type, Callable, Mapping
 from .cbio_ingest import cBioIngest
+from .maf_cache import MafCache, get_default_cache_dir
+from .cbio_file import staging_directory
+from .progress import Progress
 from .model_nycu import CalculateNycuOscc
+from .model_nycu_batch import CalculateNycuOsccBatch
 from .model_vghtc import CalculateVghtcOscc
+from .model_event import Event, CellsUpdated, RowsAppended, RowsDropped, TableSorted
+from .model_search import SearchIndex, find_all
+from .model_filter import RowFilter, parse_filter
+from .model_history import History, Delta, CellPatch, RowInsert, RowDelete, ColumnDelete, Permutation, \
+    Snapshot, Compound, diff, diff_cells
 from .schema import BaseModel, Schema, NycuOsccSchema, VghtcOsccSchema
+from .schema_compiled import ColumnSpec, compile_schema
 
 
 class Model(BaseModel):
 
     MAX_UNDO = 100
+    CHECKPOINT_INTERVAL = 25
+    MAX_UNDO_BYTES = 1024 ** 3  # 1 GB of undo/redo history in memory
+    SPILL_UNDO_TO_DISK = True  # spill the history beyond MAX_UNDO_BYTES to temp files instead of evicting it
+    REPROCESS_WORKERS = 1  # opt-in, e.g. os.cpu_count(), to reprocess chunks of rows in a process pool
+    MAF_READ_WORKERS = 1  # opt-in, e.g. os.cpu_count(), to read MAFs in a process pool when exporting
+    MAF_CACHE_DIR: Optional[str] = get_default_cache_dir()  # None to disable
+    MAF_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB of processed MAFs, least recently used ones are evicted beyond it
+    CALCULATOR_VERSION = 1  # bump when the calculations change, so that the next reprocess recomputes all rows
 
     dataframe: pd.DataFrame
     clinical_data_file: Optional[str]
-    saved_dataframe_id: Optional[int]
+    saved_version: Optional[int]
 
-    undo_cache: List[pd.DataFrame]
-    redo_cache: List[pd.DataFrame]
+    history: History
+    listeners: List[Callable[[Event], None]]
+    search_index: SearchIndex
+    row_filter: RowFilter
+
+    dirty: np.ndarray  # rows changed since the last reprocess, all rows of a newly imported table
+    processed_signature: Optional[Tuple[str, int]]  # schema and calculator version of the last reprocess, if any
 
     def __init__(self, schema: Type[Schema]):
         super().__init__(schema=schema)
         self.dataframe = pd.DataFrame(columns=self.schema.DISPLAY_COLUMNS)
         self.clinical_data_file = None
-        self.saved_dataframe_id = id(self.dataframe)  # initial state is saved
-        self.undo_cache = []
-        self.redo_cache = []
+        self.history = History(
+            max_undo=self.MAX_UNDO,
+            checkpoint_interval=self.CHECKPOINT_INTERVAL,
+            max_bytes=self.MAX_UNDO_BYTES,
+            spill=self.SPILL_UNDO_TO_DISK)
+        self.saved_version = self.history.version  # initial state is saved
+        self.listeners = []
+        self.dirty = np.zeros(0, dtype=bool)
+        self.processed_signature = None
+        self.add_listener(self.__track_dirty_rows)
+        self.search_index = SearchIndex()
+        self.add_listener(self.__update_search_index)
+        self.row_filter = RowFilter()
+        self.add_listener(self.__update_row_filter)
+
+    def add_listener(self, listener: Callable[[Event], None]):
+        """
+        The listener is called with each change event after the dataframe is changed
+        """
+        self.listeners.append(listener)
+
+    def __emit(self, events: List[Event]):
+        for event in events:
+            for listener in self.listeners:
+                listener(event)
+
+    def __track_dirty_rows(self, event: Event):
+        """
+        Dirty flags move with the rows, e.g. when rows are sorted or dropped
+        """
+        if isinstance(event, CellsUpdated):
+            self.dirty[event.rows] = True
+        elif isinstance(event, RowsAppended):
+            self.dirty = np.concatenate([self.dirty, np.ones(event.last - event.first + 1, dtype=bool)])
+        elif isinstance(event, RowsDropped):
+            self.dirty = np.delete(self.dirty, event.rows)
+        elif isinstance(event, TableSorted):
+            self.dirty = self.dirty[event.order]
+        else:  # the whole table is replaced
+            self.dirty = np.ones(len(self.dataframe), dtype=bool)
+
+    def __update_search_index(self, event: Event):
+        self.search_index.apply_event(event=event, dataframe=self.dataframe)
+
+    def __update_row_filter(self, event: Event):
+        self.row_filter.apply_event(event=event, dataframe=self.dataframe)
+
+    def get_dirty_rows(self) -> List[int]:
+        return np.flatnonzero(self.dirty).tolist()
+
+    @property
+    def undo_cache(self) -> List[Delta]:
+        return self.history.undo_cache
+
+    @property
+    def redo_cache(self) -> List[Delta]:
+        return self.history.redo_cache
 
     def undo(self):
-        if len(self.undo_cache) == 0:
-            return
-        self.redo_cache.append(self.dataframe)
-        self.dataframe = self.undo_cache.pop()
+        df = self.history.undo(self.dataframe)
+        if df is not None:
+            self.dataframe = df
+            self.__emit(self.history.events)
 
     def redo(self):
-        if len(self.redo_cache) == 0:
-            return
-        self.undo_cache.append(self.dataframe)
-        self.dataframe = self.redo_cache.pop()
+        df = self.history.redo(self.dataframe)
+        if df is not None:
+            self.dataframe = df
+            self.__emit(self.history.events)
 
-    def __add_to_undo_cache(self):
-        self.undo_cache.append(self.dataframe)
-        if len(self.undo_cache) > self.MAX_UNDO:
-            self.undo_cache.pop(0)
-        self.redo_cache = []  # clear redo cache
+    def get_history_usage(self) -> Tuple[int, int]:
+        """
+        Bytes of the undo/redo history in memory and spilled to disk
+        """
+        return self.history.memory_usage(), self.history.disk_usage()
+
+    def __add_to_history(self, delta: Delta, new: Optional[pd.DataFrame] = None):
+        """
+        Record the delta and then move to the new dataframe
+        If the new dataframe is not given, it is obtained by applying the delta in place
+        """
+        self.history.push(delta=delta, dataframe=self.dataframe)
+        self.dataframe = delta.apply(self.dataframe) if new is None else new
+        self.__emit(delta.get_events(forward=True, nrows=len(self.dataframe)))
 
     def reset_dataframe(self):
         new = pd.DataFrame(columns=self.schema.DISPLAY_COLUMNS)
-        self.__add_to_undo_cache()  # add to undo cache after successful reset
-        self.dataframe = new
+        self.__add_to_history(Snapshot(frame=self.dataframe), new=new)  # add to history after successful reset
+
+    def __get_state(self) -> Tuple[int, pd.DataFrame]:
+        return self.history.version, self.dataframe
+
+    def __get_commit(self, state: Tuple[int, pd.DataFrame], apply: Callable[[], None]) -> Callable[[], None]:
+        """
+        Heavy operations are prepared from the state without changing the model, e.g. off the GUI thread,
+            and the returned commit applies the result, unless the table has changed since the state
+        """
+        version, dataframe = state
+
+        def commit():
+            if self.history.version != version or self.dataframe is not dataframe:
+                raise RuntimeError('The table has changed since the operation started, please try again')
+            apply()
+
+        return commit
 
     def import_clinical_data_table(self, file: str):
+        self.prepare_import_clinical_data_table(file=file)()
+
+    def prepare_import_clinical_data_table(self, file: str) -> Callable[[], None]:
+        state = self.__get_state()
         new = ImportClinicalDataTable(self.schema).main(
             clinical_data_df=self.dataframe,
             file=file)
@@ -57,24 +165,49 @@ class Model(BaseModel):
         # When the whole column is NaN, it becomes float64, convert it back to object
         new = new.astype(object)
 
-        self.__add_to_undo_cache()  # add to undo cache after successful import
-        self.dataframe = new
+        return self.__get_commit(
+            state=state,
+            apply=lambda: self.__add_to_history(self.__appended(new), new=new))  # add to history after successful import
 
     def import_sequencing_table(self, file: str):
+        self.prepare_import_sequencing_table(file=file)()
+
+    def prepare_import_sequencing_table(self, file: str) -> Callable[[], None]:
+        state = self.__get_state()
         new = ImportSequencingTable(self.schema).main(
             clinical_data_df=self.dataframe,
             file=file)
 
-        self.__add_to_undo_cache()  # add to undo cache after successful import
-        self.dataframe = new
+        return self.__get_commit(
+            state=state,
+            apply=lambda: self.__add_to_history(self.__appended(new), new=new))  # add to history after successful import
+
+    def __appended(self, new: pd.DataFrame) -> Delta:
+        """
+        The delta from the current dataframe to the new dataframe with rows appended to the end
+        """
+        n = len(self.dataframe)
+        same_columns = list(new.columns) == list(self.dataframe.columns)
+        if same_columns and len(new) >= n and new.dtypes.equals(self.dataframe.dtypes):
+            return RowInsert(rows=new.iloc[n:])
+        return Snapshot(frame=self.dataframe)  # columns or dtypes of the existing rows were changed
 
     def save_clinical_data_table(self, file: str):
-        if file.endswith('.xlsx'):
-            self.dataframe.to_excel(file, index=False)
-        else:
-            self.dataframe.to_csv(file, encoding='utf-8-sig', index=False)
-        self.clinical_data_file = file
-        self.saved_dataframe_id = id(self.dataframe)
+        self.prepare_save_clinical_data_table(file=file)()
+
+    def prepare_save_clinical_data_table(self, file: str, progress: Optional[Progress] = None) -> Callable[[], None]:
+        """
+        The commit marks the saved version, which is still right if the table has changed since
+        A cancelled save leaves the previous file intact
+        """
+        version, dataframe = self.__get_state()
+        WriteTable().main(dataframe=dataframe, file=file, progress=progress)
+
+        def commit():
+            self.clinical_data_file = file
+            self.saved_version = version
+
+        return commit
 
     def get_dataframe(self) -> pd.DataFrame:
         return self.dataframe.copy()
@@ -83,28 +216,28 @@ class Model(BaseModel):
             self,
             by: str,
             ascending: bool):
-        new = self.dataframe.sort_values(
-            by=by,
+        order = self.dataframe[by].reset_index(
+            drop=True
+        ).sort_values(
             ascending=ascending,
             kind='mergesort'  # deterministic, keep the original order when tied
-        ).reset_index(
-            drop=True
-        )
-        self.__add_to_undo_cache()  # add to undo cache after successful sort
-        self.dataframe = new
+        ).index.to_numpy()
+        self.__add_to_history(Permutation(order=order))  # add to history after successful sort
 
     def drop(
             self,
             rows: Optional[List[int]] = None,
             columns: Optional[List[str]] = None):
-        new = self.dataframe.drop(
-            index=rows,
-            columns=columns
-        ).reset_index(
-            drop=True
-        )
-        self.__add_to_undo_cache()  # add to undo cache after successful drop
-        self.dataframe = new
+        deltas = []
+        new = self.dataframe
+        if rows is not None:
+            deltas.append(RowDelete(df=new, positions=rows))
+            new = deltas[-1].apply(new)
+        if columns is not None:
+            deltas.append(ColumnDelete(df=new, columns=columns))
+            new = deltas[-1].apply(new)
+
+        self.__add_to_history(Compound(deltas=deltas), new=new)  # add to history after successful drop
 
     def get_sample(self, row: int) -> Dict[str, str]:
         """
@@ -142,12 +275,7 @@ class Model(BaseModel):
         Data type conversion is done in the model
         """
         attributes = ProcessSampleAttributes(self.schema).main(attributes=attributes)
-
-        new = self.dataframe.copy()
-        new.loc[row] = attributes
-
-        self.__add_to_undo_cache()  # add to undo cache after successful update
-        self.dataframe = new
+        self.__add_to_history(self.__row_patch(row=row, attributes=attributes))  # add to history after successful update
 
     def update_cell(self, row: int, column: str, value: str):
         """
@@ -157,75 +285,157 @@ class Model(BaseModel):
         series = self.dataframe.loc[row].fillna('')  # NaN should be ''
         attributes = series.to_dict()
         attributes[column] = value  # update the field with new value
-        attributes = ProcessSampleAttributes(self.schema).main(attributes=attributes)
-
-        new = self.dataframe.copy()
-        new.loc[row] = attributes
+        attributes = ProcessSampleAttributes(self.schema).main(attributes=attributes, changed_keys=[column])
+        columns = [c for c in self.dataframe.columns if c in attributes]  # only the cell and its derived cells
+        self.__add_to_history(self.__row_patch(row=row, attributes=attributes, columns=columns))  # add to history after successful update
 
-        self.__add_to_undo_cache()  # add to undo cache after successful update
-        self.dataframe = new
+    def __row_patch(
+            self,
+            row: int,
+            attributes: Dict[str, Any],
+            columns: Optional[List[str]] = None) -> CellPatch:
+        """
+        The patch of replacing the row (or only the given columns) with the attributes, missing attributes become NaN
+        """
+        columns = self.dataframe.columns if columns is None else columns
+        before = self.dataframe.loc[[row], columns]
+        after = pd.DataFrame([pd.Series(attributes).reindex(columns)], index=before.index)
+        cells = diff_cells(before=before, after=after)
+        cells[CellPatch.ROW] = self.dataframe.index.get_loc(row)
+        return CellPatch(cells=cells)
 
     def append_sample(self, attributes: Dict[str, str]):
         """
         Everyting comes in model should be string
         Data type conversion is done in the model
         """
-        attributes = ProcessSampleAttributes(self.schema).main(attributes=attributes)
+        self.append_samples(samples=[attributes])
+
+    def append_samples(self, samples: List[Dict[str, str]]):
+        """
+        The samples are calculated one by one, but casted and appended all together as a single undo entry
+        """
+        if len(samples) == 0:
+            return
+
+        calculated = [ProcessSampleAttributes(self.schema).calculate(attributes=a) for a in samples]
+        rows = CastTableDatatypes(self.schema).main(df=pd.DataFrame(calculated, dtype=object))
 
-        new = append(self.dataframe, pd.Series(attributes))
+        new = append_rows(self.dataframe, rows)
         new = new[self.schema.DISPLAY_COLUMNS]  # make sure the columns are displayed in correct order
 
-        self.__add_to_undo_cache()  # add to undo cache after successful append
-        self.dataframe = new
+        self.__add_to_history(self.__appended(new), new=new)  # add to history after successful append
 
-    def reprocess_table(self):
-        new = self.dataframe.copy()
+    def reprocess_table(self, incremental: bool = False):
+        self.prepare_reprocess_table(incremental=incremental)()
 
-        for row in range(len(new)):
-            attributes = self.get_sample(row=row)  # get from the current self.dataframe
-            attributes = ProcessSampleAttributes(self.schema).main(attributes=attributes)
-            new.loc[row] = attributes
+    def prepare_reprocess_table(
+            self,
+            incremental: bool = False,
+            progress: Optional[Progress] = None) -> Callable[[], None]:
+        """
+        The incremental mode only recomputes the dirty rows,
+            unless the table has never been reprocessed by this model,
+            or the schema or the calculator version has changed since the last reprocess
+        """
+        state = self.__get_state()
+        signature = (self.schema.NAME, self.CALCULATOR_VERSION)
+
+        if incremental and signature == self.processed_signature:
+            rows = np.flatnonzero(self.dirty)
+            processed = ProcessTableAttributes(self.schema).main(
+                df=self.dataframe.iloc[rows], workers=self.REPROCESS_WORKERS, rows=rows, progress=progress)
+            new = self.dataframe.astype(object)  # a copy, with the same dtype as a full reprocess
+            new.iloc[rows] = processed.to_numpy()
+        else:
+            new = ProcessTableAttributes(self.schema).main(
+                df=self.dataframe, workers=self.REPROCESS_WORKERS, progress=progress)
+        delta = diff(before=self.dataframe, after=new)
+
+        def apply():
+            self.__add_to_history(delta, new=new)  # add to history after successful reprocess
+            self.dirty = np.zeros(len(self.dataframe), dtype=bool)
+            self.processed_signature = signature
 
-        self.__add_to_undo_cache()  # add to undo cache after successful reprocess
-        self.dataframe = new
+        return self.__get_commit(state=state, apply=apply)
 
     def find(
             self,
             text: str,
             start: Optional[Tuple[int, str]]) -> Optional[Tuple[int, str]]:
+        """
+        The first cell containing the text (case-insensitive) after the start cell, row by row
+        """
+        if start is not None:
+            start = (start[0], self.dataframe.columns.get_loc(start[1]))
 
-        if start is None:
-            start_irow = 0
-            start_icol = 0
-        else:
-            start_irow = start[0]
-            start_icol = self.dataframe.columns.to_list().index(start[1])
+        found = self.search_index.find(
+            dataframe=self.dataframe, text=text, start=start, shown=self.__get_filter_mask())
 
-        nrows, ncols = self.dataframe.shape
+        if found is not None:
+            row, column = found
+            return row, self.dataframe.columns[column]
 
-        for r in range(nrows):
-            for c in range(ncols):
-                if r <= start_irow and c <= start_icol:
-                    continue
-                if text.lower() in str(self.dataframe.iloc[r, c]).lower():
-                    return r, self.dataframe.columns[c]
+    def find_all(
+            self,
+            text: str,
+            regex: bool = False,
+            case: bool = False,
+            columns: Optional[List[str]] = None) -> List[Tuple[int, str]]:
+        """
+        All cells containing the text, or matching the regex, optionally only in the given columns
+        """
+        found = find_all(dataframe=self.dataframe, text=text, regex=regex, case=case, columns=columns)
+        shown = self.__get_filter_mask()
+        return [(row, self.dataframe.columns[column]) for row, column in found if shown is None or shown[row]]
+
+    def set_filter(self, query: str):
+        """
+        Shows only the rows matching the query, e.g. 'Sex == Male and Overall Survival Status == 1:DECEASED'
+        Operators are ==, !=, >, <, >=, <= and contains, an empty query shows all rows
+        """
+        conditions = parse_filter(query=query, columns=self.dataframe.columns.to_list())
+        self.row_filter.set_conditions(conditions=conditions)
+
+    def get_filtered_rows(self) -> Optional[np.ndarray]:
+        """
+        Positions of the rows shown by the filter in ascending order, None if there's no filter
+        """
+        if not self.row_filter.is_active():
+            return None
+        return self.row_filter.get_rows(dataframe=self.dataframe)
+
+    def __get_filter_mask(self) -> Optional[np.ndarray]:
+        rows = self.get_filtered_rows()
+        if rows is None:
+            return None
+        mask = np.zeros(len(self.dataframe), dtype=bool)
+        mask[rows] = True
+        return mask
 
     def export_cbioportal_study(
             self,
             maf_dir: str,
             study_info_dict: Dict[str, str],
             tags_dict: Dict[str, str],
-            outdir: str):
+            outdir: str,
+            incremental: bool = False,
+            progress: Optional[Progress] = None):
 
         ExportCbioportalStudy(self.schema).main(
             clinical_data_df=self.dataframe,
             maf_dir=maf_dir,
             study_info_dict=study_info_dict,
             tags_dict=tags_dict,
-            outdir=outdir)
+            outdir=outdir,
+            maf_workers=self.MAF_READ_WORKERS,
+            maf_cache=None if self.MAF_CACHE_DIR is None else MafCache(
+                cache_dir=self.MAF_CACHE_DIR, max_bytes=self.MAF_CACHE_MAX_BYTES),
+            incremental=incremental,
+            progress=progress)
 
     def is_file_saved(self) -> bool:
-        return id(self.dataframe) == self.saved_dataframe_id
+        return self.history.version == self.saved_version
 
 
 class ImportClinicalDataTable(BaseModel):
@@ -246,23 +456,30 @@ class ImportClinicalDataTable(BaseModel):
             columns=self.schema.DISPLAY_COLUMNS)
 
         id_column = self.schema.ID_COLUMN
+        existing = set(self.clinical_data_df[id_column])
 
-        for _, row in df.iterrows():
-
-            sample_id = row[id_column]
+        keep, duplicates = [], []
+        for sample_id in df[id_column]:
 
             if pd.isna(sample_id):
                 # cannot tell if the sample already exists, so just include it
-                self.clinical_data_df = append(self.clinical_data_df, row)
-            
-            elif sample_id in self.clinical_data_df[id_column].values.tolist():
+                keep.append(True)
+
+            elif sample_id in existing:
                 # sample_id is not np.nan, and it already exists, so skip
-                print(f'WARNING! Sample ID "{sample_id}" already exists, skipping', flush=True)
-                continue
-            
+                keep.append(False)
+                duplicates.append(sample_id)
+
             else:
                 # sample_id is not np.nan, and it does not exist, so append it
-                self.clinical_data_df = append(self.clinical_data_df, row)
+                keep.append(True)
+                existing.add(sample_id)
+
+        if len(duplicates) > 0:
+            ids = ', '.join(f'"{x}"' for x in duplicates)
+            print(f'WARNING! {len(duplicates)} sample ID(s) already exist, skipping: {ids}', flush=True)
+
+        self.clinical_data_df = append_rows(self.clinical_data_df, df[keep])
 
         return self.clinical_data_df
 
@@ -298,33 +515,38 @@ class ImportSequencingTable(BaseModel):
         )
 
     def append_new_rows(self):
-        for i, row in self.seq_df.iterrows():
+        existing = set(self.clinical_data_df[self.SAMPLE_ID])
 
-            sequencing_id = row['ID']
-            already_exists = sequencing_id in self.clinical_data_df[self.SAMPLE_ID].values
-            if already_exists:
-                continue
+        keep = []
+        for sequencing_id in self.seq_df['ID']:
+            already_exists = not pd.isna(sequencing_id) and sequencing_id in existing  # NaN never equals an existing ID
+            keep.append(not already_exists)
+            existing.add(sequencing_id)
 
-            new_row = {
-                self.SAMPLE_ID: sequencing_id,
-                self.LAB_ID: row['Lab'],
-                self.LAB_SAMPLE_ID: row['Lab Sample ID'],
-            }
+        seq_df = self.seq_df[keep]
+        new_rows = pd.DataFrame({
+            self.SAMPLE_ID: seq_df['ID'],
+            self.LAB_ID: seq_df['Lab'],
+            self.LAB_SAMPLE_ID: seq_df['Lab Sample ID'],
+        })
 
-            self.clinical_data_df = append(self.clinical_data_df, new_row)
+        self.clinical_data_df = append_rows(self.clinical_data_df, new_rows)
 
 
-def append(
+def append_rows(
         df: pd.DataFrame,
-        s: Union[dict, pd.Series]) -> pd.DataFrame:
-
-    if type(s) is dict:
-        s = pd.Series(s)
+        rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Appends all rows with a single concat
+    """
+    if len(rows) == 0:
+        return df
 
-    if df.empty:
-        return pd.DataFrame([s])  # no need to concat, just return the Series as a DataFrame
+    if df.empty:  # no need to concat, but keep the columns of the empty df as concat does
+        columns = df.columns.append(rows.columns.difference(df.columns, sort=False))
+        return rows.reindex(columns=columns).reset_index(drop=True)
 
-    return pd.concat([df, pd.DataFrame([s])], ignore_index=True)
+    return pd.concat([df, rows], ignore_index=True)
 
 
 class ReadTable(BaseModel):
@@ -370,6 +592,51 @@ class ReadTable(BaseModel):
                 self.df[column] = pd.NA
 
 
+class WriteTable:
+    """
+    Written to a temp file next to the file, which replaces the file only if the job is neither failed nor cancelled
+    CSV is written in chunks of rows to report progress and check for cancellation, XLSX in one go
+    """
+
+    CHUNK_SIZE = 10000  # rows
+
+    dataframe: pd.DataFrame
+    file: str
+    progress: Progress
+
+    temp: str
+
+    def main(self, dataframe: pd.DataFrame, file: str, progress: Optional[Progress] = None):
+        self.dataframe = dataframe
+        self.file = file
+        self.progress = Progress() if progress is None else progress
+
+        root, ext = os.path.splitext(self.file)
+        self.temp = f'{root}.saving{ext}'  # keeps the extension, from which pandas picks the Excel writer
+        try:
+            self.write_temp()
+            self.progress.check()
+            os.replace(self.temp, self.file)
+        except BaseException:
+            if os.path.exists(self.temp):
+                os.remove(self.temp)
+            raise
+
+    def write_temp(self):
+        if self.file.endswith('.xlsx'):
+            self.progress.start(stage='Saving clinical data table', total=1)
+            self.dataframe.to_excel(self.temp, index=False)
+            self.progress.update(done=1)
+            return
+
+        n = len(self.dataframe)
+        self.progress.start(stage='Saving clinical data table', total=n)
+        with open(self.temp, 'w', encoding='utf-8-sig', newline='') as fh:  # newline='' as pandas opens a path
+            for i in range(0, max(n, 1), self.CHUNK_SIZE):
+                self.dataframe.iloc[i:i + self.CHUNK_SIZE].to_csv(fh, index=False, header=(i == 0))
+                self.progress.update(done=min(i + self.CHUNK_SIZE, n), bytes_written=fh.tell())
+
+
 class ExportCbioportalStudy(BaseModel):
 
     clinical_data_df: pd.DataFrame
@@ -377,6 +644,12 @@ class ExportCbioportalStudy(BaseModel):
     study_info_dict: Dict[str, str]
     tags_dict: Dict[str, str]
     outdir: str
+    maf_workers: int
+    maf_cache: Optional[MafCache]
+    incremental: bool
+    progress: Optional[Progress]
+
+    staging_dir: str
 
     def main(
             self,
@@ -384,19 +657,24 @@ class ExportCbioportalStudy(BaseModel):
             maf_dir: str,
             study_info_dict: Dict[str, str],
             tags_dict: Dict[str, str],
-            outdir: str):
+            outdir: str,
+            maf_workers: int = 1,
+            maf_cache: Optional[MafCache] = None,
+            incremental: bool = False,
+            progress: Optional[Progress] = None):
 
         self.clinical_data_df = clinical_data_df
         self.maf_dir = maf_dir
         self.study_info_dict = study_info_dict
         self.tags_dict = tags_dict
         self.outdir = outdir
+        self.maf_workers = maf_workers
+        self.maf_cache = maf_cache
+        self.incremental = incremental
+        self.progress = progress
 
-        self.make_outdir()
-        self.run_cbio_ingest()
-
-    def make_outdir(self):
-        os.makedirs(self.outdir, exist_ok=True)
+        with staging_directory(outdir=self.outdir, seed=self.incremental) as self.staging_dir:
+            self.run_cbio_ingest()
 
     def run_cbio_ingest(self):
         cBioIngest(self.schema).main(
@@ -404,53 +682,299 @@ class ExportCbioportalStudy(BaseModel):
             maf_dir=self.maf_dir,
             study_info_dict=self.study_info_dict,
             tags_dict=self.tags_dict,
-            outdir=self.outdir)
+            outdir=self.staging_dir,
+            maf_workers=self.maf_workers,
+            maf_cache=self.maf_cache,
+            incremental=self.incremental,
+            progress=self.progress)
 
 
 class ProcessSampleAttributes(BaseModel):
 
-    def main(self, attributes: Dict[str, str]) -> Dict[str, Any]:
+    def main(
+            self,
+            attributes: Dict[str, str],
+            changed_keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        If changed_keys are given, only the changed and the recalculated attributes are returned
+        """
+        attributes = self.calculate(attributes=attributes, changed_keys=changed_keys)
+        attributes = CastDatatypes(self.schema).main(attributes=attributes)
+        return attributes
+
+    def calculate(
+            self,
+            attributes: Dict[str, str],
+            changed_keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Everything but casting the datatypes
+        """
+        affected_keys = changed_keys
         if self.schema is NycuOsccSchema:
-            attributes = CalculateNycuOscc().main(attributes=attributes)
+            attributes = CalculateNycuOscc().main(attributes=attributes, changed_keys=changed_keys)
+            if changed_keys is not None:
+                _, affected_keys = CalculateNycuOscc().get_downstream(changed_keys=changed_keys)
         elif self.schema is VghtcOsccSchema:
             attributes = CalculateVghtcOscc().main(attributes=attributes)
-        attributes = CastDatatypes(self.schema).main(attributes=attributes)
+            affected_keys = None  # no dependency graph, any calculated attribute may have changed
+
+        if affected_keys is not None:
+            attributes = {k: v for k, v in attributes.items() if k in affected_keys}
+
         return attributes
 
 
+class ProcessTableAttributes(BaseModel):
+    """
+    Table counterpart of ProcessSampleAttributes, which calculates the derived columns of all rows at once
+    """
+
+    CHUNK_SIZE = 1000  # rows per process when workers > 1, or per progress report
+
+    df: pd.DataFrame
+    rows: np.ndarray
+    progress: Optional[Progress]
+
+    def main(
+            self,
+            df: pd.DataFrame,
+            workers: int = 1,
+            rows: Optional[np.ndarray] = None,
+            progress: Optional[Progress] = None) -> pd.DataFrame:
+        """
+        rows: positions of the rows of df in the table, for error messages, by default df is the whole table
+        progress: reports the chunks of rows, and aborts with Cancelled between chunks once cancelled
+        """
+        self.df = df
+        self.rows = np.arange(len(df)) if rows is None else np.asarray(rows)
+        self.progress = progress
+
+        if (workers > 1 and len(df) > self.CHUNK_SIZE) or progress is not None:
+            return self.main_chunked(workers=workers)
+
+        try:
+            records = self.calculate()
+        except Exception:
+            records = self.calculate_per_row()  # raises the same error as ProcessSampleAttributes for the first invalid row
+
+        df = pd.DataFrame(records, index=self.df.index, columns=self.df.columns, dtype=object)
+
+        return CastTableDatatypes(self.schema).main(df=df, rows=self.rows)
+
+    def main_chunked(self, workers: int) -> pd.DataFrame:
+        """
+        Chunks are reassembled in order, and the error of the first failed chunk is raised,
+            which is the error of the first invalid row, the same as processing all rows at once
+        Chunks are processed in a process pool if workers > 1, otherwise one by one
+        """
+        starts = range(0, max(len(self.df), 1), self.CHUNK_SIZE)  # an empty df is one empty chunk
+        progress = Progress() if self.progress is None else self.progress
+        progress.start(stage='Reprocessing table', total=len(starts))
+
+        if workers <= 1:
+            results = []
+            for i in starts:
+                results.append(process_table_chunk(
+                    self.schema, self.df.iloc[i:i + self.CHUNK_SIZE], self.rows[i:i + self.CHUNK_SIZE]))
+                progress.update(done=len(results))  # raises if cancelled
+            return pd.concat(results)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    process_table_chunk,
+                    self.schema,
+                    self.df.iloc[i:i + self.CHUNK_SIZE],
+                    self.rows[i:i + self.CHUNK_SIZE])
+                for i in starts
+            ]
+            try:
+                results = []
+                for future in futures:
+                    results.append(future.result())
+                    progress.update(done=len(results))  # raises if cancelled
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return pd.concat(results)
+
+    def calculate(self) -> List[Dict[str, Any]]:
+        df = to_str(self.df)
+        if self.schema is NycuOsccSchema:
+            df = CalculateNycuOsccBatch().main(df=df)[self.df.columns]
+            return df.to_dict('records')
+        elif self.schema is VghtcOsccSchema:
+            return [CalculateVghtcOscc().main(attributes=r) for r in df.to_dict('records')]
+        return df.to_dict('records')
+
+    def calculate_per_row(self) -> List[Dict[str, Any]]:
+        records = to_str(self.df).to_dict('records')
+        if self.schema is NycuOsccSchema:
+            records = [CalculateNycuOscc().main(attributes=r) for r in records]
+        elif self.schema is VghtcOsccSchema:
+            records = [CalculateVghtcOscc().main(attributes=r) for r in records]
+        return [{c: r[c] for c in self.df.columns} for r in records]
+
+
+def process_table_chunk(schema: Type[Schema], df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+    """
+    Runs in the worker process, so it must be a picklable module-level function
+    """
+    return ProcessTableAttributes(schema).main(df=df, rows=rows)
+
+
+def to_str(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The same as Model.get_sample() for all rows, i.e. everything is str and NaN is ''
+    """
+    return df.astype(object).where(df.notna(), '').apply(lambda s: s.map(str))
+
+
 class CastDatatypes(BaseModel):
 
+    columns: Mapping[str, ColumnSpec]
+
+    def __init__(self, schema: Type[Schema]):
+        super().__init__(schema=schema)
+        self.columns = compile_schema(schema).columns
+
     def main(self, attributes: Dict[str, Any]) -> Dict[str, Any]:
 
         ret: Dict[str, Any] = attributes.copy()
 
         for key, val in ret.items():
-
-            if val == '':
-                ret[key] = pd.NA
-            elif self.schema.COLUMN_ATTRIBUTES[key]['type'] == 'int':
-                ret[key] = int(val)
-            elif self.schema.COLUMN_ATTRIBUTES[key]['type'] == 'float':
-                ret[key] = float(val)
-            elif self.schema.COLUMN_ATTRIBUTES[key]['type'] == 'date':
-                ret[key] = pd.to_datetime(val).strftime('%Y-%m-%d')  # format it as str
-            elif self.schema.COLUMN_ATTRIBUTES[key]['type'] == 'date_list':
-                ret[key] = format_date_list(val)
-            elif self.schema.COLUMN_ATTRIBUTES[key]['type'] == 'bool':
-                ret[key] = True if val.upper() == 'TRUE' else False
-            # assume other types are all str
+            ret[key] = self.cast(key=key, val=val)
 
         return ret
 
+    def cast(self, key: str, val: Any) -> Any:
+        if val == '':
+            return pd.NA
+        return self.columns[key].cast(val)
 
-def format_date_list(val: str) -> str:
+
+class CastTableDatatypes(BaseModel):
     """
-    '2020;2020-02;2020-03-01' --> '2020-01-01 ; 2020-02-01 ; 2020-03-01'
+    Table counterpart of CastDatatypes, which casts the columns of each declared type in one vectorized pass
+    NaN cells are missing attributes, which are left as they are
+    Cells that the vectorized pass does not handle are cast one by one by CastDatatypes, so the results are the same
     """
-    sep = ';'
-    dates = []
-    for x in val.split(sep):
-        xx = x.strip()
-        if not xx == '':
-            dates.append(pd.to_datetime(xx).strftime('%Y-%m-%d'))
-    return f' {sep} '.join(dates)
+
+    DATE_FORMATS = {  # formats parsed in a vectorized pass, whose values pd.to_datetime() reads the same way
+        r'\d{4}-\d{1,2}-\d{1,2}': '%Y-%m-%d',
+        r'\d{4}/\d{1,2}/\d{1,2}': '%Y/%m/%d',
+    }
+
+    cast: CastDatatypes
+    rows: np.ndarray
+    errors: List[Tuple[int, int, Exception]]  # row position, column position and error of the invalid cells
+
+    def main(self, df: pd.DataFrame, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        rows: positions of the rows of df in the table, which are reported in the error of an invalid cell
+        """
+        self.cast = CastDatatypes(self.schema)
+        self.rows = np.arange(len(df)) if rows is None else np.asarray(rows)
+        self.errors = []
+
+        values = df.to_numpy(dtype=object, copy=True)
+        for type_, positions in self.group_columns(columns=list(df.columns)).items():
+            block = values[:, positions]
+            rows, cols = np.nonzero(pd.notna(block))
+            block[rows, cols] = self.cast_group(
+                type_=type_,
+                cells=block[rows, cols],
+                rows=rows,
+                columns=[positions[c] for c in cols],
+                keys=[df.columns[positions[c]] for c in cols])
+            values[:, positions] = block
+
+        if len(self.errors) > 0:
+            row, column, error = min(self.errors, key=lambda e: e[:2])  # the first invalid cell, as if cast row by row
+            raise ValueError(f'Invalid "{df.columns[column]}" of row {self.rows[row] + 1}: {error!r}') from error
+
+        return pd.DataFrame(values, index=df.index, columns=df.columns, dtype=object)
+
+    def group_columns(self, columns: List[str]) -> Dict[Optional[str], List[int]]:
+        """
+        Column positions grouped by declared type, columns not in the schema are grouped under None
+        """
+        groups = {}
+        for i, column in enumerate(columns):
+            spec = self.cast.columns.get(column)
+            type_ = None if spec is None else spec.type
+            groups.setdefault(type_, []).append(i)
+        return groups
+
+    def cast_group(
+            self,
+            type_: Optional[str],
+            cells: np.ndarray,
+            rows: np.ndarray,
+            columns: List[int],
+            keys: List[str]) -> np.ndarray:
+        """
+        Cells are in row-major order, so the first error of the group is the first invalid cell of the group
+        """
+        ret = cells.copy()
+        is_str = np.fromiter((type(val) is str for val in cells), dtype=bool, count=len(cells))
+        empty = is_str & (cells == '')
+        ret[empty] = pd.NA
+
+        todo = is_str & ~empty
+        ret[todo], ok = self.cast_str(type_=type_, values=cells[todo])
+
+        failed = ~is_str  # e.g. numbers from the calculators
+        failed[todo] = ~ok
+        casted = {}  # cast each unique value only once, keyed by type as well, e.g. 1 == 1.0 == True
+        for i in np.flatnonzero(failed):
+            key, val = keys[i], cells[i]
+            if (key, type(val), val) not in casted:
+                try:
+                    casted[(key, type(val), val)] = self.cast.cast(key=key, val=val)
+                except Exception as e:
+                    self.errors.append((rows[i], columns[i], e))
+                    break
+            ret[i] = casted[(key, type(val), val)]
+
+        return ret
+
+    def cast_str(self, type_: Optional[str], values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Casts non-empty str values, returns the casted values and the mask of successfully casted values
+        """
+        ret = values.copy()
+        ok = np.ones(len(values), dtype=bool)
+        if len(values) == 0:
+            return ret, ok
+
+        if type_ in ['int', 'float']:
+            try:  # numpy calls int() and float(), which are exactly the same as CastDatatypes
+                ret[:] = values.astype(np.int64 if type_ == 'int' else np.float64).tolist()
+            except (ValueError, TypeError, OverflowError):
+                ok[:] = False  # e.g. int too large for int64, or an invalid value to be reported
+        elif type_ == 'date':
+            ok[:] = False
+            s = pd.Series(values, dtype=object)
+            for pattern, format_ in self.DATE_FORMATS.items():
+                matched = s.str.fullmatch(pattern).to_numpy(dtype=bool) & ~ok
+                if not matched.any():
+                    continue
+                dates = pd.to_datetime(s[matched], format=format_, errors='coerce')
+                parsed = dates.notna().to_numpy()
+                ret[np.flatnonzero(matched)[parsed]] = dates[parsed].dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+                ok[np.flatnonzero(matched)[parsed]] = True
+        elif type_ == 'date_list':
+            parts = pd.Series(values, dtype=object).str.split(';').explode().str.strip()
+            parts = parts[parts != '']
+            dates, parsed = self.cast_str(type_='date', values=parts.to_numpy(dtype=object))
+            ok[parts.index[~parsed]] = False
+            joined = pd.Series(dates, index=parts.index, dtype=object).groupby(level=0).agg(' ; '.join)
+            ret[:] = joined.reindex(range(len(values)), fill_value='').to_numpy(dtype=object)
+        elif type_ == 'bool':
+            ret[:] = (pd.Series(values, dtype=object).str.upper() == 'TRUE').tolist()
+        elif type_ is None:
+            ok[:] = False  # not in the schema, CastDatatypes raises KeyError
+
+        return ret, ok
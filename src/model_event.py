@@ -0,0 +1,50 @@
+"""
+Typed change events emitted by the `Model` after its dataframe changes.
+Listeners (e.g. the `View`) apply only the described change, instead of refreshing the whole table.
+"""
+import numpy as np
+from typing import List
+
+
+class Event:
+    pass
+
+
+class CellsUpdated(Event):
+
+    rows: List[int]
+    columns: List[str]
+
+    def __init__(self, rows: List[int], columns: List[str]):
+        self.rows = rows
+        self.columns = columns
+
+
+class RowsAppended(Event):
+
+    first: int
+    last: int
+
+    def __init__(self, first: int, last: int):
+        self.first = first
+        self.last = last
+
+
+class RowsDropped(Event):
+
+    rows: List[int]  # row positions before the rows were dropped
+
+    def __init__(self, rows: List[int]):
+        self.rows = rows
+
+
+class TableSorted(Event):
+
+    order: np.ndarray  # row i after sorting was row order[i] before sorting
+
+    def __init__(self, order: np.ndarray):
+        self.order = order
+
+
+class TableReplaced(Event):
+    pass
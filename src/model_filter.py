@@ -0,0 +1,163 @@
+"""
+Row filter of the table, e.g. 'Sex == Male and Overall Survival Status == 1:DECEASED'
+"""
+import re
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Tuple, Optional
+from .model_event import Event, CellsUpdated, RowsAppended, RowsDropped, TableSorted
+from .model_search import to_display_text
+
+
+Condition = Tuple[str, str, str]  # column, operator, value
+
+OPERATORS = ['==', '!=', '>=', '<=', '>', '<', 'contains']  # two-character operators are matched first
+QUOTED = r'`[^`]*`|"[^"]*"|\'[^\']*\''
+
+
+def parse_filter(query: str, columns: List[str]) -> List[Condition]:
+    """
+    'Sex == Male and Patient Weight (Kg) > 60' --> [('Sex', '==', 'Male'), ('Patient Weight (Kg)', '>', '60')]
+    Column names and values may be quoted, e.g. `Sex` == 'Male', so that they can contain 'and' or operators
+    """
+    ops = '|'.join(re.escape(o) for o in OPERATORS)
+    ret = []
+    for clause in split_clauses(query=query.strip()):
+        if clause == '':
+            continue
+        matched = re.fullmatch(rf'({QUOTED}|.+?)\s*({ops})\s*(.*)', clause)
+        if matched is None:
+            raise ValueError(f'Invalid filter condition: "{clause}"')
+        column, operator, value = [unquote(x.strip()) for x in matched.groups()]
+        if column not in columns:
+            raise ValueError(f'Column "{column}" does not exist')
+        ret.append((column, operator, value))
+    return ret
+
+
+def split_clauses(query: str) -> List[str]:
+    """
+    Splits at 'and' outside of quotes, e.g. "Surgery == 'Wide Excision and Neck Dissection'" is one clause
+    """
+    ret, start = [], 0
+    for matched in re.finditer(rf'{QUOTED}|\s+and\s+', query, flags=re.IGNORECASE):
+        if matched.group()[0] in '`"\'':  # skips the quoted span
+            continue
+        ret.append(query[start:matched.start()])
+        start = matched.end()
+    ret.append(query[start:])
+    return ret
+
+
+def unquote(text: str) -> str:
+    for q in ['`', '"', "'"]:
+        if len(text) >= 2 and text.startswith(q) and text.endswith(q):
+            return text[1:-1]
+    return text
+
+
+def evaluate(condition: Condition, series: pd.Series) -> np.ndarray:
+    """
+    == and != compare the display text, contains is case-insensitive,
+        and >, <, >=, <= compare numbers if the value is a number, otherwise the display text,
+        in which empty cells never match, e.g. 'Birth Date > 1960-01-01'
+    """
+    _, operator, value = condition
+    text = to_display_text(series)
+
+    if operator == '==':
+        return (text == value).to_numpy(dtype=bool)
+    elif operator == '!=':
+        return (text != value).to_numpy(dtype=bool)
+    elif operator == 'contains':
+        return text.str.contains(value, case=False, regex=False).to_numpy(dtype=bool)
+
+    try:
+        left, right = pd.to_numeric(series, errors='coerce'), float(value)
+    except ValueError:
+        left, right = text.where(text != ''), value
+
+    compare = {
+        '>': left.gt,
+        '<': left.lt,
+        '>=': left.ge,
+        '<=': left.le,
+    }[operator]
+    return compare(right).fillna(False).to_numpy(dtype=bool)
+
+
+class RowFilter:
+    """
+    The mask of each condition is cached, so that refining the filter only evaluates the new conditions
+    Masks move with the rows as the model events arrive, and edited rows are re-evaluated when the rows are requested
+    """
+
+    conditions: List[Condition]
+    masks: Dict[Condition, np.ndarray]
+    stale: np.ndarray  # rows to be re-evaluated for all cached masks
+    dataframe: Optional[pd.DataFrame]  # the dataframe described by the masks
+
+    def __init__(self):
+        self.conditions = []
+        self.clear_cache()
+
+    def clear_cache(self):
+        self.masks = {}
+        self.stale = np.zeros(0, dtype=bool)
+        self.dataframe = None
+
+    def set_conditions(self, conditions: List[Condition]):
+        """
+        The masks of both the previous and the new conditions are kept, e.g. for going back to the previous filter
+        """
+        self.masks = {c: m for c, m in self.masks.items() if c in conditions or c in self.conditions}
+        self.conditions = conditions
+
+    def is_active(self) -> bool:
+        return len(self.conditions) > 0
+
+    def apply_event(self, event: Event, dataframe: pd.DataFrame):
+        if self.dataframe is None:
+            return
+
+        if isinstance(event, CellsUpdated):
+            self.stale[event.rows] = True
+        elif isinstance(event, RowsAppended):
+            n = event.last - event.first + 1
+            self.masks = {c: np.concatenate([m, np.zeros(n, dtype=bool)]) for c, m in self.masks.items()}
+            self.stale = np.concatenate([self.stale, np.ones(n, dtype=bool)])
+        elif isinstance(event, RowsDropped):
+            self.masks = {c: np.delete(m, event.rows) for c, m in self.masks.items()}
+            self.stale = np.delete(self.stale, event.rows)
+        elif isinstance(event, TableSorted):
+            self.masks = {c: m[event.order] for c, m in self.masks.items()}
+            self.stale = self.stale[event.order]
+        else:  # the whole table is replaced
+            self.clear_cache()
+            return
+
+        self.dataframe = dataframe
+
+    def get_rows(self, dataframe: pd.DataFrame) -> np.ndarray:
+        """
+        Positions of the rows matching all conditions, in ascending order
+        """
+        if dataframe is not self.dataframe or len(self.stale) != len(dataframe):
+            self.clear_cache()  # e.g. the dataframe was replaced without any event
+            self.dataframe = dataframe
+            self.stale = np.zeros(len(dataframe), dtype=bool)
+
+        self.set_conditions([c for c in self.conditions if c[0] in dataframe.columns])  # e.g. the column was dropped
+
+        stale = np.flatnonzero(self.stale)
+        if len(stale) > 0:
+            for condition, mask in self.masks.items():
+                mask[stale] = evaluate(condition, dataframe[condition[0]].iloc[stale])
+            self.stale[:] = False
+
+        mask = np.ones(len(dataframe), dtype=bool)
+        for condition in self.conditions:
+            if condition not in self.masks:
+                self.masks[condition] = evaluate(condition, dataframe[condition[0]])
+            mask &= self.masks[condition]
+        return np.flatnonzero(mask)
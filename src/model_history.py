@@ -0,0 +1,471 @@
+"""
+Delta-based undo/redo history of the `Model` dataframe.
+Each history entry only records what an operation changed (cells, rows, columns or row order),
+so the memory of the history scales with the size of the edits rather than the size of the table.
+"""
+import os
+import shutil
+import weakref
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple, Union
+from .model_event import Event, CellsUpdated, RowsAppended, RowsDropped, TableSorted, TableReplaced
+
+
+class Delta:
+    """
+    A reversible change of the dataframe
+
+    apply() turns the "before" dataframe into the "after" dataframe, revert() does the opposite
+    Both may modify the given dataframe in place, always use the returned dataframe
+    """
+
+    checkpoint: Optional[pd.DataFrame] = None  # full copy of the "before" dataframe, see History
+    versions: Tuple[int, int]  # versions of the dataframe before and after the delta, see History
+    nbytes: int = 0  # memory usage measured by History
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError(f'The {self.__class__.__name__}.apply() method must be implemented')
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError(f'The {self.__class__.__name__}.revert() method must be implemented')
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        raise NotImplementedError(f'The {self.__class__.__name__}.data() method must be implemented')
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        """
+        Events describing the change made by apply() (forward) or revert(), nrows is the resulting number of rows
+        """
+        return [TableReplaced()]
+
+    def memory_usage(self) -> int:
+        objs = self.data() if self.checkpoint is None else self.data() + [self.checkpoint]
+        return sum(get_nbytes(o) for o in objs)
+
+
+def get_nbytes(obj: Union[pd.DataFrame, np.ndarray]) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    return int(obj.nbytes)
+
+
+class CellPatch(Delta):
+
+    ROW = 'row'
+    COLUMN = 'column'
+    BEFORE = 'before'
+    AFTER = 'after'
+
+    cells: pd.DataFrame  # one record per changed cell, row is the position in the dataframe
+
+    def __init__(self, cells: pd.DataFrame):
+        self.cells = cells
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.__set_values(df=df, values=self.AFTER)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.__set_values(df=df, values=self.BEFORE)
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.cells]
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        if len(self.cells) == 0:
+            return []
+        return [CellsUpdated(
+            rows=self.cells[self.ROW].unique().tolist(),
+            columns=self.cells[self.COLUMN].unique().tolist())]
+
+    def __set_values(self, df: pd.DataFrame, values: str) -> pd.DataFrame:
+        for column, cells in self.cells.groupby(self.COLUMN, sort=False):
+            if df[column].dtype != object:
+                df[column] = df[column].astype(object)  # a typed column cannot hold arbitrary values
+            j = df.columns.get_loc(column)
+            df.iloc[cells[self.ROW].to_numpy(), j] = cells[values].to_numpy(dtype=object)
+        return df
+
+
+class RowInsert(Delta):
+
+    rows: pd.DataFrame  # rows appended to the end of the dataframe
+
+    def __init__(self, rows: pd.DataFrame):
+        self.rows = rows.copy()  # do not hold a view of the dataframe, which may be edited in place
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        if df.empty:
+            return self.rows.reset_index(drop=True)
+        return pd.concat([df, self.rows], ignore_index=True)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.iloc[:len(df) - len(self.rows)].copy()
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.rows]
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        if len(self.rows) == 0:
+            return []
+        if forward:
+            return [RowsAppended(first=nrows - len(self.rows), last=nrows - 1)]
+        return [RowsDropped(rows=list(range(nrows, nrows + len(self.rows))))]
+
+
+class RowDelete(Delta):
+
+    positions: np.ndarray
+    rows: pd.DataFrame
+
+    def __init__(self, df: pd.DataFrame, positions: List[int]):
+        self.positions = np.unique(positions)  # sorted and deduplicated
+        self.rows = df.iloc[self.positions]
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.drop(index=df.index[self.positions]).reset_index(drop=True)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        mask = np.ones(len(df) + len(self.positions), dtype=bool)
+        mask[self.positions] = False
+        positions = np.concatenate([np.flatnonzero(mask), self.positions])
+        combined = pd.concat([df, self.rows], ignore_index=True)
+        return combined.iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.positions, self.rows]
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        if forward:
+            return [RowsDropped(rows=self.positions.tolist())]
+        return [TableReplaced()]
+
+
+class ColumnDelete(Delta):
+
+    positions: List[int]
+    columns: pd.DataFrame
+
+    def __init__(self, df: pd.DataFrame, columns: List[str]):
+        self.positions = sorted(df.columns.get_loc(c) for c in columns)
+        self.columns = df.iloc[:, self.positions]
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.drop(columns=self.columns.columns)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy(deep=False)  # do not insert columns into a dataframe that may be referenced elsewhere
+        for position, column in zip(self.positions, self.columns.columns):
+            df.insert(position, column, self.columns[column].to_numpy())
+        return df
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.columns]
+
+
+class Permutation(Delta):
+
+    order: np.ndarray  # the "after" dataframe is the "before" dataframe in this row order
+
+    def __init__(self, order: np.ndarray):
+        self.order = order
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.iloc[self.order].reset_index(drop=True)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.iloc[np.argsort(self.order)].reset_index(drop=True)
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.order]
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        return [TableSorted(order=self.order if forward else np.argsort(self.order))]
+
+
+class Snapshot(Delta):
+    """
+    Holds the whole dataframe of the other state, for changes as large as the table itself
+    """
+
+    frame: pd.DataFrame
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.__swap(df)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.__swap(df)
+
+    def __swap(self, df: pd.DataFrame) -> pd.DataFrame:
+        ret, self.frame = self.frame, df
+        return ret
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [self.frame]
+
+
+class Compound(Delta):
+
+    deltas: List[Delta]
+
+    def __init__(self, deltas: List[Delta]):
+        self.deltas = deltas
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for delta in self.deltas:
+            df = delta.apply(df)
+        return df
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        for delta in reversed(self.deltas):
+            df = delta.revert(df)
+        return df
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return [o for delta in self.deltas for o in delta.data()]
+
+    def get_events(self, forward: bool, nrows: int) -> List[Event]:
+        deltas = self.deltas if forward else reversed(self.deltas)
+        return [e for delta in deltas for e in delta.get_events(forward=forward, nrows=nrows)]
+
+
+class Spilled(Delta):
+    """
+    Placeholder of a delta that was spilled to a compressed file on disk, see History
+    """
+
+    COMPRESSION = 'gzip'
+
+    path: str
+    disk_nbytes: int
+
+    def __init__(self, delta: Delta, path: str):
+        self.path = path
+        self.versions = delta.versions
+        pd.to_pickle(delta, path, compression=self.COMPRESSION)
+        self.disk_nbytes = os.path.getsize(path)
+
+    def load(self) -> Delta:
+        delta = pd.read_pickle(self.path, compression=self.COMPRESSION)
+        self.remove()
+        return delta
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def data(self) -> List[Union[pd.DataFrame, np.ndarray]]:
+        return []
+
+
+def diff(before: pd.DataFrame, after: pd.DataFrame) -> Delta:
+    """
+    Cell-level patch between two dataframes of the same shape and columns
+    Falls back to a snapshot when the patch would not be smaller than the table itself
+    """
+    if list(before.columns) != list(after.columns) or len(before) != len(after):
+        return Snapshot(frame=before)
+
+    cells = diff_cells(before=before, after=after)
+
+    # each patched cell holds 4 values (row, column, before, after), a snapshot holds 1 value per cell
+    if len(cells) * 4 >= before.size > 0:
+        return Snapshot(frame=before)
+
+    return CellPatch(cells=cells)
+
+
+def diff_cells(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Both dataframes must have the same shape and columns
+    Returns one record per changed cell, with the row position, column name, before and after values
+    """
+    records = []
+    for j, column in enumerate(before.columns):
+        a = before.iloc[:, j].to_numpy(dtype=object)
+        b = after.iloc[:, j].to_numpy(dtype=object)
+        rows = np.flatnonzero(~equal(a, b))
+        if len(rows) > 0:
+            records.append(pd.DataFrame({
+                CellPatch.ROW: rows,
+                CellPatch.COLUMN: column,
+                CellPatch.BEFORE: pd.Series(a[rows], dtype=object),
+                CellPatch.AFTER: pd.Series(b[rows], dtype=object),
+            }))
+
+    if len(records) == 0:
+        return pd.DataFrame(columns=[CellPatch.ROW, CellPatch.COLUMN, CellPatch.BEFORE, CellPatch.AFTER])
+
+    return pd.concat(records, ignore_index=True)
+
+
+def equal(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Element-wise equality of two object arrays, where NA equals NA and values of different types are different
+    """
+    na_a, na_b = pd.isna(a), pd.isna(b)
+    ret = na_a & na_b
+
+    both = ~na_a & ~na_b
+    same = np.zeros(len(a), dtype=bool)
+    same[both] = (a[both] == b[both]).astype(bool)
+
+    get_type = np.frompyfunc(type, 1, 1)
+    same[same] = get_type(a[same]) == get_type(b[same])
+
+    return ret | same
+
+
+class History:
+    """
+    Undo and redo stacks of deltas
+
+    Every `checkpoint_interval` deltas, a full copy of the dataframe is kept with the delta,
+    undo restores the checkpoint instead of reverting the delta, so that the dataframe is exactly restored
+    without accumulating dtype changes from reverting a long chain of deltas
+    A snapshot delta already holds the whole dataframe, so it resets the checkpoint counter
+
+    When the deltas in memory exceed `max_bytes`, the deltas farthest from the current state
+    are spilled to compressed temp files (if `spill` is True) or evicted from the history
+    Spilled deltas are loaded back when undo or redo reaches them
+    The most recent undo delta is never evicted
+    """
+
+    max_undo: int
+    checkpoint_interval: int
+    max_bytes: Optional[int]
+    spill: bool
+
+    undo_cache: List[Delta]
+    redo_cache: List[Delta]
+    version: int  # identifies the current state of the dataframe
+    events: List[Event]  # describing the change made by the last undo or redo
+
+    since_checkpoint: int
+    last_version: int
+    spill_dir: Optional[str]
+
+    def __init__(
+            self,
+            max_undo: int,
+            checkpoint_interval: int,
+            max_bytes: Optional[int] = None,
+            spill: bool = False):
+        self.max_undo = max_undo
+        self.checkpoint_interval = checkpoint_interval
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.undo_cache = []
+        self.redo_cache = []
+        self.version = 0
+        self.events = []
+        self.since_checkpoint = 0
+        self.last_version = 0
+        self.spill_dir = None
+
+    def push(self, delta: Delta, dataframe: pd.DataFrame):
+        """
+        Record the delta before it is applied to the dataframe
+        """
+        if isinstance(delta, Snapshot):
+            self.since_checkpoint = 0
+        else:
+            self.since_checkpoint += 1
+            if self.since_checkpoint >= self.checkpoint_interval:
+                delta.checkpoint = dataframe.copy()
+                self.since_checkpoint = 0
+
+        self.last_version += 1
+        delta.versions = (self.version, self.last_version)
+        self.version = self.last_version
+
+        delta.nbytes = delta.memory_usage()
+        self.undo_cache.append(delta)
+        if len(self.undo_cache) > self.max_undo:
+            self.discard(self.undo_cache.pop(0))
+        for d in self.redo_cache:  # clear redo cache
+            self.discard(d)
+        self.redo_cache = []
+
+        self.enforce_max_bytes()
+
+    def undo(self, dataframe: pd.DataFrame) -> Optional[pd.DataFrame]:
+        if len(self.undo_cache) == 0:
+            return None
+        delta = self.load(self.undo_cache.pop())
+        if delta.checkpoint is not None:
+            ret = delta.checkpoint.copy()  # the checkpoint must not be modified by later in-place edits
+            self.events = [TableReplaced()]
+        else:
+            ret = delta.revert(dataframe)
+            self.events = delta.get_events(forward=False, nrows=len(ret))
+        delta.nbytes = delta.memory_usage()  # a snapshot now holds the other dataframe
+        self.redo_cache.append(delta)
+        self.version = delta.versions[0]
+        self.enforce_max_bytes()
+        return ret
+
+    def redo(self, dataframe: pd.DataFrame) -> Optional[pd.DataFrame]:
+        if len(self.redo_cache) == 0:
+            return None
+        delta = self.load(self.redo_cache.pop())
+        ret = delta.apply(dataframe)
+        self.events = delta.get_events(forward=True, nrows=len(ret))
+        delta.nbytes = delta.memory_usage()
+        self.undo_cache.append(delta)
+        self.version = delta.versions[1]
+        self.enforce_max_bytes()
+        return ret
+
+    def memory_usage(self) -> int:
+        return sum(d.nbytes for d in self.undo_cache + self.redo_cache)
+
+    def disk_usage(self) -> int:
+        return sum(d.disk_nbytes for d in self.undo_cache + self.redo_cache if isinstance(d, Spilled))
+
+    def enforce_max_bytes(self):
+        if self.max_bytes is None:
+            return
+
+        # farthest from the current state first, i.e. the oldest undo deltas and then the last redo deltas
+        # the most recent undo delta is excluded from eviction, so that the last edit can always be undone
+        candidates = [(self.undo_cache, i) for i in range(len(self.undo_cache) - 1)] + \
+                     [(self.redo_cache, i) for i in range(len(self.redo_cache))]
+
+        usage = self.memory_usage()
+        evicted = []
+        for cache, i in candidates:
+            if usage <= self.max_bytes:
+                break
+            delta = cache[i]
+            if isinstance(delta, Spilled):
+                continue
+            usage -= delta.nbytes
+            if self.spill:
+                cache[i] = Spilled(delta=delta, path=self.get_spill_path())
+                usage += cache[i].nbytes
+            else:
+                evicted.append((cache, delta))
+
+        for cache, delta in evicted:
+            cache.remove(delta)
+            self.discard(delta)
+
+    def get_spill_path(self) -> str:
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='clinui-history-')
+            weakref.finalize(self, shutil.rmtree, self.spill_dir, ignore_errors=True)
+        fd, path = tempfile.mkstemp(suffix='.pkl.gz', dir=self.spill_dir)
+        os.close(fd)
+        return path
+
+    def load(self, delta: Delta) -> Delta:
+        return delta.load() if isinstance(delta, Spilled) else delta
+
+    def discard(self, delta: Delta):
+        if isinstance(delta, Spilled):
+            delta.remove()
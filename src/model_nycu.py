@@ -4,8 +4,9 @@ Thus there is no need to dynamically pass in the self.schema object
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, Union, List, Tuple
+from typing import Dict, Any, Union, List, Tuple, Type, Optional, Set
 from .schema import NycuOsccSchema
+from .dates import parse_date
 
 
 S = NycuOsccSchema
@@ -13,22 +14,56 @@ S = NycuOsccSchema
 
 class CalculateNycuOscc:
 
-    def main(self, attributes: Dict[str, str]) -> Dict[str, Any]:
+    def main(
+            self,
+            attributes: Dict[str, str],
+            changed_keys: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        If changed_keys are given, only the calculators downstream of the changed keys are run
+        """
+        calculators = self.get_calculators() if changed_keys is None else self.get_downstream(changed_keys)[0]
 
-        attributes = CalculateDiagnosisAge().main(attributes)
-        attributes = CalculateSurvival().main(attributes)
-        attributes = MatchICD().main(attributes)
-        attributes = CalculateLymphNodes().main(attributes)
-        attributes = CalculateStage().main(attributes)
-        attributes = SplitTNM().main(attributes)
-        attributes = GetTherapyFlagsFromDrugs().main(attributes)
+        for calculator in calculators:
+            attributes = calculator().main(attributes)
 
         return attributes
 
+    def get_calculators(self) -> List[Type['Calculate']]:
+        """
+        In the order of dependency, i.e. a calculator only depends on the outputs of the calculators before it
+        """
+        return [
+            CalculateDiagnosisAge,
+            CalculateSurvival,
+            MatchICD,
+            CalculateLymphNodes,
+            CalculateStage,
+            SplitTNM,
+            GetTherapyFlagsFromDrugs,
+        ]
+
+    def get_downstream(self, changed_keys: List[str]) -> Tuple[List[Type['Calculate']], List[str]]:
+        """
+        Returns the calculators affected by the changed keys, and all keys affected by them, including the changed keys
+        """
+        calculators = []
+        keys = list(changed_keys)
+        affected: Set[str] = set(changed_keys)
+        for calculator in self.get_calculators():
+            if affected.intersection(calculator.INPUT_KEYS):
+                calculators.append(calculator)
+                for key in calculator.OUTPUT_KEYS:
+                    if key not in affected:
+                        keys.append(key)
+                        affected.add(key)
+        return calculators, keys
+
 
 class Calculate:
 
     REQUIRED_KEYS: List[str]
+    INPUT_KEYS: List[str]  # all keys read by the calculator, including the optional ones
+    OUTPUT_KEYS: List[str]  # all keys written by the calculator
     attributes: Dict[str, Any]
 
     def main(self, attributes: Dict[str, Any]) -> Dict[str, Any]:
@@ -57,6 +92,10 @@ class CalculateDiagnosisAge(Calculate):
         S.BIRTH_DATE,
         S.CLINICAL_DIAGNOSIS_DATE,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.CLINICAL_DIAGNOSIS_AGE,
+    ]
 
     def calculate(self):
         self.attributes[S.CLINICAL_DIAGNOSIS_AGE] = delta_t(
@@ -74,6 +113,15 @@ class CalculateSurvival(Calculate):
         S.EXPIRE_DATE,
         S.CAUSE_OF_DEATH,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.DISEASE_FREE_SURVIVAL_MONTHS,
+        S.DISEASE_FREE_SURVIVAL_STATUS,
+        S.DISEASE_SPECIFIC_SURVIVAL_MONTHS,
+        S.DISEASE_SPECIFIC_SURVIVAL_STATUS,
+        S.OVERALL_SURVIVAL_MONTHS,
+        S.OVERALL_SURVIVAL_STATUS,
+    ]
 
     t0: Union[str, float]  # np.nan is float
     alive: bool
@@ -175,12 +223,12 @@ def delta_t(
         end: Union[pd.Timestamp, str, type(np.nan)]) -> pd.Timedelta:
 
     if type(start) is str:
-        start = pd.to_datetime(start)
+        start = parse_date(start)
     elif pd.isna(start):
         start = pd.NaT
 
     if type(end) is str:
-        end = pd.to_datetime(end)
+        end = parse_date(end)
     elif pd.isna(end):
         end = pd.NaT
 
@@ -364,6 +412,11 @@ class MatchICD(Calculate):
     REQUIRED_KEYS = [
         S.TUMOR_DISEASE_ANATOMIC_SITE,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.ICD_O_3_SITE_CODE,
+        S.ICD_10_CLASSIFICATION,
+    ]
 
     def calculate(self):
         site = self.attributes[S.TUMOR_DISEASE_ANATOMIC_SITE]
@@ -409,6 +462,10 @@ class CalculateStage(Calculate):
     REQUIRED_KEYS = [
         S.PATHOLOGICAL_TNM,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.NEOPLASM_DISEASE_STAGE_AMERICAN_JOINT_COMMITTEE_ON_CANCER_CODE,
+    ]
 
     t: str
     n: str
@@ -422,48 +479,69 @@ class CalculateStage(Calculate):
         try:
             tnm = self.attributes[S.PATHOLOGICAL_TNM]
             tnm = tnm.replace('X', '0').replace('x', '0')  # x is unknown, should be treated as 0
-            self.t = tnm.split('T')[1].split('N')[0]
-            self.n = tnm.split('N')[1].split('M')[0]
-            self.m = tnm.split('M')[1]
+            self.t, self.n, self.m = split_tnm(tnm)
         except Exception as e:
             print(e)
             self.t, self.n, self.m = '', '', ''
 
     def calculate_stage(self):
-        t, n, m = self.t, self.n, self.m
-        if m == '1':
-            stage = 'Stage IVC'
-        elif t == '4b' and m == '0':
-            stage = 'Stage IVB'
-        elif n in ['3', '3a', '3b'] and m == '0':
-            stage = 'Stage IVB'
-        elif t in ['1', '2', '3', '4a'] and n in ['2', '2a', '2b', '2c'] and m == '0':
-            stage = 'Stage IVA'
-        elif t == '4a' and n in ['0', '1'] and m == '0':
-            stage = 'Stage IVA'
-        elif t in ['1', '2', '3'] and n == '1' and m == '0':
-            stage = 'Stage III'
-        elif t == '3' and n == '0' and m == '0':
-            stage = 'Stage III'
-        elif t == '2' and n == '0' and m == '0':
-            stage = 'Stage II'
-        elif t == '1' and n == '0' and m == '0':
-            stage = 'Stage I'
-        elif t == 'is' and n == '0' and m == '0':
-            stage = 'Stage 0'
-        else:
+        stage = get_ajcc_stage(t=self.t, n=self.n, m=self.m)
+        if stage == '':
             print(f'WARNING! Invalid "{S.PATHOLOGICAL_TNM}": "{self.attributes[S.PATHOLOGICAL_TNM]}" for finding AJCC stage')
-            stage = ''
-
         self.attributes[S.NEOPLASM_DISEASE_STAGE_AMERICAN_JOINT_COMMITTEE_ON_CANCER_CODE] = stage
 
 
+def split_tnm(tnm: str) -> Tuple[str, str, str]:
+    t = tnm.split('T')[1].split('N')[0]
+    n = tnm.split('N')[1].split('M')[0]
+    m = tnm.split('M')[1]
+    return t, n, m
+
+
+def get_ajcc_stage(t: str, n: str, m: str) -> str:
+    """
+    Returns '' if the TNM is invalid for finding AJCC stage
+    """
+    if m == '1':
+        stage = 'Stage IVC'
+    elif t == '4b' and m == '0':
+        stage = 'Stage IVB'
+    elif n in ['3', '3a', '3b'] and m == '0':
+        stage = 'Stage IVB'
+    elif t in ['1', '2', '3', '4a'] and n in ['2', '2a', '2b', '2c'] and m == '0':
+        stage = 'Stage IVA'
+    elif t == '4a' and n in ['0', '1'] and m == '0':
+        stage = 'Stage IVA'
+    elif t in ['1', '2', '3'] and n == '1' and m == '0':
+        stage = 'Stage III'
+    elif t == '3' and n == '0' and m == '0':
+        stage = 'Stage III'
+    elif t == '2' and n == '0' and m == '0':
+        stage = 'Stage II'
+    elif t == '1' and n == '0' and m == '0':
+        stage = 'Stage I'
+    elif t == 'is' and n == '0' and m == '0':
+        stage = 'Stage 0'
+    else:
+        stage = ''
+    return stage
+
+
 class SplitTNM(Calculate):
 
     REQUIRED_KEYS = [
         S.CLINICAL_TNM,
         S.PATHOLOGICAL_TNM,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.CLINICAL_T,
+        S.CLINICAL_N,
+        S.CLINICAL_M,
+        S.PATHOLOGICAL_T,
+        S.PATHOLOGICAL_N,
+        S.PATHOLOGICAL_M,
+    ]
 
     def calculate(self):
         self.split_clinical_tnm()
@@ -485,10 +563,7 @@ class SplitTNM(Calculate):
 
     def _split_tnm(self, tnm: str) -> Tuple[str, str, str]:
         try:
-            t = tnm.split('T')[1].split('N')[0]
-            n = tnm.split('N')[1].split('M')[0]
-            m = tnm.split('M')[1]
-            return t, n, m
+            return split_tnm(tnm)
         except Exception as e:
             print(e)
             return '', '', ''
@@ -497,6 +572,22 @@ class SplitTNM(Calculate):
 class CalculateLymphNodes(Calculate):
 
     REQUIRED_KEYS = []  # all lymph node records are optional
+    INPUT_KEYS = [
+        S.LYMPH_NODE_LEVEL_IA,
+        S.LYMPH_NODE_LEVEL_IB,
+        S.LYMPH_NODE_LEVEL_I,
+        S.LYMPH_NODE_LEVEL_IIA,
+        S.LYMPH_NODE_LEVEL_IIB,
+        S.LYMPH_NODE_LEVEL_II,
+        S.LYMPH_NODE_RIGHT,
+        S.LYMPH_NODE_LEFT,
+        S.TOTAL_LYMPH_NODE,
+    ]
+    OUTPUT_KEYS = [
+        S.LYMPH_NODE_LEVEL_I,
+        S.LYMPH_NODE_LEVEL_II,
+        S.TOTAL_LYMPH_NODE,
+    ]
 
     def calculate(self):
         self.add_level_1a_1b()
@@ -584,6 +675,15 @@ class GetTherapyFlagsFromDrugs(Calculate):
         S.PALLIATIVE_TARGETED_THERAPY_DRUG,
         S.IMMUNOTHERAPY_DRUG,
     ]
+    INPUT_KEYS = REQUIRED_KEYS
+    OUTPUT_KEYS = [
+        S.NEOADJUVANT_INDUCTION_CHEMOTHERAPY,
+        S.ADJUVANT_CHEMOTHERAPY,
+        S.PALLIATIVE_CHEMOTHERAPY,
+        S.ADJUVANT_TARGETED_THERAPY,
+        S.PALLIATIVE_TARGETED_THERAPY,
+        S.IMMUNOTHERAPY,
+    ]
 
     def calculate(self):
         for key1, key2 in [
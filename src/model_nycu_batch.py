@@ -0,0 +1,317 @@
+"""
+Column-wise counterpart of model_nycu, which calculates the derived columns of all rows at once
+Each calculator gives the same results as its per-row counterpart in model_nycu
+
+The input dataframe holds the attributes as str (NaN is ''), i.e. the same as the rows given to model_nycu
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Tuple, Callable
+from .schema import NycuOsccSchema
+from .dates import parse_date
+from .model_nycu import MatchICD, find_best_matching_key_val, split_tnm, get_ajcc_stage
+
+
+S = NycuOsccSchema
+
+
+class CalculateNycuOsccBatch:
+
+    def main(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()  # the calculators below modify the dataframe in place
+
+        CalculateDiagnosisAgeBatch().main(df)
+        CalculateSurvivalBatch().main(df)
+        MatchICDBatch().main(df)
+        CalculateLymphNodesBatch().main(df)
+        CalculateStageBatch().main(df)
+        SplitTNMBatch().main(df)
+        GetTherapyFlagsFromDrugsBatch().main(df)
+
+        return df
+
+
+class CalculateBatch:
+
+    REQUIRED_KEYS: List[str]
+    df: pd.DataFrame
+
+    def main(self, df: pd.DataFrame):
+        self.df = df
+
+        if not self.has_required_keys():
+            return
+
+        self.calculate()
+
+    def has_required_keys(self) -> bool:
+        for key in self.REQUIRED_KEYS:
+            if key not in self.df.columns:
+                return False
+        return True
+
+    def calculate(self):
+        raise NotImplementedError(f'The {self.__class__.__name__}.calculate() method must be implemented')
+
+
+class CalculateDiagnosisAgeBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.BIRTH_DATE,
+        S.CLINICAL_DIAGNOSIS_DATE,
+    ]
+
+    def calculate(self):
+        start = to_datetime(self.df[S.BIRTH_DATE])
+        end = to_datetime(self.df[S.CLINICAL_DIAGNOSIS_DATE])
+        self.df[S.CLINICAL_DIAGNOSIS_AGE] = (end - start) / pd.Timedelta(days=365)
+
+
+class CalculateSurvivalBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.SURGICAL_EXCISION_DATE,
+        S.INITIAL_TREATMENT_COMPLETION_DATE,
+        S.LAST_FOLLOW_UP_DATE,
+        S.RECUR_DATE_AFTER_INITIAL_TREATMENT,
+        S.EXPIRE_DATE,
+        S.CAUSE_OF_DEATH,
+    ]
+
+    t0: pd.Series
+    alive: pd.Series
+    cancer: pd.Series
+
+    def calculate(self):
+        self.set_t0()
+        self.set_alive()
+        self.check_cause_of_death()
+        self.disease_free_survival()
+        self.disease_specific_survival()
+        self.overall_survival()
+
+    def set_t0(self):
+        surgical_excision_date = self.df[S.SURGICAL_EXCISION_DATE]
+        t0 = surgical_excision_date.where(
+            surgical_excision_date != '', self.df[S.INITIAL_TREATMENT_COMPLETION_DATE])
+        self.t0 = to_datetime(t0)
+
+    def set_alive(self):
+        self.alive = self.df[S.EXPIRE_DATE] == ''
+        self.cancer = self.df[S.CAUSE_OF_DEATH].str.upper() == 'CANCER'
+
+    def check_cause_of_death(self):
+        causes = self.df[S.CAUSE_OF_DEATH]
+        invalid = ~self.alive & ~causes.isin(S.COLUMN_ATTRIBUTES[S.CAUSE_OF_DEATH]['options'])
+        if invalid.any():
+            cause = causes[invalid].iloc[0]
+            raise AssertionError(f'"{cause}" is not a valid cause of death')
+
+    def disease_free_survival(self):
+        recur_date = self.df[S.RECUR_DATE_AFTER_INITIAL_TREATMENT]
+        recurred = recur_date != ''
+
+        end = to_datetime(recur_date).where(recurred, self.get_alive_or_expire_date())
+        status = np.select(
+            condlist=[recurred, self.alive, self.cancer],
+            choicelist=['1:Recurred/Progressed', '0:DiseaseFree', '1:Recurred/Progressed'],
+            default='0:DiseaseFree')
+
+        self.set_duration_status(
+            end=end,
+            status=status,
+            duration_key=S.DISEASE_FREE_SURVIVAL_MONTHS,
+            status_key=S.DISEASE_FREE_SURVIVAL_STATUS)
+
+    def disease_specific_survival(self):
+        status = np.select(
+            condlist=[self.alive, self.cancer],
+            choicelist=['0:ALIVE OR DEAD TUMOR FREE', '1:DEAD WITH TUMOR'],
+            default='0:ALIVE OR DEAD TUMOR FREE')
+
+        self.set_duration_status(
+            end=self.get_alive_or_expire_date(),
+            status=status,
+            duration_key=S.DISEASE_SPECIFIC_SURVIVAL_MONTHS,
+            status_key=S.DISEASE_SPECIFIC_SURVIVAL_STATUS)
+
+    def overall_survival(self):
+        status = np.where(self.alive, '0:LIVING', '1:DECEASED')
+
+        self.set_duration_status(
+            end=self.get_alive_or_expire_date(),
+            status=status,
+            duration_key=S.OVERALL_SURVIVAL_MONTHS,
+            status_key=S.OVERALL_SURVIVAL_STATUS)
+
+    def get_alive_or_expire_date(self) -> pd.Series:
+        last_follow_up_date = to_datetime(self.df[S.LAST_FOLLOW_UP_DATE])
+        expire_date = to_datetime(self.df[S.EXPIRE_DATE])
+        return last_follow_up_date.where(self.alive, expire_date)
+
+    def set_duration_status(
+            self,
+            end: pd.Series,
+            status: np.ndarray,
+            duration_key: str,
+            status_key: str):
+
+        duration = (end - self.t0) / pd.Timedelta(days=30)  # Timedelta -> float
+        invalid = duration.isna() | (duration < 0.)
+
+        self.df[duration_key] = duration.astype(object).where(~invalid, '')
+        self.df[status_key] = pd.Series(status, index=self.df.index, dtype=object).where(~invalid, '')
+
+
+class MatchICDBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.TUMOR_DISEASE_ANATOMIC_SITE,
+    ]
+
+    def calculate(self):
+        sites = self.df[S.TUMOR_DISEASE_ANATOMIC_SITE]
+
+        self.df[S.ICD_O_3_SITE_CODE] = map_unique(
+            sites, lambda site: find_best_matching_key_val(dict_=MatchICD.ANATOMIC_SITE_TO_ICD_O_3_SITE_CODE, key=site)[1])
+
+        self.df[S.ICD_10_CLASSIFICATION] = map_unique(
+            sites, lambda site: find_best_matching_key_val(dict_=MatchICD.ANATOMIC_SITE_TO_ICD_10_CLASSIFICATION, key=site)[1])
+
+
+class CalculateStageBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.PATHOLOGICAL_TNM,
+    ]
+
+    def calculate(self):
+        tnms = self.df[S.PATHOLOGICAL_TNM]
+        results = map_unique(tnms, self.get_stage)
+
+        invalid = results.map(lambda r: r[0] == '')
+        for tnm, (_, error) in zip(tnms[invalid], results[invalid]):
+            if error is not None:
+                print(error)
+            print(f'WARNING! Invalid "{S.PATHOLOGICAL_TNM}": "{tnm}" for finding AJCC stage')
+
+        self.df[S.NEOPLASM_DISEASE_STAGE_AMERICAN_JOINT_COMMITTEE_ON_CANCER_CODE] = results.map(lambda r: r[0])
+
+    def get_stage(self, tnm: str) -> Tuple[str, Any]:
+        """
+        Returns the stage and the error of splitting the TNM (None if no error)
+        """
+        try:
+            t, n, m = split_tnm(tnm.replace('X', '0').replace('x', '0'))  # x is unknown, should be treated as 0
+            error = None
+        except Exception as e:
+            t, n, m = '', '', ''
+            error = e
+        return get_ajcc_stage(t=t, n=n, m=m), error
+
+
+class SplitTNMBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.CLINICAL_TNM,
+        S.PATHOLOGICAL_TNM,
+    ]
+
+    def calculate(self):
+        self.split(S.CLINICAL_TNM, keys=(S.CLINICAL_T, S.CLINICAL_N, S.CLINICAL_M))
+        self.split(S.PATHOLOGICAL_TNM, keys=(S.PATHOLOGICAL_T, S.PATHOLOGICAL_N, S.PATHOLOGICAL_M))
+
+    def split(self, tnm_key: str, keys: Tuple[str, str, str]):
+        results = map_unique(self.df[tnm_key], self._split_tnm)
+
+        for _, _, _, error in results[results.map(lambda r: r[3] is not None)]:
+            print(error)
+
+        for i, key in enumerate(keys):
+            self.df[key] = results.map(lambda r: r[i])
+
+    def _split_tnm(self, tnm: str) -> Tuple[str, str, str, Any]:
+        try:
+            return split_tnm(tnm) + (None, )
+        except Exception as e:
+            return '', '', '', e
+
+
+class CalculateLymphNodesBatch(CalculateBatch):
+
+    REQUIRED_KEYS = []  # all lymph node records are optional
+
+    def calculate(self):
+        self.add(S.LYMPH_NODE_LEVEL_I, parts=(S.LYMPH_NODE_LEVEL_IA, S.LYMPH_NODE_LEVEL_IB))
+        self.add(S.LYMPH_NODE_LEVEL_II, parts=(S.LYMPH_NODE_LEVEL_IIA, S.LYMPH_NODE_LEVEL_IIB))
+        self.add(S.TOTAL_LYMPH_NODE, parts=(S.LYMPH_NODE_RIGHT, S.LYMPH_NODE_LEFT))
+
+    def add(self, total_key: str, parts: Tuple[str, str]):
+        total = self.get(total_key)
+        a, b = self.get(parts[0]), self.get(parts[1])
+
+        rows = (total == '') & ((a != '') | (b != ''))  # already has total, skip adding the parts
+        if not rows.any():
+            return
+
+        a, b = map_unique(a[rows], parse_lymph_node), map_unique(b[rows], parse_lymph_node)
+        m = a.map(lambda x: x[0]) + b.map(lambda x: x[0])
+        n = a.map(lambda x: x[1]) + b.map(lambda x: x[1])
+
+        if total_key not in self.df.columns:
+            self.df[total_key] = ''
+        self.df.loc[rows, total_key] = m.astype(str) + '/' + n.astype(str)
+
+    def get(self, key: str) -> pd.Series:
+        if key in self.df.columns:
+            return self.df[key]
+        return pd.Series('', index=self.df.index, dtype=object)
+
+
+def parse_lymph_node(val: str) -> Tuple[int, int]:
+    """
+    '3/10' --> (3, 10), '' --> (0, 0)
+    """
+    if val == '':
+        return 0, 0
+    m, n = val.split('/')
+    return int(m), int(n)
+
+
+class GetTherapyFlagsFromDrugsBatch(CalculateBatch):
+
+    REQUIRED_KEYS = [
+        S.NEOADJUVANT_INDUCTION_CHEMOTHERAPY_DRUG,
+        S.ADJUVANT_CHEMOTHERAPY_DRUG,
+        S.PALLIATIVE_CHEMOTHERAPY_DRUG,
+        S.ADJUVANT_TARGETED_THERAPY_DRUG,
+        S.PALLIATIVE_TARGETED_THERAPY_DRUG,
+        S.IMMUNOTHERAPY_DRUG,
+    ]
+
+    def calculate(self):
+        for key1, key2 in [
+            (S.NEOADJUVANT_INDUCTION_CHEMOTHERAPY, S.NEOADJUVANT_INDUCTION_CHEMOTHERAPY_DRUG),
+            (S.ADJUVANT_CHEMOTHERAPY, S.ADJUVANT_CHEMOTHERAPY_DRUG),
+            (S.PALLIATIVE_CHEMOTHERAPY, S.PALLIATIVE_CHEMOTHERAPY_DRUG),
+            (S.ADJUVANT_TARGETED_THERAPY, S.ADJUVANT_TARGETED_THERAPY_DRUG),
+            (S.PALLIATIVE_TARGETED_THERAPY, S.PALLIATIVE_TARGETED_THERAPY_DRUG),
+            (S.IMMUNOTHERAPY, S.IMMUNOTHERAPY_DRUG),
+        ]:
+            no_drug = self.df[key2].isin(['', 'None'])
+            self.df[key1] = pd.Series(np.where(no_drug, 'False', 'True'), index=self.df.index, dtype=object)
+
+
+def map_unique(series: pd.Series, func: Callable[[Any], Any]) -> pd.Series:
+    """
+    Calls func only once for each unique value, as the columns have far fewer unique values than rows
+    """
+    mapping: Dict[Any, Any] = {val: func(val) for val in series.unique()}
+    return pd.Series([mapping[val] for val in series], index=series.index, dtype=object)
+
+
+def to_datetime(series: pd.Series) -> pd.Series:
+    """
+    Parses the str values in the same way as model_nycu.delta_t(), i.e. pd.to_datetime('') is NaT
+    """
+    return pd.to_datetime(map_unique(series, parse_date))
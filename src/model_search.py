@@ -0,0 +1,194 @@
+"""
+Searching the display text of the table, without scanning every cell in Python.
+"""
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Set, Optional, Tuple
+from .model_event import Event, CellsUpdated, RowsAppended, RowsDropped, TableSorted
+
+
+class SearchIndex:
+    """
+    Each cell is encoded as the code of its lowercase display text,
+        and a trigram index of the distinct texts gives the codes matching the query
+    The postings of each code are its cell positions in row-major order, so the matching cells of a query
+        are merged from the postings of its codes, and the next match is a binary search in them
+    Codes move with the rows as the model events arrive, and edited cells are re-encoded at the next search,
+        while the postings and the matching cells are rebuilt at the next search after any change
+    """
+
+    STALE = -1  # code of the cells to be re-encoded
+    NGRAM = 3
+    BLOCK_SIZE = 65536  # matching cells checked against the shown rows at a time
+
+    dataframe: Optional[pd.DataFrame]  # the dataframe described by the index, None if not built yet
+    column_index: Dict[str, int]
+    codes: np.ndarray  # code of each cell, rows x columns
+    has_stale: bool  # whether any code is STALE
+
+    words: List[str]  # code --> lowercase display text
+    vocabulary: Dict[str, int]  # lowercase display text --> code
+    ngrams: Dict[str, Set[int]]  # trigram --> codes of the words containing it
+
+    order: Optional[np.ndarray]  # flat cell positions sorted by code and then by position, None if outdated
+    bounds: np.ndarray  # order[bounds[c]:bounds[c + 1]] are the postings of code c
+    query: Optional[str]  # the last lowercase query
+    hits: np.ndarray  # sorted flat positions of the cells matching the last query
+
+    def __init__(self):
+        self.dataframe = None
+        self.clear_postings()
+
+    def apply_event(self, event: Event, dataframe: pd.DataFrame):
+        """
+        Called after the dataframe is changed, the index is built lazily at the next search
+        """
+        if self.dataframe is None:
+            return
+
+        if isinstance(event, CellsUpdated) and all(c in self.column_index for c in event.columns):
+            columns = [self.column_index[c] for c in event.columns]
+            self.codes[np.ix_(event.rows, columns)] = self.STALE
+            self.has_stale = True
+        elif isinstance(event, RowsAppended):
+            stale = np.full((event.last - event.first + 1, self.codes.shape[1]), self.STALE, dtype=self.codes.dtype)
+            self.codes = np.concatenate([self.codes, stale])
+            self.has_stale = True
+        elif isinstance(event, RowsDropped):
+            self.codes = np.delete(self.codes, event.rows, axis=0)
+        elif isinstance(event, TableSorted):
+            self.codes = self.codes[event.order]
+        else:  # the whole table is replaced
+            self.dataframe = None
+            return
+
+        self.dataframe = dataframe
+        self.clear_postings()
+
+    def find(
+            self,
+            dataframe: pd.DataFrame,
+            text: str,
+            start: Optional[Tuple[int, int]],
+            shown: Optional[np.ndarray] = None) -> Optional[Tuple[int, int]]:
+        """
+        The (row, column) position of the first match strictly after the start cell in row-major order,
+            or from the first cell if start is None
+        shown: boolean mask of the rows to search, e.g. the rows passing the filter, all rows if None
+        """
+        if dataframe is not self.dataframe or self.codes.shape != dataframe.shape:
+            self.build(dataframe=dataframe)  # e.g. the dataframe was replaced without any event
+        self.refresh_stale_cells()
+
+        hits = self.get_hits(text=text.lower())
+        ncols = self.codes.shape[1]
+        first = 0 if start is None else start[0] * ncols + start[1] + 1
+        hits = hits[np.searchsorted(hits, first):]
+        for i in range(0, len(hits), self.BLOCK_SIZE):  # in blocks to stop at the first shown match
+            block = hits[i:i + self.BLOCK_SIZE]
+            if shown is not None:
+                block = block[shown[block // ncols]]
+            if len(block) > 0:
+                row, column = divmod(int(block[0]), ncols)
+                return row, column
+
+        return None
+
+    def get_hits(self, text: str) -> np.ndarray:
+        if text == self.query:
+            return self.hits
+
+        if self.order is None:
+            flat = self.codes.reshape(-1)
+            self.order = np.argsort(flat, kind='stable')  # stable, so the postings of each code are sorted
+            self.bounds = np.searchsorted(flat[self.order], np.arange(len(self.words) + 1))
+
+        postings = [self.order[self.bounds[c]:self.bounds[c + 1]] for c in self.get_matching_codes(text=text)]
+        self.hits = np.sort(np.concatenate(postings)) if len(postings) > 0 else np.zeros(0, dtype=np.int64)
+        self.query = text
+        return self.hits
+
+    def clear_postings(self):
+        self.order = None
+        self.query = None
+
+    def build(self, dataframe: pd.DataFrame):
+        self.dataframe = dataframe
+        self.column_index = {c: i for i, c in enumerate(dataframe.columns)}
+        self.words = []
+        self.vocabulary = {}
+        self.ngrams = {}
+        self.clear_postings()
+
+        self.codes = np.empty(dataframe.shape, dtype=np.int32)
+        self.has_stale = False
+        for i in range(dataframe.shape[1]):
+            local_codes, uniques = pd.factorize(to_display_text(dataframe.iloc[:, i]).str.lower())
+            lookup = np.array([self.encode(word=w) for w in uniques], dtype=np.int32)
+            self.codes[:, i] = lookup[local_codes]
+
+    def refresh_stale_cells(self):
+        if not self.has_stale:
+            return
+        self.clear_postings()
+        rows, columns = np.nonzero(self.codes == self.STALE)
+        for r, c in zip(rows, columns):
+            val = self.dataframe.iat[r, c]
+            self.codes[r, c] = self.encode(word=('' if pd.isna(val) else str(val)).lower())
+        self.has_stale = False
+
+    def encode(self, word: str) -> int:
+        code = self.vocabulary.get(word)
+        if code is None:
+            code = len(self.words)
+            self.words.append(word)
+            self.vocabulary[word] = code
+            for ngram in get_ngrams(text=word, n=self.NGRAM):
+                self.ngrams.setdefault(ngram, set()).add(code)
+        return code
+
+    def get_matching_codes(self, text: str) -> np.ndarray:
+        if len(text) < self.NGRAM:
+            candidates = range(len(self.words))
+        else:
+            postings = sorted([self.ngrams.get(g, set()) for g in get_ngrams(text=text, n=self.NGRAM)], key=len)
+            candidates = set.intersection(*postings)
+        return np.array(sorted(c for c in candidates if text in self.words[c]), dtype=np.int32)
+
+
+def get_ngrams(text: str, n: int) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def find_all(
+        dataframe: pd.DataFrame,
+        text: str,
+        regex: bool = False,
+        case: bool = False,
+        columns: Optional[List[str]] = None) -> List[Tuple[int, int]]:
+    """
+    (row, column) positions of all cells whose display text contains the text (or the regex), in row-major order
+    Each column is searched in one vectorized pass over its distinct values
+    """
+    rows, positions = [], []
+    for i, column in enumerate(dataframe.columns):
+        if columns is not None and column not in columns:
+            continue
+        codes, uniques = pd.factorize(to_display_text(dataframe.iloc[:, i]))
+        matched = pd.Series(uniques, dtype=object).str.contains(text, case=case, regex=regex).to_numpy(dtype=bool)
+        hits = np.flatnonzero(matched[codes])
+        rows.append(hits)
+        positions.append(np.full(len(hits), i))
+
+    if len(rows) == 0:
+        return []
+    rows, positions = np.concatenate(rows), np.concatenate(positions)
+    order = np.lexsort((positions, rows))
+    return list(zip(rows[order].tolist(), positions[order].tolist()))
+
+
+def to_display_text(series: pd.Series) -> pd.Series:
+    """
+    The same as the GUI display, i.e. NaN is ''
+    """
+    return series.astype(object).where(series.notna(), '').map(str)
@@ -0,0 +1,85 @@
+"""
+Progress reporting and cancellation of long-running jobs, independent of the GUI.
+"""
+import time
+import threading
+from typing import Callable, NamedTuple, Optional
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Report(NamedTuple):
+
+    stage: str
+    done: int
+    total: int
+    bytes_written: int
+    eta: Optional[float]  # seconds, None if unknown
+
+    def __str__(self) -> str:
+        """
+        e.g. 'Writing mutation data (3/13), 12.3 MB written, about 20 s left'
+        """
+        text = f'{self.stage} ({self.done}/{self.total})'
+        if self.bytes_written > 0:
+            text += f', {to_megabytes(self.bytes_written)} written'
+        if self.eta is not None:
+            text += f', about {round(self.eta)} s left'
+        return text
+
+
+class Progress:
+    """
+    Shared by a job and whoever watches it, e.g. the progress dialog on the GUI thread
+    The job goes through stages, each of which has a number of items,
+        and Cancelled is raised at every report once cancel() has been called
+    """
+
+    callback: Optional[Callable[[Report], None]]  # called on the thread of the job
+
+    stage: str
+    total: int
+    start_time: float
+
+    def __init__(self, callback: Optional[Callable[[Report], None]] = None):
+        self.callback = callback
+        self.__cancelled = threading.Event()
+        self.stage, self.total, self.start_time = '', 0, time.monotonic()
+
+    def start(self, stage: str, total: int):
+        self.stage = stage
+        self.total = total
+        self.start_time = time.monotonic()
+        self.update(done=0)
+
+    def update(self, done: int, bytes_written: int = 0):
+        self.check()
+        if self.callback is None:
+            return
+
+        eta = None
+        if 0 < done < self.total:
+            elapsed = time.monotonic() - self.start_time
+            eta = elapsed / done * (self.total - done)
+        self.callback(Report(
+            stage=self.stage,
+            done=done,
+            total=self.total,
+            bytes_written=bytes_written,
+            eta=eta))
+
+    def check(self):
+        if self.is_cancelled():
+            raise Cancelled('Cancelled by the user')
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled.is_set()
+
+
+def to_megabytes(n: int) -> str:
+    return f'{n / 1024 ** 2:.1f} MB'
@@ -0,0 +1,122 @@
+"""
+Each schema is compiled once into a read-only lookup table of column specs,
+    so that hot paths don't walk the nested COLUMN_ATTRIBUTES dicts and compare type names for every call.
+"""
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Type
+from .schema import Schema
+from .dates import format_date
+
+
+def cast_str(val: str) -> str:
+    return val
+
+
+def cast_bool(val: str) -> bool:
+    return True if val.upper() == 'TRUE' else False
+
+
+def format_date_list(val: str) -> str:
+    """
+    '2020;2020-02;2020-03-01' --> '2020-01-01 ; 2020-02-01 ; 2020-03-01'
+    """
+    sep = ';'
+    dates = []
+    for x in val.split(sep):
+        xx = x.strip()
+        if not xx == '':
+            dates.append(format_date(xx))
+    return f' {sep} '.join(dates)
+
+
+CASTERS: Dict[str, Callable[[str], Any]] = {
+    'int': int,
+    'float': float,
+    'date': format_date,  # format it as str
+    'date_list': format_date_list,
+    'bool': cast_bool,
+}  # other types are all str
+
+CBIO_DATATYPES = {
+    'bool': 'BOOLEAN',
+    'int': 'NUMBER',
+    'float': 'NUMBER',
+}  # other types are 'STRING'
+
+
+class ColumnSpec(NamedTuple):
+
+    name: str
+    index: Optional[int]  # position in DISPLAY_COLUMNS, None if not displayed
+    type: str
+    cast: Callable[[str], Any]  # casts a non-empty str value
+    cbio_datatype: str
+    options: FrozenSet[str]
+    patient_level: bool
+    drop: bool
+
+
+class CompiledSchema:
+
+    columns: Mapping[str, ColumnSpec]  # columns in COLUMN_ATTRIBUTES
+
+    def __init__(self, schema: Type[Schema]):
+        display_index = {c: i for i, c in enumerate(schema.DISPLAY_COLUMNS)}
+        patient_level = set(schema.CBIO_PATIENT_LEVEL_COLUMNS)
+        drop = set(schema.CBIO_DROP_COLUMNS)
+
+        columns = {}
+        for name, attributes in schema.COLUMN_ATTRIBUTES.items():
+            columns[name] = self.__spec(
+                name=name,
+                type_=attributes['type'],
+                options=attributes.get('options', []),
+                index=display_index.get(name),
+                patient_level=name in patient_level,
+                drop=name in drop)
+        self.columns = MappingProxyType(columns)
+
+        self.__patient_level = frozenset(patient_level)
+        self.__drop = frozenset(drop)
+
+    def __spec(
+            self,
+            name: str,
+            type_: str,
+            options: List[Any],
+            index: Optional[int],
+            patient_level: bool,
+            drop: bool) -> ColumnSpec:
+        return ColumnSpec(
+            name=name,
+            index=index,
+            type=type_,
+            cast=CASTERS.get(type_, cast_str),
+            cbio_datatype=CBIO_DATATYPES.get(type_, 'STRING'),
+            options=frozenset(str(o) for o in options),
+            patient_level=patient_level,
+            drop=drop)
+
+    def __getitem__(self, column: str) -> ColumnSpec:
+        return self.columns[column]
+
+    def get(self, column: str) -> ColumnSpec:
+        """
+        Columns not in the schema, e.g. added for cBioPortal, are 'str' by default
+        """
+        spec = self.columns.get(column)
+        if spec is None:
+            spec = self.__spec(
+                name=column,
+                type_='str',
+                options=[],
+                index=None,
+                patient_level=column in self.__patient_level,
+                drop=column in self.__drop)
+        return spec
+
+
+@lru_cache(maxsize=None)
+def compile_schema(schema: Type[Schema]) -> CompiledSchema:
+    return CompiledSchema(schema)
@@ -1,13 +1,16 @@
+import numpy as np
 import pandas as pd
 from os.path import dirname
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QItemSelection, QItemSelectionModel
 from PyQt5.QtGui import QIcon, QKeySequence
-from PyQt5.QtWidgets import QVBoxLayout, QWidget, QTableWidget, QTableWidgetItem, QPushButton, QFileDialog, \
+from PyQt5.QtWidgets import QVBoxLayout, QWidget, QTableView, QPushButton, QFileDialog, \
     QMessageBox, QGridLayout, QDialog, QFormLayout, QDialogButtonBox, QComboBox, QScrollArea, QLineEdit, \
-    QShortcut
+    QShortcut, QCheckBox
 from typing import List, Optional, Any, Dict, Tuple, Type
 from .model import Model
+from .model_event import Event, CellsUpdated, RowsAppended, RowsDropped, TableSorted, TableReplaced
 from .schema import NycuOsccSchema, VghtcOsccSchema
+from .view_job import JobRunner
 
 
 class Elements:
@@ -22,6 +25,7 @@ class DefaultElements(Elements):
     BUTTON_NAME_TO_LABEL = {
         'import_clinical_data_table': 'Import Clinical Data Table',
         'save_clinical_data_table': 'Save Clinical Data Table',
+        'reprocess_changed_rows': 'Reprocess Changed Rows',
         'reprocess_table': 'Reprocess Table',
 
         'undo': 'Undo',
@@ -37,6 +41,7 @@ class DefaultElements(Elements):
     BUTTON_NAME_TO_POSITION = {
         'import_clinical_data_table': (0, 0),
         'save_clinical_data_table': (1, 0),
+        'reprocess_changed_rows': (3, 0),
         'reprocess_table': (4, 0),
 
         'undo': (0, 1),
@@ -57,6 +62,7 @@ class NycuOsccElements(Elements):
         'import_clinical_data_table': 'Import Clinical Data Table',
         'import_sequencing_table': 'Import Sequencing Table',
         'save_clinical_data_table': 'Save Clinical Data Table',
+        'reprocess_changed_rows': 'Reprocess Changed Rows',
         'reprocess_table': 'Reprocess Table',
 
         'undo': 'Undo',
@@ -69,12 +75,15 @@ class NycuOsccElements(Elements):
         'add_new_sample': 'Add New Sample',
         'edit_sample': 'Edit Sample',
         'edit_cell': 'Edit Cell',
+        'find_all': 'Find All',
+        'filter': 'Filter',
         'export_cbioportal_study': 'Export cBioPortal Study',
     }
     BUTTON_NAME_TO_POSITION = {
         'import_clinical_data_table': (0, 0),
         'import_sequencing_table': (1, 0),
         'save_clinical_data_table': (2, 0),
+        'reprocess_changed_rows': (4, 0),
         'reprocess_table': (5, 0),
 
         'undo': (0, 1),
@@ -87,11 +96,14 @@ class NycuOsccElements(Elements):
         'add_new_sample': (0, 2),
         'edit_sample': (1, 2),
         'edit_cell': (2, 2),
+        'find_all': (3, 2),
+        'filter': (4, 2),
         'export_cbioportal_study': (5, 2),
     }
     SHORTCUT_NAME_TO_KEY_SEQUENCE = {
         'control_s': 'Ctrl+S',
         'control_f': 'Ctrl+F',
+        'control_shift_f': 'Ctrl+Shift+F',
         'control_z': 'Ctrl+Z',
         'control_y': 'Ctrl+Y',
     }
@@ -102,6 +114,7 @@ class VghtcOsccElements(Elements):
     BUTTON_NAME_TO_LABEL = {
         'import_clinical_data_table': 'Import Clinical Data Table',
         'save_clinical_data_table': 'Save Clinical Data Table',
+        'reprocess_changed_rows': 'Reprocess Changed Rows',
         'reprocess_table': 'Reprocess Table',
 
         'undo': 'Undo',
@@ -113,10 +126,13 @@ class VghtcOsccElements(Elements):
 
         'add_new_sample': 'Add New Sample',
         'edit_sample': 'Edit Sample',
+        'find_all': 'Find All',
+        'filter': 'Filter',
     }
     BUTTON_NAME_TO_POSITION = {
         'import_clinical_data_table': (0, 0),
         'save_clinical_data_table': (1, 0),
+        'reprocess_changed_rows': (4, 0),
         'reprocess_table': (5, 0),
 
         'undo': (0, 1),
@@ -128,66 +144,233 @@ class VghtcOsccElements(Elements):
 
         'add_new_sample': (0, 2),
         'edit_sample': (1, 2),
+        'find_all': (2, 2),
+        'filter': (3, 2),
     }
 
 
-class Table(QTableWidget):
+class DataFrameTableModel(QAbstractTableModel):
+    """
+    Virtual table model that reads cells directly from `Model.dataframe` on demand,
+    so only the cells in the visible viewport are ever converted for display
+
+    The shape known by the views is cached, because Qt requires the row count to change
+    only between the begin...() and end...() calls of row insertion and removal
+
+    When the model has a row filter, only the filtered rows are shown,
+    and view rows are mapped to the positions of the rows in the dataframe
+
+    Model events arrive after `Model.dataframe` is changed, so cells are read from the dataframe known by the views,
+    which is swapped for the new one between the "about to" and the "done" notifications of each change
+    """
 
     model: Model
 
+    dataframe: pd.DataFrame  # the dataframe known by the views
+    nrows: int
+    columns: List[str]
+    rows: Optional[np.ndarray]  # dataframe positions of the view rows, None if not filtered
+
     def __init__(self, model: Model):
         super().__init__()
         self.model = model
-        self.refresh_table()
+        self.dataframe = self.model.dataframe
+        self.nrows = len(self.model.dataframe)
+        self.columns = self.model.dataframe.columns.to_list()
+        self.rows = None
 
-    def refresh_table(self):
-        df = self.model.get_dataframe()
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.nrows
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        df = self.dataframe
+        row = self.to_dataframe_row(index.row())
+        if row >= len(df) or index.column() >= len(df.columns):
+            return None
+        return str_(df.iat[row, index.column()])
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section] if section < len(self.columns) else None
+        return str(self.to_dataframe_row(section) + 1)  # row numbers start from 1, as in QTableWidget
 
-        self.setRowCount(len(df.index))
-        self.setColumnCount(len(df.columns))
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable  # not editable, i.e. user cannot edit it
+
+    def reset(self):
+        self.beginResetModel()
+        self.dataframe = self.model.dataframe
+        self.rows = self.model.get_filtered_rows()
+        self.nrows = len(self.model.dataframe) if self.rows is None else len(self.rows)
+        self.columns = self.model.dataframe.columns.to_list()
+        self.endResetModel()
+
+    def is_filtered(self) -> bool:
+        return self.rows is not None
+
+    def to_dataframe_row(self, row: int) -> int:
+        return row if self.rows is None or row >= len(self.rows) else int(self.rows[row])
+
+    def to_view_row(self, row: int) -> Optional[int]:
+        """
+        None if the dataframe row is not shown by the filter
+        """
+        if self.rows is None:
+            return row
+        i = int(np.searchsorted(self.rows, row))
+        return i if i < len(self.rows) and self.rows[i] == row else None
+
+    def cells_changed(self, rows: List[int], columns: List[str]):
+        """
+        Emits dataChanged for each row, spanning only the changed columns
+        """
+        self.dataframe = self.model.dataframe
+        if len(rows) == 0 or len(columns) == 0:
+            return
+        j = [self.columns.index(c) for c in columns]
+        first, last = min(j), max(j)
+        for row in sorted(set(rows)):
+            self.dataChanged.emit(self.index(row, first), self.index(row, last), [Qt.DisplayRole])
+
+    def rows_inserted(self, first: int, last: int):
+        self.beginInsertRows(QModelIndex(), first, last)
+        self.dataframe = self.model.dataframe
+        self.nrows += last - first + 1
+        self.endInsertRows()
+
+    def rows_removed(self, rows: List[int]):
+        """
+        Emits rowsRemoved for each contiguous block of rows, from the bottom up so that the rows above do not move
+        Until the last block is removed, view rows are mapped to the rows of the previous dataframe
+        """
+        remaining = np.arange(self.nrows)  # rows of the previous dataframe
+        for first, last in reversed(to_ranges(rows)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            remaining = np.delete(remaining, np.s_[first:last + 1])
+            self.rows = remaining
+            self.nrows -= last - first + 1
+            self.endRemoveRows()
+        self.dataframe = self.model.dataframe  # the same rows as the remaining rows of the previous dataframe
+        self.rows = None
+
+    def rows_sorted(self, order: np.ndarray):
+        """
+        Row i after sorting was row order[i] before sorting,
+            and the persistent indexes, e.g. the current cell and the selection, move with their rows
+        """
+        self.layoutAboutToBeChanged.emit()
+        self.dataframe = self.model.dataframe
+        new_rows = np.empty(len(order), dtype=int)
+        new_rows[order] = np.arange(len(order))
+        before = self.persistentIndexList()
+        after = [
+            self.index(int(new_rows[i.row()]), i.column()) if i.row() < len(new_rows) else QModelIndex()
+            for i in before
+        ]
+        self.changePersistentIndexList(before, after)
+        self.layoutChanged.emit()
 
-        self.setHorizontalHeaderLabels(df.columns)
 
-        for i in range(len(df.index)):
-            for j in range(len(df.columns)):
-                value = df.iloc[i, j]
-                item = QTableWidgetItem(str_(value))
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # makes the item immutable, i.e. user cannot edit it
-                self.setItem(i, j, item)
+class Table(QTableView):
 
+    RESIZE_CONTENTS_PRECISION = 100  # only the first N rows are measured to resize the columns
+
+    model: Model
+    table_model: DataFrameTableModel
+
+    def __init__(self, model: Model):
+        super().__init__()
+        self.model = model
+        self.table_model = DataFrameTableModel(model=model)
+        self.setModel(self.table_model)
+        self.horizontalHeader().setResizeContentsPrecision(self.RESIZE_CONTENTS_PRECISION)
+        self.refresh_table()
+        self.model.add_listener(self.apply_event)
+
+    def refresh_table(self):
+        self.table_model.reset()
         self.resizeColumnsToContents()
 
+    def apply_event(self, event: Event):
+        """
+        Applies only the change described by the model event, instead of refreshing the whole table
+        Filtered rows may come and go with any change, so the filtered table is reset
+        """
+        if self.table_model.is_filtered():
+            self.table_model.reset()
+        elif isinstance(event, CellsUpdated):
+            self.table_model.cells_changed(rows=event.rows, columns=event.columns)
+        elif isinstance(event, RowsAppended):
+            self.table_model.rows_inserted(first=event.first, last=event.last)
+        elif isinstance(event, RowsDropped):
+            self.table_model.rows_removed(rows=event.rows)
+        elif isinstance(event, TableSorted):
+            self.table_model.rows_sorted(order=event.order)
+        elif isinstance(event, TableReplaced):
+            self.refresh_table()
+
+    def get_selected_indexes(self) -> List[QModelIndex]:
+        return self.selectionModel().selectedIndexes()
+
     def get_selected_rows(self) -> List[int]:
         ret = []
-        for item in self.selectedItems():
-            ith_row = item.row()
+        for index in self.get_selected_indexes():
+            ith_row = self.table_model.to_dataframe_row(index.row())
             if ith_row not in ret:
                 ret.append(ith_row)
         return ret
 
     def get_selected_columns(self) -> List[str]:
         ret = []
-        for item in self.selectedItems():
-            ith_col = item.column()
-            column = self.horizontalHeaderItem(ith_col).text()
+        for index in self.get_selected_indexes():
+            column = self.table_model.columns[index.column()]
             if column not in ret:
                 ret.append(column)
         return ret
 
     def get_selected_cells(self) -> List[Tuple[int, str]]:
         ret = []
-        for item in self.selectedItems():
-            ith_row = item.row()
-            ith_col = item.column()
-            column = self.horizontalHeaderItem(ith_col).text()
-            ret.append((ith_row, column))
+        for index in self.get_selected_indexes():
+            column = self.table_model.columns[index.column()]
+            ret.append((self.table_model.to_dataframe_row(index.row()), column))
         return ret
 
     def select_cell(self, index: int, column: str):
-        ith_row = index
-        columns = [self.horizontalHeaderItem(i).text() for i in range(self.columnCount())]
-        ith_col = columns.index(column)
-        self.setCurrentCell(ith_row, ith_col)
+        ith_row = self.table_model.to_view_row(index)
+        ith_col = self.table_model.columns.index(column)
+        if ith_row is not None:
+            self.setCurrentIndex(self.table_model.index(ith_row, ith_col))
+
+    def select_cells(self, cells: List[Tuple[int, str]]):
+        """
+        Highlights all the cells, with consecutive rows of the same column selected as one range
+        """
+        cells = [(self.table_model.to_view_row(row), column) for row, column in cells]
+        cells = [(row, column) for row, column in cells if row is not None]
+        if len(cells) == 0:
+            return
+
+        column_to_rows = {}
+        for row, column in cells:
+            column_to_rows.setdefault(self.table_model.columns.index(column), []).append(row)
+
+        selection = QItemSelection()
+        for ith_col, rows in column_to_rows.items():
+            for first, last in to_ranges(rows):
+                selection.select(self.table_model.index(first, ith_col), self.table_model.index(last, ith_col))
+
+        row, column = cells[0]
+        current = self.table_model.index(row, self.table_model.columns.index(column))
+        self.selectionModel().setCurrentIndex(current, QItemSelectionModel.NoUpdate)
+        self.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        self.scrollTo(current)
 
 
 class View(QWidget):
@@ -262,18 +445,34 @@ class View(QWidget):
         self.dialog_edit_sample = DialogEditSample(self)
         self.dialog_project_info = DialogStudyInfo(self)
         self.dialog_find = DialogFind(self)
+        self.dialog_find_all = DialogFindAll(self)
+        self.dialog_filter = DialogFilter(self)
         self.dialog_edit_cell = DialogEditCell(self)
+        self.run_job = JobRunner(self, on_error=lambda msg: self.message_box_error(msg=msg))
 
     def refresh_table(self):
         self.table.refresh_table()
+        self.refresh_title()
 
+    def refresh_title(self):
+        """
+        The table itself is kept up to date by the model events, so actions only need to refresh the title
+        """
         suffix = ''
-        df = self.model.get_dataframe()
-        if len(df) > 0:  # only show suffix if there is data
+        if len(self.model.dataframe) > 0:  # only show suffix if there is data
             file = f' - {self.model.clinical_data_file}' if self.model.clinical_data_file is not None else ''
             state = ' (saved)' if self.model.is_file_saved() else ' (unsaved)'
             suffix = file + state
 
+        rows = self.model.get_filtered_rows()
+        if rows is not None:
+            suffix += f' [Filter: {len(rows)} of {len(self.model.dataframe)} rows]'
+
+        memory, disk = self.model.get_history_usage()
+        if memory + disk > 0:
+            suffix += f' [Undo History: {to_size(memory)}'
+            suffix += f' + {to_size(disk)} on disk]' if disk > 0 else ']'
+
         self.setWindowTitle(f'{self.TITLE} ({self.model.schema.NAME}){suffix}')
 
     def get_selected_rows(self) -> List[int]:
@@ -288,7 +487,14 @@ class View(QWidget):
     def select_cell(self, index: int, column: str):
         self.table.select_cell(index=index, column=column)
 
+    def select_cells(self, cells: List[Tuple[int, str]]):
+        self.table.select_cells(cells=cells)
+
     def closeEvent(self, event):
+        if self.run_job.is_running():
+            event.ignore()
+            return
+
         if not self.model.is_file_saved():
             reply = self.message_box_unsaved_file(msg='You have unsaved changes. Do you want to save them?')
             if reply == QMessageBox.Cancel:
@@ -297,7 +503,11 @@ class View(QWidget):
                 event.accept()
             elif reply == QMessageBox.Save:
                 self.shortcut_control_s.activated.emit()
-                event.accept()
+                if self.run_job.is_running():  # close again after saving, which asks again if the save failed
+                    event.ignore()
+                    self.run_job.call_when_idle(self.close)
+                else:
+                    event.accept()
 
 
 #
@@ -543,13 +753,31 @@ class DialogEditSample(DialogComboBoxes):
 class DialogStudyInfo(DialogComboBoxes):
 
     WIDTH, HEIGHT = 600, 300
+    INCREMENTAL_TITLE = 'Only rewrite the files whose inputs changed since the last export'
+
+    incremental_check_box: QCheckBox
+
+    def __init__(self, view: View):
+        super().__init__(view=view)
+        self.incremental_check_box = QCheckBox(self.INCREMENTAL_TITLE, parent=self.dialog)
+        self.main_layout.insertWidget(1, self.incremental_check_box)  # above the button box
 
     def init_field_to_options(self):
         self.field_to_options = self.view.model.schema.CBIO_STUDY_INFO_FIELD_TO_OPTIONS
 
-    def __call__(self) -> Optional[Dict[str, str]]:
+    def __call__(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the study info and whether to export incrementally, e.g. {'cancer_study_identifier': ..., 'incremental': False}
+        The full export is the default every time
+        """
         self.set_combo_box_default_text()
-        return self.get_output_dict() if self.dialog.exec_() == QDialog.Accepted else None
+        self.incremental_check_box.setChecked(False)
+        if self.dialog.exec_() == QDialog.Accepted:
+            ret = self.get_output_dict()
+            ret['incremental'] = self.incremental_check_box.isChecked()
+            return ret
+        else:
+            return None
 
 
 #
@@ -611,6 +839,61 @@ class DialogFind(DialogLineEdits):
             return None
 
 
+class DialogFindAll(DialogLineEdits):
+
+    LINE_TITLES = [
+        'Find All:',
+    ]
+    LINE_DEFAULTS = [
+        '',
+    ]
+    CHECK_BOX_TITLES = {
+        'regex': 'Regular Expression',
+        'case': 'Match Case',
+        'selected_columns': 'Only Selected Columns',
+    }
+
+    check_boxes: Dict[str, QCheckBox]
+
+    def __init__(self, view: View):
+        super().__init__(view=view)
+        self.check_boxes = {}
+        for i, (key, title) in enumerate(self.CHECK_BOX_TITLES.items()):
+            check_box = QCheckBox(parent=self.dialog)
+            self.check_boxes[key] = check_box
+            self.layout.insertRow(len(self.LINE_TITLES) + i, title, check_box)  # above the button box
+
+    def __call__(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the text and the check box states, e.g. {'text': 'abc', 'regex': False, ...}
+        """
+        if self.dialog.exec_() == QDialog.Accepted:
+            ret = {'text': self.line_edits[0].text()}
+            ret.update({key: check_box.isChecked() for key, check_box in self.check_boxes.items()})
+            return ret
+        else:
+            return None
+
+
+class DialogFilter(DialogLineEdits):
+
+    LINE_TITLES = [
+        'Filter (e.g. Sex == Male and Patient Weight (Kg) > 60):',
+    ]
+    LINE_DEFAULTS = [
+        '',
+    ]
+
+    def __call__(self) -> Optional[str]:
+        """
+        The previous query is kept, so that the filter can be refined
+        """
+        if self.dialog.exec_() == QDialog.Accepted:
+            return self.line_edits[0].text()
+        else:
+            return None
+
+
 class DialogEditCell(DialogLineEdits):
 
     LINE_TITLES = [
@@ -638,6 +921,31 @@ def str_(value: Any) -> str:
     return '' if pd.isna(value) else str(value)
 
 
+def to_ranges(rows: List[int]) -> List[Tuple[int, int]]:
+    """
+    [5, 1, 2, 3] -> [(1, 3), (5, 5)]
+    """
+    ret = []
+    for row in sorted(set(rows)):
+        if len(ret) > 0 and ret[-1][1] == row - 1:
+            ret[-1] = (ret[-1][0], row)
+        else:
+            ret.append((row, row))
+    return ret
+
+
+def to_size(nbytes: int) -> str:
+    """
+    1536 -> '1.5 KB'
+    """
+    size = float(nbytes)
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
 def to_title(s: str) -> str:
     """
     'Title of good and evil' -> 'Title of Good and Evil'
@@ -0,0 +1,183 @@
+"""
+Running long operations off the GUI thread, so the window keeps repainting and responding.
+"""
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QWidget, QProgressDialog, QShortcut
+from typing import Any, Callable, List, Optional
+from .progress import Progress, Report, Cancelled
+
+
+class JobSignals(QObject):
+
+    progressed = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+class Job(QRunnable):
+
+    work: Callable[[Progress], Any]
+    signals: JobSignals
+    progress: Progress
+
+    def __init__(self, work: Callable[[Progress], Any]):
+        super().__init__()
+        self.setAutoDelete(False)  # kept by the runner until the result is handled
+        self.work = work
+        self.signals = JobSignals()
+        self.progress = Progress(callback=self.signals.progressed.emit)
+
+    def run(self):
+        try:
+            result = self.work(self.progress)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class JobRunner(QObject):
+    """
+    Runs one job at a time in the thread pool, behind a modal progress dialog with a cancel button
+    The work must not change the model or the view, instead its result is handed to `done` on the GUI thread,
+        e.g. the commit of Model.prepare_reprocess_table()
+    A job cancelled by the user never calls `done`, so the model is unchanged
+    Input is blocked from the start of the job, not only once the dialog shows up,
+        because edits change the dataframe in place while the work may still be reading it
+    Jobs whose work never checks the progress, e.g. reading a file in one go, have no cancel button
+    """
+
+    MIN_DURATION = 500  # ms, quick jobs finish before the progress dialog shows up
+
+    widget: QWidget
+    on_error: Callable[[str], None]
+    pool: QThreadPool
+
+    job: Optional[Job]
+    dialog: Optional[QProgressDialog]
+    done: Optional[Callable[[Any], None]]
+    cancellable: bool
+    blocked: List[QObject]
+    idle_callbacks: List[Callable[[], None]]
+
+    def __init__(self, parent: QWidget, on_error: Callable[[str], None]):
+        super().__init__(parent)
+        self.widget = parent
+        self.on_error = on_error
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.job = None
+        self.dialog = None
+        self.done = None
+        self.cancellable = True
+        self.blocked = []
+        self.idle_callbacks = []
+
+    def __call__(
+            self,
+            label: str,
+            work: Callable[[Progress], Any],
+            done: Callable[[Any], None],
+            cancellable: bool = True):
+        if self.is_running():
+            self.on_error('Another operation is still running')
+            return
+
+        self.job = Job(work=work)
+        self.done = done
+        self.cancellable = cancellable
+
+        self.dialog = QProgressDialog(label, 'Cancel', 0, 0, self.widget)  # busy indicator until the first progress
+        self.dialog.setWindowTitle('ClinUI')
+        self.dialog.setWindowModality(Qt.ApplicationModal)
+        self.dialog.setMinimumDuration(self.MIN_DURATION)
+        self.dialog.setAutoReset(False)
+        self.dialog.setAutoClose(False)
+        if not cancellable:
+            self.dialog.setCancelButton(None)
+        self.dialog.canceled.connect(self.__cancel)
+
+        self.job.signals.progressed.connect(self.__progressed)
+        self.job.signals.finished.connect(self.__finished)
+        self.job.signals.failed.connect(self.__failed)
+        self.__block_input()
+        self.pool.start(self.job)
+
+    def is_running(self) -> bool:
+        return self.job is not None
+
+    def call_when_idle(self, callback: Callable[[], None]):
+        """
+        e.g. closing the window after the save job is done
+        """
+        if self.is_running():
+            self.idle_callbacks.append(callback)
+        else:
+            callback()
+
+    def wait(self):
+        """
+        Blocks until the job is done, only the queued results are left to be handled by the event loop
+        """
+        self.pool.waitForDone()
+
+    @pyqtSlot()
+    def __cancel(self):
+        if self.job is not None and self.cancellable:  # e.g. Esc is pressed without the cancel button
+            self.job.progress.cancel()
+            self.dialog.setLabelText('Cancelling...')
+
+    @pyqtSlot(object)
+    def __progressed(self, report: Report):
+        if self.dialog is None or self.job.progress.is_cancelled():
+            return
+        self.dialog.setMaximum(report.total)  # 0 is a busy indicator
+        self.dialog.setValue(report.done)
+        self.dialog.setLabelText(str(report))
+
+    @pyqtSlot(object)
+    def __finished(self, result: Any):
+        cancelled, done = self.job.progress.is_cancelled(), self.done
+        self.__reset()
+        if not cancelled:
+            try:
+                done(result)
+            except Exception as e:
+                self.on_error(repr(e))
+        self.__call_idle_callbacks()
+
+    @pyqtSlot(object)
+    def __failed(self, error: Exception):
+        self.__reset()
+        if not isinstance(error, Cancelled):
+            self.on_error(repr(error))
+        self.__call_idle_callbacks()
+
+    def __block_input(self):
+        """
+        Disables the widgets and shortcuts of the window, but not the progress dialog with its cancel button
+        """
+        widgets = [w for w in self.widget.findChildren(QWidget, options=Qt.FindDirectChildrenOnly) if not w.isWindow()]
+        shortcuts = self.widget.findChildren(QShortcut, options=Qt.FindDirectChildrenOnly)
+        self.blocked = [o for o in widgets + shortcuts if o.isEnabled()]
+        for o in self.blocked:
+            o.setEnabled(False)
+
+    def __unblock_input(self):
+        for o in self.blocked:
+            o.setEnabled(True)
+        self.blocked = []
+
+    def __reset(self):
+        self.__unblock_input()
+        self.dialog.canceled.disconnect(self.__cancel)
+        self.dialog.close()
+        self.dialog.deleteLater()
+        self.dialog = None
+        self.job = None
+        self.done = None
+
+    def __call_idle_callbacks(self):
+        callbacks, self.idle_callbacks = self.idle_callbacks, []
+        for callback in callbacks:
+            callback()
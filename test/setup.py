@@ -1,4 +1,5 @@
 import os
+import random
 import shutil
 import unittest
 import pandas as pd
@@ -13,6 +14,45 @@ def get_dirs(py_path: str) -> Tuple[str, str]:
     return indir, outdir
 
 
+def get_str_df(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random attributes covering the branches of model_nycu, everything is str and NaN is ''
+    """
+    S = NycuOsccSchema
+    rand = random.Random(seed)
+    dates = ['2015-01-06', '2019/03/02', '2020-01-01', '2021-7-15', '', '2018-12-31', '2022-02-28']
+    rows = []
+    for i in range(n):
+        alive = rand.random() < 0.6
+        row = {c: '' for c in S.DISPLAY_COLUMNS}
+        row.update({
+            S.SAMPLE_ID: f'S{i:05d}',
+            S.SEX: rand.choice(['Male', 'Female', '']),
+            S.PATIENT_WEIGHT: rand.choice(['60', '70.5', '']),
+            S.BIRTH_DATE: rand.choice(['1950-01-01', '1960/5/6', '']),
+            S.CLINICAL_DIAGNOSIS_DATE: rand.choice(dates),
+            S.SURGICAL_EXCISION_DATE: rand.choice(dates),
+            S.INITIAL_TREATMENT_COMPLETION_DATE: rand.choice(dates),
+            S.LAST_FOLLOW_UP_DATE: rand.choice(dates),
+            S.RECUR_DATE_AFTER_INITIAL_TREATMENT: rand.choice(['', '', '2021-01-01', '2014-01-01']),
+            S.EXPIRE_DATE: '' if alive else rand.choice(dates[:4] + ['2023-03-03']),
+            S.CAUSE_OF_DEATH: '' if alive else rand.choice(['Cancer', 'Other Disease', 'Uncertain']),
+            S.TUMOR_DISEASE_ANATOMIC_SITE: rand.choice(['Right Tongue', 'left tongue', 'Tongue base', '', 'Lip']),
+            S.CLINICAL_TNM: rand.choice(['cT1N0M0', 'T2N1M0', 'pT4aN2bM0', '', 'garbage']),
+            S.PATHOLOGICAL_TNM: rand.choice(['pT1N0M0', 'T2N1M0', 'pT4aN2bM0', 'TisN0M0', 'TxN0M0', '', 'T4bN3M1']),
+            S.LYMPH_NODE_LEVEL_IA: rand.choice(['', '1/3', '0/2']),
+            S.LYMPH_NODE_LEVEL_IB: rand.choice(['', '2/5']),
+            S.LYMPH_NODE_LEVEL_I: rand.choice(['', '', '4/4']),
+            S.LYMPH_NODE_LEVEL_IIA: rand.choice(['', '1/1']),
+            S.LYMPH_NODE_RIGHT: rand.choice(['', '3/10']),
+            S.LYMPH_NODE_LEFT: rand.choice(['', '0/12']),
+            S.ADJUVANT_CHEMOTHERAPY_DRUG: rand.choice(['', 'None', 'Cisplatin']),
+            S.IMMUNOTHERAPY_DRUG: rand.choice(['', 'Pembrolizumab']),
+        })
+        rows.append(row)
+    return pd.DataFrame(rows, dtype=object)
+
+
 class TestCase(unittest.TestCase):
 
     def set_up(self, py_path: str):
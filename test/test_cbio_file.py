@@ -0,0 +1,99 @@
+import os
+from src.cbio_file import open_for_writing, staging_directory
+from .setup import TestCase
+
+
+class TestOpenForWriting(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.path = f'{self.outdir}/data.txt'
+        with open(self.path, 'w') as fh:
+            fh.write('old')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_atomic(self):
+        with open_for_writing(self.path, atomic=True) as fh:
+            fh.write('Café\n')
+            self.assertEqual('old', self.read())
+        self.assertEqual('Café\n', self.read())
+        self.assertListEqual(['data.txt'], os.listdir(self.outdir))
+
+    def test_atomic_failure_keeps_old_file(self):
+        with self.assertRaises(ValueError):
+            with open_for_writing(self.path, atomic=True) as fh:
+                fh.write('half-written')
+                raise ValueError
+        self.assertEqual('old', self.read())
+        self.assertListEqual(['data.txt'], os.listdir(self.outdir))
+
+    def test_not_atomic(self):
+        with open_for_writing(self.path) as fh:
+            fh.write('new')
+            fh.flush()
+            self.assertEqual('new', self.read())
+
+    def read(self) -> str:
+        with open(self.path, encoding='utf-8') as fh:
+            return fh.read()
+
+
+class TestStagingDirectory(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.study_dir = f'{self.outdir}/study'
+        os.makedirs(f'{self.study_dir}/case_lists')
+        self.write(f'{self.study_dir}/meta_study.txt', 'old')
+        self.write(f'{self.study_dir}/case_lists/cases_all.txt', 'old')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_swapped_in(self):
+        with staging_directory(outdir=self.study_dir) as staging_dir:
+            self.write(f'{staging_dir}/meta_study.txt', 'new')
+            self.assertEqual('old', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertEqual('new', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertFalse(os.path.exists(f'{self.study_dir}/case_lists'))
+        self.assertListEqual(['study'], os.listdir(self.outdir))
+
+    def test_failure_keeps_previous_study(self):
+        with self.assertRaises(ValueError):
+            with staging_directory(outdir=self.study_dir) as staging_dir:
+                self.write(f'{staging_dir}/meta_study.txt', 'half-written')
+                raise ValueError
+        self.assertEqual('old', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertListEqual(['study'], os.listdir(self.outdir))
+
+    def test_seed(self):
+        with staging_directory(outdir=self.study_dir, seed=True) as staging_dir:
+            self.assertEqual('old', self.read(f'{staging_dir}/case_lists/cases_all.txt'))
+            os.remove(f'{staging_dir}/meta_study.txt')
+            self.write(f'{staging_dir}/meta_study.txt', 'new')
+            self.assertEqual('old', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertEqual('new', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertEqual('old', self.read(f'{self.study_dir}/case_lists/cases_all.txt'))
+
+    def test_new_outdir(self):
+        with staging_directory(outdir=f'{self.outdir}/new/study') as staging_dir:
+            self.write(f'{staging_dir}/meta_study.txt', 'new')
+        self.assertEqual('new', self.read(f'{self.outdir}/new/study/meta_study.txt'))
+
+    def test_recover_from_crash_during_swap(self):
+        os.rename(self.study_dir, f'{self.outdir}/.study.staging-abc-previous')
+        os.makedirs(f'{self.outdir}/.study.staging-abc')
+        with staging_directory(outdir=self.study_dir, seed=True):
+            pass
+        self.assertEqual('old', self.read(f'{self.study_dir}/meta_study.txt'))
+        self.assertListEqual(['study'], os.listdir(self.outdir))
+
+    def write(self, path: str, text: str):
+        with open(path, 'w') as fh:
+            fh.write(text)
+
+    def read(self, path: str) -> str:
+        with open(path) as fh:
+            return fh.read()
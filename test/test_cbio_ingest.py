@@ -1,6 +1,15 @@
+import os
+import io
+import contextlib
+from unittest import mock
 import pandas as pd
 from os.path import exists
+from typing import List, Optional
 from src.cbio_ingest import cBioIngest, WriteStudyInfo
+from src.cbio_write_mutation_data import ReadAndProcessMaf
+from src.maf_cache import MafCache, get_fingerprint
+from src.model import ExportCbioportalStudy
+from src.progress import Progress, Cancelled
 from .setup import TestCase
 
 
@@ -142,3 +151,128 @@ tags_file: tags.json
         self.assertEqual(expected, actual)
 
         self.assertTrue(exists(f'{self.outdir}/tags.json'))
+
+
+class TestIncrementalExport(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.maf_dir = f'{self.outdir}/maf_dir'
+        self.study_dir = f'{self.outdir}/study'
+        os.makedirs(self.maf_dir)
+        os.makedirs(self.study_dir)
+
+        sample_ids = ['S1', 'S2']
+        for sample_id in sample_ids:
+            self.write_maf(sample_id=sample_id, gene='TP53')
+
+        self.clinical_data_df = pd.DataFrame(
+            {c: pd.Series([None] * len(sample_ids), dtype=object) for c in self.schema.COLUMN_ATTRIBUTES})
+        self.clinical_data_df['Patient ID'] = sample_ids
+        self.clinical_data_df['Sample ID'] = sample_ids
+        self.clinical_data_df['Sex'] = 'Male'
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_unchanged(self):
+        self.assertListEqual([], self.export())
+        self.assertListEqual(['study_info', 'clinical_data', 'mutation_data', 'case_lists'], self.export())
+
+    def test_clinical_data_changed(self):
+        self.export()
+        self.clinical_data_df.loc[0, 'Sex'] = 'Female'
+        self.assertListEqual(['study_info', 'mutation_data', 'case_lists'], self.export())
+        df = pd.read_csv(f'{self.study_dir}/data_clinical_patient.txt', sep='\t', skiprows=4)
+        self.assertListEqual(['Female', 'Male'], df['SEX'].to_list())
+
+    def test_maf_changed(self):
+        self.export()
+        self.write_maf(sample_id='S2', gene='EGFR')
+        self.assertListEqual(['study_info', 'clinical_data', 'case_lists'], self.export())
+        df = pd.read_csv(f'{self.study_dir}/data_mutations_extended.txt', sep='\t')
+        self.assertListEqual(['TP53', 'EGFR'], df['Hugo_Symbol'].to_list())
+
+    def test_output_removed(self):
+        self.export()
+        os.remove(f'{self.study_dir}/case_lists/cases_all.txt')
+        self.assertListEqual(['study_info', 'clinical_data', 'mutation_data'], self.export())
+        self.assertTrue(exists(f'{self.study_dir}/case_lists/cases_all.txt'))
+
+    def test_full_export_clears_manifest(self):
+        self.export()
+        self.export(incremental=False)
+        self.assertTrue(not exists(f'{self.study_dir}/.clinui_manifest.json'))
+        self.assertListEqual([], self.export())
+
+    def test_progress(self):
+        reports = []
+        self.export(progress=Progress(callback=reports.append))
+        stages = []
+        for r in reports:
+            if r.stage not in stages:
+                stages.append(r.stage)
+        self.assertListEqual(
+            ['Normalizing clinical data', 'Writing clinical data', 'Checking MAFs for changes',
+             'Writing mutation data', 'Writing case lists'],
+            stages)
+        mutation = [r for r in reports if r.stage == 'Writing mutation data']
+        self.assertListEqual([0, 1, 2], [r.done for r in mutation])
+        self.assertEqual(os.path.getsize(f'{self.study_dir}/data_mutations_extended.txt'), mutation[-1].bytes_written)
+
+    def test_cancel_keeps_previous_study(self):
+        self.export()
+        self.write_maf(sample_id='S2', gene='EGFR')
+
+        def cancel_after_first_maf(report):
+            if report.stage == 'Writing mutation data' and report.done == 1:
+                progress.cancel()
+
+        progress = Progress(callback=cancel_after_first_maf)
+        with self.assertRaises(Cancelled):
+            with contextlib.redirect_stdout(io.StringIO()):
+                ExportCbioportalStudy(self.schema).main(
+                    clinical_data_df=self.clinical_data_df,
+                    maf_dir=self.maf_dir,
+                    study_info_dict={'cancer_study_identifier': 'hnsc_nycu_2022', 'description': 'WES'},
+                    tags_dict=None,
+                    outdir=self.study_dir,
+                    incremental=True,
+                    progress=progress)
+
+        df = pd.read_csv(f'{self.study_dir}/data_mutations_extended.txt', sep='\t')
+        self.assertListEqual(['TP53', 'TP53'], df['Hugo_Symbol'].to_list())
+        self.assertListEqual(['study'], [f for f in os.listdir(self.outdir) if f != 'maf_dir'])
+
+    def test_each_maf_hashed_once(self):
+        with mock.patch('src.cbio_ingest.get_fingerprint', wraps=get_fingerprint) as ingest_hash, \
+                mock.patch('src.cbio_write_mutation_data.get_fingerprint', wraps=get_fingerprint) as cache_hash:
+            self.export(maf_cache=MafCache(cache_dir=f'{self.outdir}/cache'))
+        self.assertEqual(2, ingest_hash.call_count)  # S1 and S2, for the manifest
+        self.assertEqual(0, cache_hash.call_count)  # the MAF cache reuses the fingerprints of the manifest
+
+    def export(self, incremental: bool = True, progress: Optional[Progress] = None,
+            maf_cache: Optional[MafCache] = None) -> List[str]:
+        """
+        Returns the skipped steps
+        """
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            cBioIngest(self.schema).main(
+                clinical_data_df=self.clinical_data_df,
+                maf_dir=self.maf_dir,
+                study_info_dict={'cancer_study_identifier': 'hnsc_nycu_2022', 'description': 'WES'},
+                tags_dict=None,
+                outdir=self.study_dir,
+                maf_cache=maf_cache,
+                incremental=incremental,
+                progress=progress)
+        prefix = 'Skipping unchanged '
+        return [line[len(prefix):] for line in out.getvalue().splitlines() if line.startswith(prefix)]
+
+    def write_maf(self, sample_id: str, gene: str):
+        df = pd.DataFrame([{c: f'{sample_id}_{c}' for c in ReadAndProcessMaf.COLUMNS}])
+        df['Hugo_Symbol'] = gene
+        with open(f'{self.maf_dir}/{sample_id}.maf', 'w') as fh:
+            fh.write('#version 2.4\n')
+            df.to_csv(fh, sep='\t', index=False)
@@ -1,5 +1,9 @@
+import os
+import io
+import contextlib
 import pandas as pd
-from src.cbio_write_mutation_data import WriteMutationData
+from typing import List
+from src.cbio_write_mutation_data import WriteMutationData, ReadAndProcessMaf
 from .setup import TestCase
 
 
@@ -26,3 +30,51 @@ class TestWriteClinicalData(TestCase):
             sample_df=pd.read_csv(f'{self.indir}/sample_df.csv'),
             outdir=self.outdir
         )
+
+    def test_mafs_with_different_column_orders(self):
+        maf_dir = self.write_mafs(sample_ids=['S1', 'S2'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.write_mutation_data(maf_dir=maf_dir, sample_ids=['S1', 'S2'], outdir=self.outdir)
+
+        actual = pd.read_csv(f'{self.outdir}/data_mutations_extended.txt', sep='\t')
+        self.assertListEqual(ReadAndProcessMaf.COLUMNS, actual.columns.to_list())
+        self.assertListEqual(['S1', 'S1', 'S2', 'S2'], actual['Tumor_Sample_Barcode'].to_list())
+        self.assertListEqual(['S1_Hugo_Symbol'] * 2 + ['S2_Hugo_Symbol'] * 2, actual['Hugo_Symbol'].to_list())
+
+    def test_parallel_same_as_serial(self):
+        sample_ids = [f'S{i}' for i in range(7)]
+        maf_dir = self.write_mafs(sample_ids=sample_ids)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for workers in [1, 3]:
+                os.makedirs(f'{self.outdir}/{workers}')
+                self.write_mutation_data(
+                    maf_dir=maf_dir, sample_ids=sample_ids, outdir=f'{self.outdir}/{workers}', workers=workers)
+
+        with open(f'{self.outdir}/1/data_mutations_extended.txt', 'rb') as fh1:
+            with open(f'{self.outdir}/3/data_mutations_extended.txt', 'rb') as fh3:
+                self.assertEqual(fh1.read(), fh3.read())
+
+    def write_mafs(self, sample_ids: List[str]) -> str:
+        """
+        Every other MAF has the columns in reverse order
+        """
+        maf_dir = f'{self.outdir}/maf_dir'
+        os.makedirs(maf_dir)
+        columns = ReadAndProcessMaf.COLUMNS + ['Extra_Column']
+        for i, sample_id in enumerate(sample_ids):
+            cols = columns if i % 2 == 0 else columns[::-1]
+            df = pd.DataFrame([{c: f'{sample_id}_{c}' for c in cols}] * 2, columns=cols)
+            with open(f'{maf_dir}/{sample_id}.maf', 'w') as fh:
+                fh.write('#version 2.4\n')
+                df.to_csv(fh, sep='\t', index=False)
+        return maf_dir
+
+    def write_mutation_data(self, maf_dir: str, sample_ids: List[str], outdir: str, workers: int = 1):
+        WriteMutationData().main(
+            maf_dir=maf_dir,
+            study_info_dict={'cancer_study_identifier': 'hnsc_nycu_2022', 'description': 'WES'},
+            sample_df=pd.DataFrame({'Study ID': 'hnsc_nycu_2022', 'Patient ID': sample_ids, 'Sample ID': sample_ids}),
+            outdir=outdir,
+            workers=workers)
@@ -0,0 +1,93 @@
+import os
+import io
+import sys
+import json
+import contextlib
+import subprocess
+import pandas as pd
+from src.cli import EntryPoint, read_study_info
+from src.cbio_write_mutation_data import ReadAndProcessMaf
+from .setup import TestCase
+
+
+class TestCli(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.maf_dir = f'{self.outdir}/maf_dir'
+        self.study_dir = f'{self.outdir}/study'
+        os.makedirs(self.maf_dir)
+
+        sample_ids = ['S1', 'S2']
+        for sample_id in sample_ids:
+            df = pd.DataFrame([{c: f'{sample_id}_{c}' for c in ReadAndProcessMaf.COLUMNS}])
+            with open(f'{self.maf_dir}/{sample_id}.maf', 'w') as fh:
+                fh.write('#version 2.4\n')
+                df.to_csv(fh, sep='\t', index=False)
+
+        for i, sample_id in enumerate(sample_ids):
+            df = pd.DataFrame({'Patient ID': [sample_id], 'Sample ID': [sample_id], 'Sex': ['Male']})
+            df.to_csv(f'{self.outdir}/clinical_data_{i}.csv', index=False)
+
+        self.study_info = f'{self.outdir}/study_info.yaml'
+        with open(self.study_info, 'w') as fh:
+            fh.write('''\
+cancer_study_identifier: hnsc_nycu_2022
+description: WES
+tags:
+  key: val
+''')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            EntryPoint().main([
+                '--clinical-data-table', f'{self.outdir}/clinical_data_0.csv',
+                '--clinical-data-table', f'{self.outdir}/clinical_data_1.csv',
+                '--maf-dir', self.maf_dir,
+                '--study-info', self.study_info,
+                '--outdir', self.study_dir,
+                '--no-maf-cache',
+                '--timing',
+            ])
+
+        df = pd.read_csv(f'{self.study_dir}/data_clinical_sample.txt', sep='\t', skiprows=4)
+        self.assertListEqual(['S1', 'S2'], df['SAMPLE_ID'].to_list())
+        df = pd.read_csv(f'{self.study_dir}/data_mutations_extended.txt', sep='\t')
+        self.assertEqual(2, len(df))
+        with open(f'{self.study_dir}/tags.json') as fh:
+            self.assertDictEqual({'key': 'val'}, json.load(fh))
+
+        lines = out.getvalue().splitlines()
+        for label in ['Reprocess table', 'Export cBioPortal study', '    Writing mutation data']:
+            with self.subTest(label=label):
+                self.assertTrue(any(line.startswith(label) and line.endswith(' s') for line in lines))
+
+    def test_read_json_study_info(self):
+        file = f'{self.outdir}/study_info.json'
+        with open(file, 'w') as fh:
+            json.dump({'cancer_study_identifier': 'hnsc_nycu_2022', 'groups': 'PUBLIC'}, fh)
+        study_info_dict, tags_dict = read_study_info(file=file)
+        self.assertDictEqual({'cancer_study_identifier': 'hnsc_nycu_2022', 'groups': 'PUBLIC'}, study_info_dict)
+        self.assertIsNone(tags_dict)
+
+    def test_never_imports_pyqt(self):
+        code = 'import sys, src.cli; sys.exit(any(m.startswith("PyQt5") for m in sys.modules))'
+        p = subprocess.run([sys.executable, '-c', code], cwd=self.get_repo_dir())
+        self.assertEqual(0, p.returncode)
+
+    def test_error_exit_code(self):
+        p = subprocess.run(
+            [sys.executable, '-m', 'src.cli',
+             '-i', 'does_not_exist.csv', '--maf-dir', self.maf_dir, '--study-info', self.study_info, '-o', 'study'],
+            cwd=self.get_repo_dir(),
+            capture_output=True,
+            text=True)
+        self.assertEqual(1, p.returncode)
+        self.assertTrue(p.stderr.startswith('ERROR: '))
+
+    def get_repo_dir(self) -> str:
+        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
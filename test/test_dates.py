@@ -0,0 +1,34 @@
+import pandas as pd
+from src.dates import parse_date, format_date, get_cache_info, clear_cache
+from src.model_nycu import delta_t
+from .setup import TestCase
+
+
+class TestDates(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        clear_cache()
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_same_as_pandas(self):
+        for val in ['2020-01-01', '2019/3/2', '2021-7-15', '2020-02']:
+            self.assertEqual(pd.to_datetime(val), parse_date(val))
+            self.assertEqual(pd.to_datetime(val).strftime('%Y-%m-%d'), format_date(val))
+        self.assertIs(pd.NaT, parse_date(''))
+
+    def test_hits_and_misses(self):
+        for _ in range(3):
+            format_date('2020/3/2')
+        delta_t(start='2020/3/2', end='2020-03-12')
+        info = get_cache_info()
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1}, info['format_date'])
+        self.assertEqual({'hits': 1, 'misses': 2, 'size': 2}, info['parse_date'])
+
+    def test_invalid_date_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                parse_date('not a date')
+        self.assertEqual(0, get_cache_info()['parse_date']['size'])
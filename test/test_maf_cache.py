@@ -0,0 +1,95 @@
+import os
+import io
+import glob
+import contextlib
+import pandas as pd
+from src.maf_cache import MafCache, make_private_dir
+from src.cbio_write_mutation_data import ReadAndProcessMaf
+from .setup import TestCase
+
+
+class TestMafCache(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.cache = MafCache(cache_dir=f'{self.outdir}/cache')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_reuse_until_changed(self):
+        maf = self.write_maf(sample_id='S1', gene='TP53')
+        self.assertEqual(['Processing'], self.read(maf=maf)[1])
+        df, messages = self.read(maf=maf)
+        self.assertEqual(['Reading cached'], messages)
+        self.assertListEqual(['TP53'] * 2, df['Hugo_Symbol'].to_list())
+
+        self.write_maf(sample_id='S1', gene='EGFR')
+        df, messages = self.read(maf=maf)
+        self.assertEqual(['Processing'], messages)
+        self.assertListEqual(['EGFR'] * 2, df['Hugo_Symbol'].to_list())
+        self.assertEqual(1, len(glob.glob(f'{self.outdir}/cache/*.tsv')))  # replaced the previous entry
+
+    def test_same_as_uncached(self):
+        maf = self.write_maf(sample_id='S1', gene='TP53')
+        self.read(maf=maf)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = ReadAndProcessMaf().main(maf=maf)
+        pd.testing.assert_frame_equal(expected, self.read(maf=maf)[0])
+
+    def test_evict_least_recently_used(self):
+        mafs = [self.write_maf(sample_id=f'S{i}', gene='TP53') for i in range(3)]
+        paths = []
+        for i, maf in enumerate(mafs):
+            self.read(maf=maf)
+            path = (set(glob.glob(f'{self.outdir}/cache/*.tsv')) - set(paths)).pop()
+            os.utime(path, (i, i))  # S0 is the oldest
+            paths.append(path)
+
+        self.cache.max_bytes = sum(os.path.getsize(p) for p in paths) - 1
+        self.read(maf=mafs[0])  # touched, so S1 is the least recently used
+        self.cache.evict()
+
+        self.assertEqual(['Reading cached'], self.read(maf=mafs[0])[1])
+        self.assertEqual(['Processing'], self.read(maf=mafs[1])[1])
+
+    def test_corrupted_entry(self):
+        maf = self.write_maf(sample_id='S1', gene='TP53')
+        self.read(maf=maf)
+        for path in glob.glob(f'{self.outdir}/cache/*.tsv'):
+            with open(path, 'wb') as fh:
+                fh.write(b'truncated')
+        df, messages = self.read(maf=maf)
+        self.assertEqual(['Processing'], messages)
+        self.assertListEqual(['TP53'] * 2, df['Hugo_Symbol'].to_list())
+
+    def test_private_dir(self):
+        self.assertEqual(0o700, os.stat(f'{self.outdir}/cache').st_mode & 0o777)
+
+        os.makedirs(f'{self.outdir}/shared', mode=0o777)
+        os.chmod(f'{self.outdir}/shared', 0o777)
+        make_private_dir(path=f'{self.outdir}/shared')
+        self.assertEqual(0o700, os.stat(f'{self.outdir}/shared').st_mode & 0o777)
+
+    def test_symlinked_dir(self):
+        os.symlink(os.path.abspath(f'{self.outdir}/cache'), f'{self.outdir}/link')
+        with self.assertRaises(PermissionError):
+            MafCache(cache_dir=f'{self.outdir}/link')
+
+    def write_maf(self, sample_id: str, gene: str) -> str:
+        maf = f'{self.outdir}/{sample_id}.maf'
+        df = pd.DataFrame([{c: f'{sample_id}_{c}' for c in ReadAndProcessMaf.COLUMNS}] * 2)
+        df['Hugo_Symbol'] = gene
+        with open(maf, 'w') as fh:
+            fh.write('#version 2.4\n')
+            df.to_csv(fh, sep='\t', index=False)
+        return maf
+
+    def read(self, maf: str):
+        """
+        Returns the dataframe and the printed messages without the MAF path
+        """
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            df = ReadAndProcessMaf().main(maf=maf, cache=self.cache)
+        return df, [line.replace(f' {maf}', '') for line in out.getvalue().splitlines()]
@@ -1,6 +1,18 @@
-from src.model import Model
-from src.schema import NycuOsccSchema
-from .setup import TestCase
+import io
+import os
+import contextlib
+import numpy as np
+import pandas as pd
+from typing import List
+from unittest.mock import patch
+from src.model import Model, CastDatatypes, CastTableDatatypes
+from src.model_vghtc import CalculateVghtcOscc
+from src.progress import Progress, Cancelled
+from src.schema import NycuOsccSchema, VghtcOsccSchema
+from .setup import TestCase, get_str_df
+
+
+V = VghtcOsccSchema
 
 
 class TestModel(TestCase):
@@ -137,3 +149,307 @@ class TestModel(TestCase):
         # save the table, saved
         model.save_clinical_data_table(file=f'{self.outdir}/clinical_data.csv')
         self.assertTrue(model.is_file_saved())
+
+
+class TestDirtyRows(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.file = f'{self.outdir}/clinical_data.csv'
+        get_str_df(n=20).to_csv(self.file, index=False)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def get_reprocessed_model(self) -> Model:
+        model = Model(NycuOsccSchema)
+        model.import_clinical_data_table(file=self.file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.reprocess_table()
+        return model
+
+    def test_track_dirty_rows(self):
+        model = Model(NycuOsccSchema)
+        model.import_clinical_data_table(file=self.file)
+        self.assertListEqual(list(range(20)), model.get_dirty_rows())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.reprocess_table()
+        self.assertListEqual([], model.get_dirty_rows())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.update_cell(row=3, column='Sex', value='Other')
+            model.append_sample(attributes={'Medical Record ID': '12345'})
+        self.assertListEqual([3, 20], model.get_dirty_rows())
+
+        model.drop(rows=[0, 1])
+        self.assertListEqual([1, 18], model.get_dirty_rows())
+
+        model.sort_dataframe(by='Sample ID', ascending=False)  # S00019, ..., S00002, NaN
+        self.assertListEqual([16, 18], model.get_dirty_rows())
+        self.assertEqual('S00003', model.dataframe.loc[16, 'Sample ID'])
+
+        model.undo()
+        self.assertListEqual([1, 18], model.get_dirty_rows())
+
+    def test_incremental_reprocess(self):
+        model = self.get_reprocessed_model()
+        model.dataframe.loc[[2, 6], 'Clinical Diagnosis Age'] = pd.NA  # untracked changes
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.update_cell(row=2, column='Birth Date', value='1970-01-01')
+            model.dataframe.loc[2, 'Clinical Diagnosis Age'] = pd.NA
+            model.reprocess_table(incremental=True)
+        self.assertFalse(pd.isna(model.dataframe.loc[2, 'Clinical Diagnosis Age']))  # dirty row is recomputed
+        self.assertTrue(pd.isna(model.dataframe.loc[6, 'Clinical Diagnosis Age']))  # clean row is not
+        self.assertListEqual([], model.get_dirty_rows())
+
+    def test_incremental_equals_full(self):
+        model = self.get_reprocessed_model()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.update_cell(row=4, column='Birth Date', value='1970-01-01')
+            model.append_sample(attributes={'Medical Record ID': '12345', 'Pathological TNM (pTNM)': 'T2N0M0'})
+            model.reprocess_table(incremental=True)
+            incremental = model.get_dataframe()
+            model.reprocess_table()
+        self.assertDataFrameEqual(incremental, model.dataframe)
+
+    def test_full_reprocess_when_calculator_version_changes(self):
+        model = self.get_reprocessed_model()
+        model.dataframe.loc[4, 'Clinical Diagnosis Age'] = pd.NA  # untracked change
+        model.CALCULATOR_VERSION += 1
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.reprocess_table(incremental=True)
+        self.assertFalse(pd.isna(model.dataframe.loc[4, 'Clinical Diagnosis Age']))
+
+    def test_incremental_error_row(self):
+        model = self.get_reprocessed_model()
+        model.dataframe.loc[15, 'Patient Weight (Kg)'] = 'heavy'  # untracked, which update_cell() would refuse
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.update_cell(row=2, column='Sex', value='Other')
+            model.update_cell(row=15, column='Sex', value='Other')
+            with self.assertRaises(ValueError) as context:
+                model.reprocess_table(incremental=True)
+        self.assertTrue(str(context.exception).startswith('Invalid "Patient Weight (Kg)" of row 16: '))
+
+
+class TestUpdateCell(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.model = Model(NycuOsccSchema)
+        self.file = f'{self.outdir}/clinical_data.csv'
+        get_str_df(n=5).to_csv(self.file, index=False)
+        self.model.import_clinical_data_table(file=self.file)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def get_changed_columns(self, before, after) -> List[str]:
+        return [c for c in before.columns if not (before[c].equals(after[c]))]
+
+    def test_no_downstream(self):
+        before = self.model.get_dataframe()
+        self.model.update_cell(row=1, column='Patient Weight (Kg)', value='80')
+        self.assertListEqual(['Patient Weight (Kg)'], self.get_changed_columns(before, self.model.dataframe))
+        self.assertEqual(80.0, self.model.dataframe.loc[1, 'Patient Weight (Kg)'])
+
+    def test_downstream(self):
+        before = self.model.get_dataframe()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.model.update_cell(row=1, column='Clinical Diagnosis Date', value='2020-01-01')
+        self.assertListEqual(
+            ['Clinical Diagnosis Date', 'Clinical Diagnosis Age'],
+            sorted(self.get_changed_columns(before, self.model.dataframe), key=before.columns.get_loc))
+
+    def test_vghtc_calculated_columns(self):
+        def calculate(attributes):  # a stand-in calculator without dependency graph
+            return {**attributes, V.RECRUITMENT_DATE: f'{attributes[V.PATIENT_ID]} date'}
+
+        model = Model(V)
+        model.append_sample(attributes={V.PATIENT_ID: 'LTL-1000'})
+        with patch.object(CalculateVghtcOscc, 'main', side_effect=calculate):
+            model.update_cell(row=0, column=V.PATIENT_ID, value='LRC-0000')
+        self.assertEqual('LRC-0000 date', model.dataframe.loc[0, V.RECRUITMENT_DATE])
+
+
+class TestImportDuplicates(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def write_clinical_data(self, sample_ids: List[str]) -> str:
+        file = f'{self.outdir}/clinical_data_{len(os.listdir(self.outdir))}.csv'
+        df = pd.DataFrame({'Sample ID': sample_ids, 'Sex': ['Male'] * len(sample_ids)})
+        df.to_csv(file, index=False)
+        return file
+
+    def test_import_clinical_data_table(self):
+        model = Model(NycuOsccSchema)
+        model.import_clinical_data_table(file=self.write_clinical_data(['A', 'B', '', '']))
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            model.import_clinical_data_table(file=self.write_clinical_data(['B', 'C', '', 'C', 'A']))
+
+        self.assertListEqual(['A', 'B', 'C'], model.dataframe['Sample ID'].dropna().tolist())
+        self.assertEqual(6, len(model.dataframe))  # all 3 rows without Sample ID are included
+        self.assertEqual(
+            'WARNING! 3 sample ID(s) already exist, skipping: "B", "C", "A"\n', stdout.getvalue())
+
+    def test_import_sequencing_table(self):
+        model = Model(NycuOsccSchema)
+        model.import_clinical_data_table(file=self.write_clinical_data(['A', 'B']))
+
+        file = f'{self.outdir}/sequencing.csv'
+        pd.DataFrame({
+            'ID': ['B', 'C', 'C', '', 'D'],
+            'Lab': ['L1', 'L2', 'L3', 'L4', 'L5'],
+            'Lab Sample ID': ['x1', 'x2', 'x3', 'x4', 'x5'],
+        }).to_csv(file, index=False)
+        model.import_sequencing_table(file=file)
+
+        self.assertListEqual(['A', 'B', 'C', 'D'], model.dataframe['Sample ID'].dropna().tolist())
+        self.assertListEqual(['L2', 'L4', 'L5'], model.dataframe['Lab ID'].iloc[2:].tolist())
+
+
+class TestPrepareAndCommit(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.model = Model(NycuOsccSchema)
+        self.file = f'{self.outdir}/clinical_data.csv'
+        pd.DataFrame({'Sample ID': ['A', 'B'], 'Sex': ['Male', 'Female']}).to_csv(self.file, index=False)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_not_changed_until_commit(self):
+        commit = self.model.prepare_import_clinical_data_table(file=self.file)
+        self.assertEqual(0, len(self.model.dataframe))
+        commit()
+        self.assertListEqual(['A', 'B'], self.model.dataframe['Sample ID'].tolist())
+        self.model.undo()
+        self.assertEqual(0, len(self.model.dataframe))
+
+    def test_table_changed_before_commit(self):
+        self.model.import_clinical_data_table(file=self.file)
+        commit = self.model.prepare_import_clinical_data_table(file=self.file)
+        self.model.update_cell(row=0, column='Sex', value='Female')
+        with self.assertRaises(RuntimeError):
+            commit()
+
+    def test_save_marks_the_prepared_version(self):
+        self.model.import_clinical_data_table(file=self.file)
+        commit = self.model.prepare_save_clinical_data_table(file=f'{self.outdir}/saved.csv')
+        self.model.update_cell(row=0, column='Sex', value='Female')
+        commit()
+        self.assertFalse(self.model.is_file_saved())  # the edit after preparing is not saved
+        self.model.undo()
+        self.assertTrue(self.model.is_file_saved())
+
+    def test_cancelled_save_keeps_previous_file(self):
+        self.model.import_clinical_data_table(file=self.file)
+        progress = Progress()
+        progress.cancel()
+        with self.assertRaises(Cancelled):
+            self.model.prepare_save_clinical_data_table(file=self.file, progress=progress)
+        self.assertListEqual(['Sample ID', 'Sex'], pd.read_csv(self.file).columns.tolist())  # not overwritten
+        self.assertListEqual(['clinical_data.csv'], os.listdir(self.outdir))
+
+    def test_cancelled_reprocess(self):
+        self.model.import_clinical_data_table(file=self.file)
+        progress = Progress()
+        progress.cancel()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(Cancelled):
+                self.model.prepare_reprocess_table(progress=progress)
+        self.assertListEqual([0, 1], self.model.get_dirty_rows())
+
+
+class TestAppendSamples(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_append_samples(self):
+        samples = [
+            {'Sample ID': 'A', 'Patient Weight (Kg)': '60', 'Birth Date': '1960/5/6', 'Clinical Diagnosis Date': '2020-01-01'},
+            {'Sample ID': 'B', 'Patient Weight (Kg)': ''},
+            {'Sample ID': 'C', 'Immunotherapy': 'True'},
+        ]
+        model = Model(NycuOsccSchema)
+        model.append_samples(samples=samples)
+
+        df = model.dataframe
+        self.assertListEqual(NycuOsccSchema.DISPLAY_COLUMNS, list(df.columns))
+        self.assertListEqual(['A', 'B', 'C'], df['Sample ID'].tolist())
+        self.assertEqual(60.0, df.loc[0, 'Patient Weight (Kg)'])
+        self.assertEqual('1960-05-06', df.loc[0, 'Birth Date'])
+        self.assertAlmostEqual(59.7, df.loc[0, 'Clinical Diagnosis Age'], places=1)
+        self.assertIs(pd.NA, df.loc[1, 'Patient Weight (Kg)'])
+        self.assertIs(True, df.loc[2, 'Immunotherapy'])
+        self.assertEqual(1, len(model.undo_cache))
+
+    def test_same_as_append_sample(self):
+        samples = get_str_df(n=20).to_dict('records')
+        a, b = Model(NycuOsccSchema), Model(NycuOsccSchema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for sample in samples:
+                a.append_sample(attributes=sample)
+            b.append_samples(samples=samples)
+        self.assertDataFrameEqual(a.dataframe, b.dataframe)
+
+    def test_invalid_value(self):
+        model = Model(NycuOsccSchema)
+        with self.assertRaises(ValueError):
+            model.append_samples(samples=[{'Sample ID': 'A'}, {'Sample ID': 'B', 'Patient Weight (Kg)': 'heavy'}])
+        self.assertEqual(0, len(model.dataframe))
+        self.assertEqual(0, len(model.undo_cache))
+
+
+class TestCastTableDatatypes(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_same_as_cast_datatypes(self):
+        df = get_str_df(n=100)
+        df['Patient Weight (Kg)'] = ['1', ' 2.5 ', '1e3', '-0', ''] * 20
+        df['Immunotherapy'] = ['true', 'False', '', 'TRUE'] * 25
+        df.loc[0, 'Patient Weight (Kg)'] = 70  # not str
+        df.loc[1, 'Birth Date'] = np.nan  # missing
+
+        actual = CastTableDatatypes(NycuOsccSchema).main(df=df)
+
+        cast = CastDatatypes(NycuOsccSchema)
+        for row, attributes in enumerate(df.to_dict('records')):
+            for key, val in attributes.items():
+                if val is np.nan:
+                    self.assertIs(np.nan, actual.loc[row, key])
+                    continue
+                expected = cast.cast(key=key, val=val)
+                self.assertIs(type(expected), type(actual.loc[row, key]), msg=key)
+                if expected is not pd.NA:
+                    self.assertEqual(expected, actual.loc[row, key], msg=key)
+
+    def test_first_invalid_cell(self):
+        df = get_str_df(n=20)
+        df.loc[7, 'Patient Weight (Kg)'] = 'heavy'
+        df.loc[3, 'Last Follow-up Date'] = 'not a date'
+        df.loc[3, 'Birth Date'] = 'not a date either'
+        with self.assertRaisesRegex(ValueError, r'"Birth Date" of row 4'):
+            CastTableDatatypes(NycuOsccSchema).main(df=df)
+
+    def test_empty(self):
+        df = pd.DataFrame(columns=NycuOsccSchema.DISPLAY_COLUMNS)
+        actual = CastTableDatatypes(NycuOsccSchema).main(df=df)
+        self.assertListEqual(NycuOsccSchema.DISPLAY_COLUMNS, list(actual.columns))
@@ -0,0 +1,124 @@
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+from src.model import Model
+from src.model_filter import parse_filter, evaluate
+from src.schema import NycuOsccSchema
+from .setup import TestCase, get_str_df
+
+
+class TestParseFilter(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        actual = parse_filter(
+            query="Sex == Male AND `Patient Weight (Kg)` >= 60 and Cancer Type contains 'oral cavity'",
+            columns=NycuOsccSchema.DISPLAY_COLUMNS)
+        expected = [
+            ('Sex', '==', 'Male'),
+            ('Patient Weight (Kg)', '>=', '60'),
+            ('Cancer Type', 'contains', 'oral cavity'),
+        ]
+        self.assertListEqual(expected, actual)
+
+    def test_quoted_and(self):
+        actual = parse_filter(
+            query="Surgery == 'Wide Excision and Neck Dissection' and Cancer Type == \"Head and Neck Cancer\"",
+            columns=NycuOsccSchema.DISPLAY_COLUMNS)
+        expected = [
+            ('Surgery', '==', 'Wide Excision and Neck Dissection'),
+            ('Cancer Type', '==', 'Head and Neck Cancer'),
+        ]
+        self.assertListEqual(expected, actual)
+
+    def test_quoted_operator(self):
+        actual = parse_filter(query="`Sex` == 'a >= b'", columns=NycuOsccSchema.DISPLAY_COLUMNS)
+        self.assertListEqual([('Sex', '==', 'a >= b')], actual)
+
+    def test_empty(self):
+        self.assertListEqual([], parse_filter(query=' ', columns=NycuOsccSchema.DISPLAY_COLUMNS))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_filter(query='Sex Male', columns=NycuOsccSchema.DISPLAY_COLUMNS)
+        with self.assertRaises(ValueError):
+            parse_filter(query='Gender == Male', columns=NycuOsccSchema.DISPLAY_COLUMNS)
+
+
+class TestEvaluate(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_main(self):
+        series = pd.Series([60.0, 75.5, pd.NA, np.nan, 9.0], dtype=object)
+        self.assertListEqual([False, True, False, False, False], evaluate(('x', '>', '60'), series).tolist())
+        self.assertListEqual([True, False, False, False, True], evaluate(('x', '<=', '60'), series).tolist())
+        self.assertListEqual([False, False, True, True, False], evaluate(('x', '==', ''), series).tolist())
+        self.assertListEqual([False, True, False, False, False], evaluate(('x', 'contains', '.5'), series).tolist())
+
+    def test_compare_text(self):
+        series = pd.Series(['2020-01-01', '2019-12-31', np.nan], dtype=object)
+        self.assertListEqual([True, False, False], evaluate(('x', '>=', '2020-01-01'), series).tolist())
+
+
+class TestModelFilter(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.model = Model(NycuOsccSchema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.model.append_samples(samples=get_str_df(n=40).to_dict('records'))
+
+    def tearDown(self):
+        self.tear_down()
+
+    def assert_filtered_rows(self):
+        df = self.model.dataframe
+        sex = df['Sex'].fillna('')
+        weight = pd.to_numeric(df['Patient Weight (Kg)']).fillna(0)
+        expected = [i for i in range(len(df)) if sex[i] == 'Male' and weight[i] > 60]
+        self.assertListEqual(expected, self.model.get_filtered_rows().tolist())
+
+    def test_no_filter(self):
+        self.assertIsNone(self.model.get_filtered_rows())
+        self.model.set_filter(query='Sex == Male')
+        self.model.set_filter(query='')
+        self.assertIsNone(self.model.get_filtered_rows())
+
+    def test_events(self):
+        self.model.set_filter(query='Sex == Male and Patient Weight (Kg) > 60')
+        self.assert_filtered_rows()
+
+        rows = self.model.get_filtered_rows()
+        self.model.update_cell(row=int(rows[0]), column='Sex', value='Female')
+        self.assert_filtered_rows()
+
+        self.model.sort_dataframe(by='Sample ID', ascending=False)
+        self.assert_filtered_rows()
+
+        self.model.drop(rows=[0, 1, 2])
+        self.assert_filtered_rows()
+
+        self.model.append_samples(samples=[{'Sample ID': 'NEW', 'Sex': 'Male', 'Patient Weight (Kg)': '80'}])
+        self.assert_filtered_rows()
+
+        for _ in range(4):
+            self.model.undo()
+            self.assert_filtered_rows()
+
+    def test_find(self):
+        self.model.set_filter(query='Sex == Female')
+        shown = set(self.model.get_filtered_rows().tolist())
+        self.assertTrue(all(row in shown for row, _ in self.model.find_all(text='male')))
+        row, _ = self.model.find(text='male', start=None)
+        self.assertIn(row, shown)
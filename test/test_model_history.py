@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+from src.model_event import CellsUpdated, RowsAppended, RowsDropped, TableSorted, TableReplaced
+from src.model_history import History, CellPatch, RowInsert, RowDelete, ColumnDelete, Permutation, Snapshot, \
+    Compound, diff
+from .setup import TestCase
+
+
+def get_df() -> pd.DataFrame:
+    return pd.DataFrame({
+        'A': ['a0', 'a1', 'a2', 'a3'],
+        'B': [1, 2, np.nan, 4],
+        'C': ['c0', np.nan, 'c2', 'c3'],
+    }, dtype=object)
+
+
+class TestDeltas(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def assert_reversible(self, delta, before: pd.DataFrame, after: pd.DataFrame):
+        self.assertDataFrameEqual(after, delta.apply(before.copy()))
+        self.assertDataFrameEqual(before, delta.revert(after.copy()))
+
+    def test_diff_cell_patch(self):
+        before = get_df()
+        after = get_df()
+        after.loc[1, 'C'] = 'new'
+        after.loc[2, 'B'] = 3
+        delta = diff(before=before, after=after)
+        self.assertIsInstance(delta, CellPatch)
+        self.assertEqual(2, len(delta.cells))
+        self.assert_reversible(delta, before=before, after=after)
+
+    def test_diff_type_change(self):
+        before = get_df()
+        after = get_df()
+        after.loc[0, 'B'] = 1.0  # equal value but different type
+        delta = diff(before=before, after=after)
+        self.assertEqual(1, len(delta.cells))
+
+    def test_diff_snapshot(self):
+        before = get_df()
+        after = get_df().drop(columns='C')
+        self.assertIsInstance(diff(before=before, after=after), Snapshot)
+
+    def test_row_insert(self):
+        before = get_df()
+        rows = pd.DataFrame({'A': ['a4'], 'B': [5], 'C': ['c4']}, dtype=object)
+        after = pd.concat([before, rows], ignore_index=True)
+        self.assert_reversible(RowInsert(rows=rows), before=before, after=after)
+
+    def test_row_delete(self):
+        before = get_df()
+        after = before.drop(index=[0, 2]).reset_index(drop=True)
+        self.assert_reversible(RowDelete(df=before, positions=[2, 0]), before=before, after=after)
+
+    def test_column_delete(self):
+        before = get_df()
+        after = before.drop(columns=['A', 'C'])
+        self.assert_reversible(ColumnDelete(df=before, columns=['C', 'A']), before=before, after=after)
+
+    def test_permutation(self):
+        before = get_df()
+        order = np.array([3, 1, 0, 2])
+        after = before.iloc[order].reset_index(drop=True)
+        self.assert_reversible(Permutation(order=order), before=before, after=after)
+
+    def test_compound(self):
+        before = get_df()
+        middle = before.drop(index=[1]).reset_index(drop=True)
+        after = middle.drop(columns=['B'])
+        delta = Compound(deltas=[
+            RowDelete(df=before, positions=[1]),
+            ColumnDelete(df=middle, columns=['B']),
+        ])
+        self.assert_reversible(delta, before=before, after=after)
+
+
+class TestHistory(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_undo_redo(self):
+        history = History(max_undo=100, checkpoint_interval=2)
+        df = get_df()
+        states = [df.copy()]
+        for i in range(5):
+            after = df.copy()
+            after.loc[i % 4, 'A'] = f'edit {i}'
+            delta = diff(before=df, after=after)
+            history.push(delta=delta, dataframe=df)
+            df = delta.apply(df)
+            states.append(df.copy())
+
+        for state in reversed(states[:-1]):
+            df = history.undo(df)
+            self.assertDataFrameEqual(state, df)
+        self.assertIsNone(history.undo(df))
+
+        for state in states[1:]:
+            df = history.redo(df)
+            self.assertDataFrameEqual(state, df)
+        self.assertIsNone(history.redo(df))
+
+    def test_checkpoint(self):
+        history = History(max_undo=100, checkpoint_interval=2)
+        df = get_df()
+        for i in range(4):
+            history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        checkpoints = [delta.checkpoint is not None for delta in history.undo_cache]
+        self.assertListEqual([False, True, False, True], checkpoints)
+
+    def test_max_undo(self):
+        history = History(max_undo=3, checkpoint_interval=100)
+        df = get_df()
+        for i in range(5):
+            history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        self.assertEqual(3, len(history.undo_cache))
+
+    def test_version(self):
+        history = History(max_undo=100, checkpoint_interval=100)
+        df = get_df()
+        self.assertEqual(0, history.version)
+        history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        self.assertEqual(1, history.version)
+        history.undo(df)
+        self.assertEqual(0, history.version)
+        history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        self.assertEqual(2, history.version)  # a new state never reuses the version of a discarded state
+
+    def test_evict(self):
+        history = History(max_undo=100, checkpoint_interval=100, max_bytes=1)
+        df = get_df()
+        for i in range(3):
+            history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        self.assertEqual(1, len(history.undo_cache))  # the most recent delta is never evicted
+        self.assertEqual(0, history.disk_usage())
+
+    def test_evict_within_budget(self):
+        df = get_df()
+        nbytes = Permutation(order=np.arange(4)).memory_usage()
+        history = History(max_undo=100, checkpoint_interval=100, max_bytes=8 * nbytes)
+        for i in range(10):
+            history.push(delta=Permutation(order=np.arange(4)), dataframe=df)
+        self.assertEqual(8, len(history.undo_cache))  # only the oldest deltas beyond the budget are evicted
+        self.assertEqual(8 * nbytes, history.memory_usage())
+
+    def test_spill(self):
+        history = History(max_undo=100, checkpoint_interval=100, max_bytes=1, spill=True)
+        df = get_df()
+        states = [df.copy()]
+        for i in range(3):
+            after = df.copy()
+            after.loc[i, 'C'] = f'edit {i}'
+            delta = diff(before=df, after=after)
+            history.push(delta=delta, dataframe=df)
+            df = delta.apply(df)
+            states.append(df.copy())
+
+        self.assertEqual(3, len(history.undo_cache))
+        self.assertGreater(history.disk_usage(), 0)
+
+        for state in reversed(states[:-1]):
+            df = history.undo(df)
+            self.assertDataFrameEqual(state, df)
+        for state in states[1:]:
+            df = history.redo(df)
+            self.assertDataFrameEqual(state, df)
+
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_cell_patch(self):
+        before = get_df()
+        after = get_df()
+        after.loc[1, 'C'] = 'new'
+        after.loc[3, 'A'] = 'new'
+        events = diff(before=before, after=after).get_events(forward=True, nrows=4)
+        self.assertEqual(1, len(events))
+        self.assertIsInstance(events[0], CellsUpdated)
+        self.assertListEqual([1, 3], sorted(events[0].rows))
+        self.assertListEqual(['A', 'C'], sorted(events[0].columns))
+
+    def test_row_insert(self):
+        rows = pd.DataFrame({'A': ['a4', 'a5'], 'B': [5, 6], 'C': ['c4', 'c5']}, dtype=object)
+        delta = RowInsert(rows=rows)
+        appended, = delta.get_events(forward=True, nrows=6)
+        self.assertIsInstance(appended, RowsAppended)
+        self.assertEqual((4, 5), (appended.first, appended.last))
+        dropped, = delta.get_events(forward=False, nrows=4)
+        self.assertIsInstance(dropped, RowsDropped)
+        self.assertListEqual([4, 5], dropped.rows)
+
+    def test_row_delete(self):
+        delta = RowDelete(df=get_df(), positions=[2, 0])
+        dropped, = delta.get_events(forward=True, nrows=2)
+        self.assertListEqual([0, 2], sorted(dropped.rows))
+        self.assertIsInstance(delta.get_events(forward=False, nrows=4)[0], TableReplaced)
+
+    def test_history(self):
+        history = History(max_undo=100, checkpoint_interval=2)
+        df = get_df()
+        for i in range(2):
+            delta = Permutation(order=np.arange(4))
+            history.push(delta=delta, dataframe=df)
+            df = delta.apply(df)
+
+        df = history.undo(df)
+        self.assertIsInstance(history.events[0], TableReplaced)  # restored from checkpoint
+        df = history.undo(df)
+        self.assertIsInstance(history.events[0], TableSorted)
+        history.redo(df)
+        self.assertIsInstance(history.events[0], TableSorted)
@@ -1,6 +1,57 @@
+import io
+import contextlib
+import pandas as pd
 from src.model_nycu import CalculateDiagnosisAge, CalculateSurvival, MatchICD, \
-    CalculateStage, CalculateLymphNodes, GetTherapyFlagsFromDrugs, find_best_matching_key_val
-from .setup import TestCase
+    CalculateStage, CalculateLymphNodes, GetTherapyFlagsFromDrugs, find_best_matching_key_val, CalculateNycuOscc, SplitTNM
+from .setup import TestCase, get_str_df
+
+
+class TestCalculateNycuOscc(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_output_keys(self):
+        for attributes in get_str_df(n=30).to_dict('records'):
+            for calculator in CalculateNycuOscc().get_calculators():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    actual = calculator().main(attributes)
+                changed = [k for k in actual if actual[k] != attributes[k]]
+                for key in changed:
+                    self.assertIn(key, calculator.OUTPUT_KEYS)
+
+    def test_input_keys(self):
+        for attributes in get_str_df(n=30).to_dict('records'):
+            for calculator in CalculateNycuOscc().get_calculators():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = calculator().main(attributes)
+                    other = {k: ('' if k in calculator.INPUT_KEYS else 'x') for k in attributes}
+                    other.update({k: attributes[k] for k in calculator.INPUT_KEYS})
+                    actual = calculator().main(other)  # only the input keys matter
+                for key in calculator.OUTPUT_KEYS:
+                    if pd.isna(expected[key]):
+                        self.assertTrue(pd.isna(actual[key]))
+                    else:
+                        self.assertEqual(expected[key], actual[key])
+
+    def test_get_downstream(self):
+        calculators, keys = CalculateNycuOscc().get_downstream(changed_keys=['Patient Weight (Kg)'])
+        self.assertListEqual([], calculators)
+        self.assertListEqual(['Patient Weight (Kg)'], keys)
+
+        calculators, keys = CalculateNycuOscc().get_downstream(changed_keys=['Pathological TNM (pTNM)'])
+        self.assertListEqual([CalculateStage, SplitTNM], calculators)
+        self.assertListEqual(['Pathological TNM (pTNM)'] + CalculateStage.OUTPUT_KEYS + SplitTNM.OUTPUT_KEYS, keys)
+
+    def test_main_changed_keys(self):
+        attributes = get_str_df(n=1).to_dict('records')[0]
+        attributes['Clinical Diagnosis Age'] = 'untouched'
+        actual = CalculateNycuOscc().main(attributes=attributes, changed_keys=['Expire Date'])
+        self.assertEqual('untouched', actual['Clinical Diagnosis Age'])
+        self.assertNotEqual('', actual['Overall Survival Status'])
 
 
 class TestCalculateDiagnosisAge(TestCase):
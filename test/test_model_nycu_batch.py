@@ -0,0 +1,158 @@
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+from src.model import Model, ProcessSampleAttributes, ProcessTableAttributes
+from src.model_nycu import CalculateNycuOscc
+from src.model_nycu_batch import CalculateNycuOsccBatch, map_unique, parse_lymph_node
+from src.progress import Progress, Cancelled
+from src.schema import NycuOsccSchema
+from .setup import TestCase, get_str_df
+
+
+S = NycuOsccSchema
+
+
+def get_imported_df(n: int) -> pd.DataFrame:
+    """
+    As imported by ReadTable, i.e. '' is NaN
+    """
+    df = get_str_df(n=n)
+    return df.where(df != '', np.nan)
+
+
+class TestCalculateNycuOsccBatch(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def assertSameValues(self, expected: pd.DataFrame, actual: pd.DataFrame):
+        self.assertListEqual(list(expected.columns), list(actual.columns))
+        for c in expected.columns:
+            for a, b in zip(expected[c], actual[c]):
+                if pd.isna(a) and pd.isna(b):
+                    continue
+                self.assertEqual(type(a), type(b), msg=c)
+                self.assertEqual(a, b, msg=c)
+
+    def test_main(self):
+        df = get_str_df(n=200)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = pd.DataFrame([CalculateNycuOscc().main(attributes=r) for r in df.to_dict('records')])
+            actual = CalculateNycuOsccBatch().main(df=df)
+        self.assertSameValues(expected, actual[expected.columns])
+
+    def test_missing_required_keys(self):
+        df = get_str_df(n=20)[[S.SAMPLE_ID, S.BIRTH_DATE, S.PATHOLOGICAL_TNM]]
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = pd.DataFrame([CalculateNycuOscc().main(attributes=r) for r in df.to_dict('records')])
+            actual = CalculateNycuOsccBatch().main(df=df)
+        self.assertSameValues(expected, actual[expected.columns])
+
+    def test_warnings(self):
+        df = get_str_df(n=50)
+        with contextlib.redirect_stdout(io.StringIO()) as expected:
+            for r in df.to_dict('records'):
+                CalculateNycuOscc().main(attributes=r)
+        with contextlib.redirect_stdout(io.StringIO()) as actual:
+            CalculateNycuOsccBatch().main(df=df)
+        self.assertListEqual(sorted(expected.getvalue().splitlines()), sorted(actual.getvalue().splitlines()))
+
+    def test_invalid_cause_of_death(self):
+        df = get_str_df(n=20)
+        df.loc[3, S.EXPIRE_DATE] = '2020-01-01'
+        df.loc[3, S.CAUSE_OF_DEATH] = 'Unknown'
+        with self.assertRaises(AssertionError):
+            CalculateNycuOsccBatch().main(df=df)
+
+    def test_map_unique(self):
+        series = pd.Series(['3/10', '', '3/10'], index=[2, 0, 1])
+        actual = map_unique(series, parse_lymph_node)
+        self.assertListEqual([(3, 10), (0, 0), (3, 10)], actual.tolist())
+        self.assertListEqual([2, 0, 1], actual.index.tolist())
+
+
+class TestProcessTableAttributes(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def reprocess_per_row(self, model: Model) -> pd.DataFrame:
+        new = model.dataframe.copy()
+        for row in range(len(new)):
+            attributes = model.get_sample(row=row)
+            new.loc[row] = ProcessSampleAttributes(self.schema).main(attributes=attributes)
+        return new
+
+    def test_main(self):
+        model = Model(self.schema)
+        model.dataframe = get_imported_df(n=50)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(2):  # the second time reprocesses the casted values
+                expected = self.reprocess_per_row(model)
+                actual = ProcessTableAttributes(self.schema).main(df=model.dataframe)
+                self.assertDataFrameEqual(expected, actual)
+                model.dataframe = actual
+
+    def test_parallel(self):
+        df = get_imported_df(n=50)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = ProcessTableAttributes(self.schema).main(df=df)
+            actual = ProcessInSmallChunks(self.schema).main(df=df, workers=2)
+        self.assertDataFrameEqual(expected, actual)
+
+    def test_parallel_error(self):
+        df = get_str_df(n=50)
+        df.loc[45, S.PATIENT_WEIGHT] = 'heavy'
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    with self.assertRaises(ValueError) as context:
+                        ProcessInSmallChunks(self.schema).main(df=df, workers=workers)
+                self.assertEqual(
+                    'Invalid "Patient Weight (Kg)" of row 46: ValueError("could not convert string to float: \'heavy\'")',
+                    str(context.exception))
+
+    def test_progress(self):
+        reports = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            actual = ProcessInSmallChunks(self.schema).main(
+                df=get_str_df(n=20), progress=Progress(callback=reports.append))
+            expected = ProcessTableAttributes(self.schema).main(df=get_str_df(n=20))
+        self.assertDataFrameEqual(expected, actual)
+        self.assertListEqual([(0, 3), (1, 3), (2, 3), (3, 3)], [(r.done, r.total) for r in reports])
+
+    def test_cancel_between_chunks(self):
+        def cancel_after_first_chunk(report):
+            if report.done == 1:
+                progress.cancel()
+
+        progress = Progress(callback=cancel_after_first_chunk)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(Cancelled):
+                ProcessInSmallChunks(self.schema).main(df=get_str_df(n=20), progress=progress)
+
+    def test_invalid_date(self):
+        df = get_str_df(n=20)
+        df.loc[5, S.LAST_FOLLOW_UP_DATE] = 'not a date'
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(Exception):
+                ProcessTableAttributes(self.schema).main(df=df)
+
+    def test_empty(self):
+        df = pd.DataFrame(columns=S.DISPLAY_COLUMNS)
+        actual = ProcessTableAttributes(self.schema).main(df=df)
+        self.assertListEqual(S.DISPLAY_COLUMNS, list(actual.columns))
+        self.assertEqual(0, len(actual))
+
+
+class ProcessInSmallChunks(ProcessTableAttributes):
+
+    CHUNK_SIZE = 7
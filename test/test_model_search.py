@@ -0,0 +1,152 @@
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from src.model import Model
+from src.model_search import SearchIndex, find_all
+from src.schema import NycuOsccSchema
+from .setup import TestCase, get_str_df
+
+
+def find_by_scanning(df: pd.DataFrame, text: str, start: Optional[Tuple[int, str]]) -> Optional[Tuple[int, str]]:
+    nrows, ncols = df.shape
+    first = 0 if start is None else start[0] * ncols + df.columns.get_loc(start[1]) + 1
+    for i in range(first, nrows * ncols):
+        r, c = divmod(i, ncols)
+        val = df.iat[r, c]
+        if text.lower() in ('' if pd.isna(val) else str(val)).lower():
+            return r, df.columns[c]
+
+
+class TestSearchIndex(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_find(self):
+        df = pd.DataFrame({'A': ['Lin', 'x', None], 'B': ['y', 'lINe', 'Tongue']}, dtype=object)
+        index = SearchIndex()
+        self.assertTupleEqual((0, 0), index.find(dataframe=df, text='lin', start=None))
+        self.assertTupleEqual((1, 1), index.find(dataframe=df, text='lin', start=(0, 0)))
+        self.assertIsNone(index.find(dataframe=df, text='lin', start=(1, 1)))
+        self.assertIsNone(index.find(dataframe=df, text='none', start=None))  # NaN is displayed as ''
+        self.assertTupleEqual((2, 1), index.find(dataframe=df, text='ngu', start=None))
+
+    def test_find_shown_rows(self):
+        df = pd.DataFrame({'A': ['Lin', 'x', 'line'], 'B': ['y', 'lINe', 'Tongue']}, dtype=object)
+        index = SearchIndex()
+        shown = np.array([False, False, True])
+        self.assertTupleEqual((2, 0), index.find(dataframe=df, text='lin', start=None, shown=shown))
+        self.assertIsNone(index.find(dataframe=df, text='lin', start=(2, 0), shown=shown))
+        self.assertTupleEqual((0, 0), index.find(dataframe=df, text='lin', start=None))  # same query, all rows
+
+
+class TestFindAll(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.df = pd.DataFrame({
+            'A': ['Lin', 'x', None, 'line'],
+            'B': ['y', 'lINe', 'Tongue', 12],
+        }, dtype=object)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_text(self):
+        self.assertListEqual([(0, 0), (1, 1), (3, 0)], find_all(dataframe=self.df, text='lin'))
+        self.assertListEqual([(3, 0)], find_all(dataframe=self.df, text='lin', case=True))
+        self.assertListEqual([], find_all(dataframe=self.df, text='none'))  # NaN is displayed as ''
+
+    def test_regex(self):
+        self.assertListEqual([(3, 1)], find_all(dataframe=self.df, text=r'^\d+$', regex=True))
+        self.assertListEqual([(0, 0), (1, 1), (3, 0)], find_all(dataframe=self.df, text='^lin.?$', regex=True))
+        self.assertListEqual([(1, 1)], find_all(dataframe=self.df, text='^lIN.$', regex=True, case=True))
+
+    def test_columns(self):
+        self.assertListEqual([(1, 1)], find_all(dataframe=self.df, text='lin', columns=['B']))
+        self.assertListEqual([], find_all(dataframe=self.df, text='lin', columns=[]))
+
+    def test_same_as_find(self):
+        model = Model(NycuOsccSchema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.append_samples(samples=get_str_df(n=30).to_dict('records'))
+        expected, cell = [], None
+        while True:
+            cell = model.find(text='tongue', start=cell)
+            if cell is None:
+                break
+            expected.append(cell)
+        self.assertListEqual(expected, model.find_all(text='tongue'))
+
+
+class TestModelFind(TestCase):
+
+    QUERIES = ['s0001', 'tongue', '2021', 'ma', '', 'not there', 'new']
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.model = Model(NycuOsccSchema)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.model.append_samples(samples=get_str_df(n=30).to_dict('records'))
+
+    def tearDown(self):
+        self.tear_down()
+
+    def assert_same_as_scanning(self):
+        df = self.model.dataframe
+        for text in self.QUERIES:
+            for start in [None, (0, 'Sex'), (len(df) // 2, df.columns[-1]), (len(df) - 1, df.columns[-1])]:
+                expected = find_by_scanning(df=df, text=text, start=start)
+                self.assertEqual(expected, self.model.find(text=text, start=start), msg=(text, start))
+
+    def test_events(self):
+        self.assert_same_as_scanning()  # builds the index
+
+        self.model.update_cell(row=3, column='Patient Name', value='New Name')
+        self.assert_same_as_scanning()
+
+        self.model.sort_dataframe(by='Sex', ascending=False)
+        self.assert_same_as_scanning()
+
+        self.model.drop(rows=[0, 5, 6])
+        self.assert_same_as_scanning()
+
+        self.model.append_samples(samples=[{'Sample ID': 'NEW'}])
+        self.assert_same_as_scanning()
+
+        for _ in range(3):
+            self.model.undo()
+            self.assert_same_as_scanning()
+
+        self.model.drop(columns=['Patient Name'])
+        self.assert_same_as_scanning()
+
+    def test_filtered(self):
+        self.model.set_filter(query='Sex == Female')
+        shown = set(self.model.get_filtered_rows().tolist())
+        df = self.model.dataframe
+        expected, cell = [], None
+        while True:
+            cell = find_by_scanning(df=df, text='tongue', start=cell)
+            if cell is None:
+                break
+            if cell[0] in shown:
+                expected.append(cell)
+
+        actual, cell = [], None
+        while True:
+            cell = self.model.find(text='tongue', start=cell)
+            if cell is None:
+                break
+            actual.append(cell)
+        self.assertListEqual(expected, actual)
+
+    def test_dataframe_replaced(self):
+        self.assert_same_as_scanning()
+        self.model.dataframe = self.model.dataframe.iloc[::-1].reset_index(drop=True)
+        self.assert_same_as_scanning()
@@ -0,0 +1,41 @@
+import threading
+from src.progress import Progress, Report, Cancelled
+from .setup import TestCase
+
+
+class TestProgress(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_reports(self):
+        reports = []
+        progress = Progress(callback=reports.append)
+        progress.start(stage='Writing mutation data', total=2)
+        progress.update(done=1, bytes_written=3 * 1024 ** 2)
+        progress.update(done=2, bytes_written=6 * 1024 ** 2)
+
+        self.assertListEqual([0, 1, 2], [r.done for r in reports])
+        self.assertIsNone(reports[0].eta)
+        self.assertIsNotNone(reports[1].eta)
+        self.assertIsNone(reports[2].eta)
+        self.assertEqual('Writing mutation data (2/2), 6.0 MB written', str(reports[2]))
+
+    def test_str(self):
+        report = Report(stage='Writing mutation data', done=3, total=13, bytes_written=0, eta=19.6)
+        self.assertEqual('Writing mutation data (3/13), about 20 s left', str(report))
+
+    def test_cancel_from_another_thread(self):
+        progress = Progress()
+        progress.start(stage='Writing', total=1)
+        thread = threading.Thread(target=progress.cancel)
+        thread.start()
+        thread.join()
+        self.assertTrue(progress.is_cancelled())
+        with self.assertRaises(Cancelled):
+            progress.update(done=1)
+        with self.assertRaises(Cancelled):
+            progress.start(stage='Next', total=1)
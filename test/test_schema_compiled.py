@@ -0,0 +1,53 @@
+import pandas as pd
+from src.schema import NycuOsccSchema, VghtcOsccSchema
+from src.schema_compiled import compile_schema, format_date_list
+from .setup import TestCase
+
+
+class TestCompileSchema(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_compiled_once(self):
+        self.assertIs(compile_schema(NycuOsccSchema), compile_schema(NycuOsccSchema))
+        self.assertIsNot(compile_schema(NycuOsccSchema), compile_schema(VghtcOsccSchema))
+
+    def test_same_as_column_attributes(self):
+        for schema in [NycuOsccSchema, VghtcOsccSchema]:
+            compiled = compile_schema(schema)
+            self.assertListEqual(list(schema.COLUMN_ATTRIBUTES.keys()), list(compiled.columns.keys()))
+            for column, attributes in schema.COLUMN_ATTRIBUTES.items():
+                spec = compiled[column]
+                self.assertEqual(attributes['type'], spec.type)
+                self.assertSetEqual({str(o) for o in attributes.get('options', [])}, set(spec.options))
+                self.assertEqual(column in schema.CBIO_PATIENT_LEVEL_COLUMNS, spec.patient_level)
+                self.assertEqual(column in schema.CBIO_DROP_COLUMNS, spec.drop)
+                if column in schema.DISPLAY_COLUMNS:
+                    self.assertEqual(schema.DISPLAY_COLUMNS.index(column), spec.index)
+
+    def test_read_only(self):
+        compiled = compile_schema(NycuOsccSchema)
+        with self.assertRaises(TypeError):
+            compiled.columns['Sample ID'] = None
+        with self.assertRaises(AttributeError):
+            compiled['Sample ID'].type = 'int'
+
+    def test_cast(self):
+        compiled = compile_schema(NycuOsccSchema)
+        self.assertEqual(70.5, compiled['Patient Weight (Kg)'].cast('70.5'))
+        self.assertEqual('2021-07-15', compiled['Birth Date'].cast('2021/7/15'))
+        self.assertIs(True, compiled['Immunotherapy'].cast('true'))
+        self.assertEqual('BOOLEAN', compiled['Immunotherapy'].cbio_datatype)
+
+    def test_column_not_in_schema(self):
+        spec = compile_schema(NycuOsccSchema).get('Study ID')
+        self.assertEqual(('str', 'STRING'), (spec.type, spec.cbio_datatype))
+        with self.assertRaises(KeyError):
+            compile_schema(NycuOsccSchema)['Study ID']
+
+    def test_format_date_list(self):
+        self.assertEqual('2020-01-01 ; 2020-02-01 ; 2020-03-01', format_date_list('2020;2020-02; 2020-03-01;'))